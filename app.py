@@ -2,19 +2,22 @@ from flask import Flask, request, jsonify, session
 from flask_cors import CORS
 from src.config.settings import APP_SECRET_KEY, DEBUG, STRIPE_PUBLISHABLE_KEY
 from src.api.stripe_handler import create_customer, create_payment_method, create_price, create_subscription, create_payment_intent
-from src.utils.bitcoin_converter import get_bitcoin_price, convert_fiat_to_btc, validate_payment_amount, get_conversion_preview
+from src.utils.bitcoin_converter import get_bitcoin_price, convert_fiat_to_btc, validate_payment_amount, get_conversion_preview, get_price_cache_stats, get_bitcoin_prices, convert_fiat_to_btc_batch
 from src.webhooks.stripe_webhook import handle_webhook
 from src.utils.marketing_bot import send_upsell_email, send_dropship_email
 from src.utils.dropship_integration import get_dropship_products, process_dropship_order, get_sales_stats
 from src.utils.fee_bypasser import get_bypass_stats, calculate_optimal_fee
 from src.utils.i18n import init_babel, set_language, get_available_languages, t
-from src.models.database import init_database, Payment, Subscription, DropshipOrder, MarketingCampaign, get_payment_stats, get_subscription_stats, get_dropship_stats, get_marketing_stats
+from src.models.database import init_database, Payment, Subscription, DropshipOrder, MarketingCampaign, get_payment_stats, get_subscription_stats, get_dropship_stats, get_marketing_stats, get_database_stats, get_payments_page, get_customer_summary
+from src.models.routing import replica_safe
 from src.utils.lead_scraper import run_lead_generation, get_lead_statistics
 from src.api.binance_handler import get_bitcoin_price_binance, convert_fiat_to_btc_binance, compare_exchanges
 from src.utils.auth_2fa import setup_2fa, verify_2fa_setup, login_with_2fa, is_2fa_verified, logout_2fa
 from src.utils.proxy_rotator import get_rotated_proxy, make_proxy_request, get_proxy_stats
 from src.utils.ab_testing import get_ab_variant, get_ab_value, track_ab_conversion, get_ab_results
 from src.utils.push_notifications import send_payment_notification, send_upsell_notification, get_push_stats
+from src.utils.price_feed import init_price_feed, get_price_feed_stats
+from src.utils.http_client import get_http_stats
 
 app = Flask(__name__)
 app.secret_key = APP_SECRET_KEY
@@ -28,6 +31,9 @@ init_babel(app)
 # Inicializa banco de dados
 init_database(app)
 
+# Inicia feed de preços em streaming (se habilitado)
+init_price_feed()
+
 # Simula DB (mantido para compatibilidade)
 payments_history = []
 subscriptions = []
@@ -151,16 +157,23 @@ def stripe_webhook():
     return handle_webhook()
 
 @app.route('/api/stats')
+@replica_safe
 def api_stats():
     """API para estatísticas"""
     try:
+        # Preços de todas as moedas do histórico em uma única chamada
+        prices = get_bitcoin_prices({p['currency'] for p in payments_history} | {'brl'})
+        
         # Estatísticas básicas
         basic_stats = {
             'total_converted': sum(p['amount'] for p in payments_history),
-            'btc_received': sum(convert_fiat_to_btc(p['amount'], p['currency']) for p in payments_history),
+            'btc_received': sum(convert_fiat_to_btc_batch(
+                [p['amount'] for p in payments_history],
+                [p['currency'] for p in payments_history]
+            )),
             'active_subs': len([s for s in subscriptions if s.get('status') == 'active']),
             'total_payments': len(payments_history),
-            'btc_price': get_bitcoin_price('brl')
+            'btc_price': prices['brl']
         }
         
         # Estatísticas de bypass de taxas
@@ -173,7 +186,10 @@ def api_stats():
         stats = {
             **basic_stats,
             'fee_bypass': bypass_stats,
-            'dropship': dropship_stats
+            'dropship': dropship_stats,
+            'price_cache': get_price_cache_stats(),
+            'price_feed': get_price_feed_stats(),
+            'http': get_http_stats()
         }
         
         return jsonify(stats)
@@ -371,20 +387,59 @@ def api_compare_exchanges():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/database_stats')
+@replica_safe
 def api_database_stats():
     """API para estatísticas do banco de dados"""
     try:
-        payment_stats = get_payment_stats()
-        subscription_stats = get_subscription_stats()
-        dropship_stats = get_dropship_stats()
-        marketing_stats = get_marketing_stats()
+        # Rollups + uma consulta de marketing; "queries" permite conferir que não cresce
+        stats = get_database_stats()
         
         return jsonify({
             'success': True,
-            'payments': payment_stats,
-            'subscriptions': subscription_stats,
-            'dropship': dropship_stats,
-            'marketing': marketing_stats
+            **stats
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/payments')
+def api_payments():
+    """Histórico de pagamentos paginado por cursor (exige 2FA, como o dashboard)"""
+    if not is_2fa_verified():
+        return jsonify({'error': 'Autenticação 2FA necessária'}), 401
+    
+    try:
+        page = get_payments_page(
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor'),
+            status=request.args.get('status'),
+            currency=request.args.get('currency'),
+            payment_type=request.args.get('type'),
+            customer_email=request.args.get('customer')
+        )
+        
+        return jsonify({
+            'success': True,
+            **page
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/customers/<path:email>')
+def api_customer(email):
+    """Cliente com valor acumulado por moeda e pagamentos recentes (exige 2FA, como o dashboard)"""
+    if not is_2fa_verified():
+        return jsonify({'error': 'Autenticação 2FA necessária'}), 401
+    
+    try:
+        summary = get_customer_summary(email)
+        if summary is None:
+            return jsonify({'error': 'Cliente não encontrado'}), 404
+        
+        return jsonify({
+            'success': True,
+            **summary
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -501,7 +556,10 @@ def dashboard():
     # Dashboard normal - retorna dados para o frontend
     stats = {
         'total_converted': sum(p['amount'] for p in payments_history),
-        'btc_received': sum(convert_fiat_to_btc(p['amount'], p['currency']) for p in payments_history),
+        'btc_received': sum(convert_fiat_to_btc_batch(
+            [p['amount'] for p in payments_history],
+            [p['currency'] for p in payments_history]
+        )),
         'active_subs': len(subscriptions)
     }
     return jsonify({
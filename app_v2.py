@@ -28,12 +28,23 @@ from src.api.binance_handler import get_bitcoin_price_binance, convert_fiat_to_b
 # Utilitários
 from src.utils.bitcoin_converter import (
     get_bitcoin_price, convert_fiat_to_btc, validate_payment_amount, 
-    get_conversion_preview, compare_exchanges
+    get_conversion_preview, compare_exchanges, get_price_cache_stats,
+    get_conversion_preview_batch
 )
 from src.utils.auth_2fa import setup_2fa, verify_2fa_setup, login_with_2fa, is_2fa_verified
 from src.utils.ab_testing import get_ab_variant, track_ab_conversion, get_ab_results
 from src.utils.push_notifications import send_payment_notification, get_push_stats
 from src.utils.analytics import track_event, get_analytics_stats
+from src.utils.price_feed import init_price_feed, get_price_feed_stats
+from src.utils.http_client import get_http_stats
+from src.models.write_behind import get_write_behind_stats
+from src.models.archiver import get_archiver_stats
+from src.models.routing import replica_safe, get_routing_stats
+from src.models.webhook_queue import get_webhook_queue_stats
+from src.models.idempotency import get_idempotency_stats
+from src.models.payouts import get_payout_stats
+from src.utils.price_aggregator import get_aggregated_price, get_aggregator_stats
+from src.utils.price_history import price_history, get_price_change, get_price_summary, get_price_series
 
 # Banco de dados
 from src.models.database import (
@@ -67,10 +78,19 @@ CORS(app, origins=[
 # Inicializar banco de dados
 init_database(app)
 
+# Iniciar feed de preços em streaming (se habilitado)
+init_price_feed()
+
 # Cache para dados temporários
 payments_cache = []
 subscriptions_cache = []
 
+# Limite de valores por preview em lote
+MAX_BATCH_PREVIEW = 1000
+
+# Pontos máximos por série em /api/bitcoin/history
+MAX_HISTORY_POINTS = 1000
+
 # ============================================================================
 # 🏠 ROTAS PRINCIPAIS
 # ============================================================================
@@ -279,19 +299,22 @@ def _create_bitpay_payment(data: Dict[str, Any]) -> Dict[str, Any]:
 def get_bitcoin_price_api():
     """Obter preço atual do Bitcoin"""
     try:
-        # Obter preços de múltiplas fontes
-        coingecko_price = get_bitcoin_price()
-        binance_price = get_bitcoin_price_binance()
+        currency = request.args.get('currency', 'brl')
+        method = request.args.get('method', 'median')
+        
+        # Todas as fontes em paralelo: a latência é a da fonte mais lenta que respondeu
+        quote = get_aggregated_price(currency, method)
         
-        # Comparar exchanges
-        comparison = compare_exchanges()
+        # Comparar exchanges reaproveitando a mesma cotação
+        comparison = compare_exchanges(currency, quote)
         
         return jsonify({
-            'success': True,
+            'success': quote['success'],
+            'price': quote['price'],
             'prices': {
-                'coingecko': coingecko_price,
-                'binance': binance_price
+                source: info.get('price') for source, info in quote['sources'].items()
             },
+            'quote': quote,
             'comparison': comparison,
             'timestamp': datetime.now().isoformat()
         })
@@ -300,6 +323,31 @@ def get_bitcoin_price_api():
         logger.error(f"Erro ao obter preço Bitcoin: {str(e)}")
         return jsonify({'error': 'Erro ao obter preço'}), 500
 
+@app.route('/api/bitcoin/history', methods=['GET'])
+def get_bitcoin_history_api():
+    """Histórico recente do preço BTC (memória, sem chamada externa)"""
+    try:
+        currency = request.args.get('currency', 'brl').lower()
+        minutes = request.args.get('minutes', 60, type=float)
+        points = request.args.get('points', 100, type=int)
+        
+        if minutes <= 0 or not 1 <= points <= MAX_HISTORY_POINTS:
+            return jsonify({'error': f'minutes deve ser positivo e points entre 1 e {MAX_HISTORY_POINTS}'}), 400
+        
+        return jsonify({
+            'success': True,
+            'currency': currency.upper(),
+            'minutes': minutes,
+            'change': get_price_change(currency, minutes),
+            'summary': get_price_summary(currency, minutes),
+            'series': get_price_series(currency, minutes, points),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao obter histórico de preço: {str(e)}")
+        return jsonify({'error': 'Erro ao obter histórico'}), 500
+
 @app.route('/api/convert/preview', methods=['POST'])
 def preview_conversion():
     """Preview de conversão Fiat → Bitcoin"""
@@ -324,6 +372,35 @@ def preview_conversion():
         logger.error(f"Erro no preview: {str(e)}")
         return jsonify({'error': 'Erro no preview'}), 500
 
+@app.route('/api/convert/preview_batch', methods=['POST'])
+def preview_conversion_batch():
+    """Preview de conversão em lote (vários valores em uma chamada)"""
+    try:
+        data = request.json
+        amounts = data.get('amounts')
+        currencies = data.get('currencies', data.get('currency', 'brl'))
+        
+        if not amounts or not isinstance(amounts, list):
+            return jsonify({'error': 'amounts (lista) é obrigatório'}), 400
+        
+        if len(amounts) > MAX_BATCH_PREVIEW:
+            return jsonify({'error': f'Máximo de {MAX_BATCH_PREVIEW} valores por lote'}), 400
+        
+        preview = get_conversion_preview_batch(amounts, currencies)
+        
+        if not preview['success']:
+            return jsonify({'error': preview['error']}), 400
+        
+        return jsonify({
+            'success': True,
+            'preview': preview,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro no preview em lote: {str(e)}")
+        return jsonify({'error': 'Erro no preview em lote'}), 500
+
 # ============================================================================
 # 🔐 APIs DE AUTENTICAÇÃO 2FA
 # ============================================================================
@@ -377,6 +454,7 @@ def verify_2fa_api():
 # ============================================================================
 
 @app.route('/api/analytics/stats', methods=['GET'])
+@replica_safe
 def get_analytics_stats_api():
     """Obter estatísticas gerais"""
     try:
@@ -384,7 +462,18 @@ def get_analytics_stats_api():
             'payments': get_payment_stats(),
             'subscriptions': get_subscription_stats(),
             'analytics': get_analytics_stats(),
-            'push_notifications': get_push_stats()
+            'push_notifications': get_push_stats(),
+            'price_cache': get_price_cache_stats(),
+            'price_feed': get_price_feed_stats(),
+            'price_aggregator': get_aggregator_stats(),
+            'price_history': price_history.get_stats(),
+            'http': get_http_stats(),
+            'persistence': get_write_behind_stats(),
+            'archive': get_archiver_stats(),
+            'read_routing': get_routing_stats(),
+            'webhooks': get_webhook_queue_stats(),
+            'idempotency': get_idempotency_stats(),
+            'payouts': get_payout_stats()
         }
         
         return jsonify({
@@ -510,7 +599,7 @@ def stripe_webhook():
         result = handle_stripe_webhook(payload, sig_header)
         
         if result['success']:
-            return jsonify({'received': True})
+            return jsonify({'received': True, 'duplicate': result.get('duplicate', False)})
         else:
             return jsonify({'error': result['error']}), 400
             
@@ -523,11 +612,12 @@ def bitpay_webhook():
     """Webhook BitPay"""
     try:
         payload = request.get_data()
+        signature = request.headers.get('X-Signature')
         
-        result = handle_bitpay_webhook(payload)
+        result = handle_bitpay_webhook(payload, signature)
         
         if result['success']:
-            return jsonify({'received': True})
+            return jsonify({'received': True, 'duplicate': result.get('duplicate', False)})
         else:
             return jsonify({'error': result['error']}), 400
             
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark - Índices Compostos
+Carrega N pagamentos sintéticos sem os índices compostos, mede as consultas
+de estatística/histórico, aplica as migrações e mede de novo, mostrando o
+plano de execução de cada consulta antes e depois
+
+Uso: python -m benchmarks.bench_indexes --rows 1000000 --db sqlite:////tmp/bench_indexes.db
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import text
+from src.models.database import db, Payment, MarketingCampaign, Subscription, DropshipOrder, run_migrations
+
+STATUSES = ['completed'] * 80 + ['pending'] * 12 + ['failed'] * 6 + ['refunded'] * 2
+CURRENCIES = ['BRL'] * 70 + ['USD'] * 20 + ['EUR'] * 10
+
+# stats_completed cobre ~80% da tabela: o índice não ajuda (e o SQLite pode piorar
+# seguindo-o); no app esse total vem dos rollups, fica aqui como referência
+QUERIES = {
+    'stats_completed': (
+        "SELECT COUNT(*), SUM(amount_cents) FROM payments WHERE status = 'completed'",
+        {}
+    ),
+    'stats_failed': (
+        "SELECT COUNT(*), SUM(amount_cents) FROM payments WHERE status = 'failed'",
+        {}
+    ),
+    'recent_pending': (
+        "SELECT id, amount, created_at FROM payments WHERE status = 'pending' "
+        "ORDER BY created_at DESC LIMIT 50",
+        {}
+    ),
+    'customer_history': (
+        "SELECT id, amount, status, created_at FROM payments WHERE customer_email = :email "
+        "ORDER BY created_at DESC LIMIT 50",
+        {'email': 'cliente1234@exemplo.com'}
+    )
+}
+
+def _create_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+    return app
+
+def _drop_composite_indexes(engine):
+    """Simula banco antigo: tabelas sem os índices compostos nem migrações"""
+    with engine.begin() as connection:
+        for model in (Payment, Subscription, DropshipOrder, MarketingCampaign):
+            for index in model.__table__.indexes:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        connection.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+
+def load_payments(engine, rows, batch_size):
+    """Insere pagamentos em lote (executemany)"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    table = Payment.__table__
+    inserted = 0
+    start = time.perf_counter()
+
+    while inserted < rows:
+        batch = []
+        for i in range(inserted, min(rows, inserted + batch_size)):
+            amount_cents = rng.randint(1000, 1000000)
+            created_at = now - timedelta(seconds=rng.randint(0, 730 * 86400))
+            batch.append({
+                'stripe_payment_id': f"pi_bench_{i}",
+                'customer_email': f"cliente{rng.randint(0, 49999)}@exemplo.com",
+                'customer_name': 'Cliente Benchmark',
+                'amount': amount_cents / 100,
+                'amount_cents': amount_cents,
+                'currency': rng.choice(CURRENCIES),
+                'payment_type': 'unique',
+                'status': rng.choice(STATUSES),
+                'created_at': created_at,
+                'updated_at': created_at
+            })
+        with engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+        inserted += len(batch)
+
+    return time.perf_counter() - start
+
+def explain(connection, sql, params):
+    """Plano de execução (SQLite: EXPLAIN QUERY PLAN, PostgreSQL: EXPLAIN)"""
+    prefix = 'EXPLAIN QUERY PLAN' if connection.dialect.name == 'sqlite' else 'EXPLAIN'
+    rows = connection.execute(text(f"{prefix} {sql}"), params).fetchall()
+    return [str(row[-1]) for row in rows]
+
+def time_query(connection, sql, params, repeat):
+    """Mediana em ms"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(text(sql), params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+def run_queries(engine, repeat):
+    results = {}
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+        for name, (sql, params) in QUERIES.items():
+            results[name] = {
+                'plan': explain(connection, sql, params),
+                'ms': time_query(connection, sql, params, repeat)
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de índices compostos')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', default='sqlite:////tmp/bench_indexes.db')
+    parser.add_argument('--reuse', action='store_true', help='reaproveita os dados já carregados')
+    args = parser.parse_args()
+
+    app = _create_app(args.db)
+    with app.app_context():
+        engine = db.engine
+        if not args.reuse:
+            db.drop_all()
+            db.create_all()
+        _drop_composite_indexes(engine)
+
+        print("🚀 BENCHMARK - ÍNDICES COMPOSTOS")
+        print("=" * 60)
+        if not args.reuse:
+            elapsed = load_payments(engine, args.rows, args.batch)
+            print(f"📥 {args.rows:,} pagamentos carregados em {elapsed:.1f}s ({args.rows / elapsed:,.0f} linhas/s)")
+
+        before = run_queries(engine, args.repeat)
+
+        start = time.perf_counter()
+        run_migrations(engine)
+        print(f"🗂️ Migrações aplicadas em {time.perf_counter() - start:.1f}s")
+
+        after = run_queries(engine, args.repeat)
+
+    for name in QUERIES:
+        print(f"\n📊 {name}: {before[name]['ms']:.2f}ms -> {after[name]['ms']:.2f}ms "
+              f"({before[name]['ms'] / max(after[name]['ms'], 0.001):,.1f}x)")
+        print(f"   antes:  {' | '.join(before[name]['plan'])}")
+        print(f"   depois: {' | '.join(after[name]['plan'])}")
+
+if __name__ == "__main__":
+    main()
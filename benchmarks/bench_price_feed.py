@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark - Livro de Preços vs REST
+Compara a latência de obter o preço BTC por REST (um request por consulta)
+com a leitura do livro em memória alimentado pelo feed em streaming
+
+Uso: python -m benchmarks.bench_price_feed --iterations 2000
+"""
+
+import argparse
+import statistics
+import time
+import requests
+from benchmarks.feed_server import LocalFeedServer
+from src.utils.price_feed import PriceBook, PriceFeed
+
+def _percentiles(samples):
+    """Retorna p50/p95/p99 em microssegundos"""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1e6
+    return {
+        'p50_us': round(pick(0.50), 2),
+        'p95_us': round(pick(0.95), 2),
+        'p99_us': round(pick(0.99), 2),
+        'mean_us': round(statistics.mean(ordered) * 1e6, 2)
+    }
+
+def bench_rest(base_url, iterations):
+    """Um GET /api/v3/ticker/price por consulta (keep-alive)"""
+    session = requests.Session()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = session.get(f"{base_url}/api/v3/ticker/price", params={'symbol': 'BTCBRL'}, timeout=5)
+        float(response.json()['price'])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_book(book, iterations):
+    """Leitura do livro em memória"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        book.get('BTCBRL', max_age=10)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do livro de preços')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = LocalFeedServer(interval=args.interval).start()
+    book = PriceBook()
+    feed = PriceFeed(server.url, book)
+    feed.start()
+
+    # Aguarda o primeiro tick
+    deadline = time.time() + 5
+    while book.get('BTCBRL') is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    print("🚀 BENCHMARK - PREÇO BTC")
+    print("=" * 60)
+    rest = _percentiles(bench_rest(server.rest_url, args.iterations))
+    memory = _percentiles(bench_book(book, args.iterations))
+    print(f"REST (local, keep-alive): {rest}")
+    print(f"Livro em memória:         {memory}")
+    print(f"Speedup p50: {rest['p50_us'] / max(memory['p50_us'], 0.01):,.0f}x")
+
+    snapshot = book.snapshot()
+    print(f"Idade do quote BTCBRL: {snapshot['BTCBRL']['age_seconds']}s "
+          f"({snapshot['BTCBRL']['updates']} updates, {feed.stats['messages']} mensagens)")
+
+    feed.stop(timeout=1)
+    server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark - Concorrência SQLite
+Compara o SQLite padrão (journal DELETE, sem busy_timeout configurado) com
+o perfil de produção (WAL, synchronous=NORMAL, busy_timeout, mmap, cache)
+com escritores fazendo um commit por pagamento e leitores agregando ao mesmo
+tempo, como o app com threaded=True
+
+Uso: python -m benchmarks.bench_sqlite_concurrency --writers 8 --readers 4 --writes 300
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from src.models.database import db, Payment
+from src.models.sqlite_profile import install_sqlite_pragmas, engine_options
+
+def _make_engine(path, profile):
+    url = f"sqlite:///{path}"
+    if profile == 'production':
+        engine = create_engine(url, **engine_options(url))
+        return install_sqlite_pragmas(engine)
+    # Padrão do SQLAlchemy/pysqlite: rollback journal, timeout de 5s do driver
+    return create_engine(url)
+
+def _writer(engine, worker, writes, latencies, errors):
+    for i in range(writes):
+        start = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.add(Payment(
+                    stripe_payment_id=f"pi_{worker}_{i}",
+                    customer_email=f"cliente{worker}@exemplo.com",
+                    customer_name='Cliente Benchmark',
+                    amount=100.0,
+                    currency='BRL',
+                    payment_type='unique',
+                    status='completed'
+                ))
+                session.commit()
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            # "database is locked"
+            errors.append(1)
+
+def _reader(engine, stop, reads, errors):
+    while not stop.is_set():
+        try:
+            with Session(engine) as session:
+                session.query(func.count(Payment.id), func.sum(Payment.amount_cents)).one()
+            reads.append(1)
+        except OperationalError:
+            errors.append(1)
+
+def run_profile(profile, writers, readers, writes):
+    directory = tempfile.mkdtemp(prefix='bench_sqlite_')
+    path = os.path.join(directory, 'bench.db')
+    engine = _make_engine(path, profile)
+    db.metadata.create_all(engine)
+
+    latencies, write_errors, reads, read_errors = [], [], [], []
+    stop = threading.Event()
+    reader_threads = [threading.Thread(target=_reader, args=(engine, stop, reads, read_errors)) for _ in range(readers)]
+    writer_threads = [
+        threading.Thread(target=_writer, args=(engine, w, writes, latencies, write_errors))
+        for w in range(writers)
+    ]
+
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+
+    with engine.connect() as connection:
+        journal = connection.execute(text('PRAGMA journal_mode')).scalar()
+    engine.dispose()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    ordered = sorted(latencies) or [0]
+    return {
+        'journal_mode': journal,
+        'writes_ok': len(latencies),
+        'write_errors': len(write_errors),
+        'writes_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(ordered) * 1000, 2),
+        'p95_ms': round(ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0] * 1000, 2),
+        'reads': len(reads),
+        'read_errors': len(read_errors),
+        'elapsed_s': round(elapsed, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de concorrência SQLite')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=300, help='commits por escritor')
+    args = parser.parse_args()
+
+    print("🚀 BENCHMARK - CONCORRÊNCIA SQLITE")
+    print("=" * 60)
+    print(f"{args.writers} escritores x {args.writes} commits, {args.readers} leitores contínuos")
+    for profile in ('default', 'production'):
+        result = run_profile(profile, args.writers, args.readers, args.writes)
+        print(f"\n📊 {profile}: {result}")
+
+if __name__ == "__main__":
+    main()
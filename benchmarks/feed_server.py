@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+📡 Feed de Preços Local - Stand-in do stream de ticker da Binance
+Serve ticks no formato miniTicker (uma mensagem JSON por linha) e um
+endpoint REST /api/v3/ticker/price para testes e benchmarks
+
+Uso: python -m benchmarks.feed_server --port 8765 --interval 0.1
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_SYMBOLS = {
+    'BTCBRL': 400000.0,
+    'BTCUSD': 80000.0,
+    'BTCUSDT': 80000.0,
+    'BTCEUR': 74000.0
+}
+
+class LocalFeedServer:
+    """Servidor local que simula o ticker com random walk"""
+
+    def __init__(self, symbols=None, interval=0.1, host='127.0.0.1', port=0, volatility=0.0005):
+        self.prices = dict(symbols or DEFAULT_SYMBOLS)
+        self.interval = interval
+        self.volatility = volatility
+        self.lock = threading.Lock()
+        self.running = False
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == '/api/v3/ticker/price':
+                    server._serve_rest(self, parse_qs(parsed.query))
+                else:
+                    server._serve_stream(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """URL do stream NDJSON"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/stream"
+
+    @property
+    def rest_url(self):
+        """URL base do endpoint REST"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Sobe o servidor em background"""
+        self.running = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='feed-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Derruba o servidor"""
+        self.running = False
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def tick(self):
+        """Avança o random walk e retorna mensagens miniTicker"""
+        now_ms = int(time.time() * 1000)
+        messages = []
+        with self.lock:
+            for symbol, price in self.prices.items():
+                price *= 1 + random.gauss(0, self.volatility)
+                self.prices[symbol] = price
+                messages.append({'e': '24hrMiniTicker', 'E': now_ms, 's': symbol, 'c': f"{price:.2f}"})
+        return messages
+
+    def _serve_stream(self, handler):
+        """Envia ticks até o cliente desconectar"""
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/x-ndjson')
+        handler.end_headers()
+        try:
+            while self.running:
+                for message in self.tick():
+                    handler.wfile.write(json.dumps(message).encode() + b'\n')
+                handler.wfile.flush()
+                time.sleep(self.interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _serve_rest(self, handler, query):
+        """Responde como GET /api/v3/ticker/price da Binance"""
+        symbol = query.get('symbol', ['BTCBRL'])[0].upper()
+        with self.lock:
+            price = self.prices.get(symbol)
+
+        if price is None:
+            body, status = {'code': -1121, 'msg': 'Invalid symbol.'}, 400
+        else:
+            body, status = {'symbol': symbol, 'price': f"{price:.2f}"}, 200
+
+        payload = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in local do feed de preços')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval', type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = LocalFeedServer(interval=args.interval, host=args.host, port=args.port).start()
+    print(f"📡 Feed local em {server.url} (REST: {server.rest_url}/api/v3/ticker/price)")
+    print("   Use PRICE_FEED_URL com esta URL e PRICE_FEED_ENABLED=True")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
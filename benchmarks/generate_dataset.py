@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+📦 Gerador de Dados Sintéticos
+Carrega clientes, pagamentos, assinaturas, pedidos dropship, campanhas de
+marketing e contadores A/B em um banco escolhido, com inserts em lote e
+distribuições realistas (moeda, status, valores log-normais, volume
+crescendo ao longo do tempo e concentrado no horário comercial). Mesma
+semente = mesmo dataset, para comparar benchmarks entre versões.
+
+Uso: python -m benchmarks.generate_dataset --db sqlite:////tmp/dataset.db --payments 1000000
+Depois: python -m benchmarks.bench_indexes --db sqlite:////tmp/dataset.db --reuse
+"""
+
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import func
+from src.models.database import (
+    db, Customer, Payment, Subscription, DropshipOrder, MarketingCampaign, SystemStats,
+    rebuild_stats_rollups, run_migrations
+)
+from src.models.sqlite_profile import configure_engines
+from src.utils.money import to_minor, to_sats
+
+CURRENCIES = ['BRL'] * 70 + ['USD'] * 20 + ['EUR'] * 10
+FX_TO_BRL = {'BRL': 1.0, 'USD': 5.0, 'EUR': 5.5}
+PAYMENT_STATUSES = ['completed'] * 82 + ['failed'] * 7 + ['pending'] * 8 + ['refunded'] * 3
+SUBSCRIPTION_STATUSES = ['active'] * 70 + ['canceled'] * 20 + ['past_due'] * 10
+ORDER_STATUSES = ['delivered'] * 60 + ['shipped'] * 20 + ['pending'] * 12 + ['canceled'] * 8
+PLAN_PRICES = [29.90, 49.90, 99.90, 199.90]
+PRODUCTS = [
+    ('fone_bluetooth', 'Fone Bluetooth', 89.90),
+    ('smartwatch', 'Smartwatch', 249.90),
+    ('carregador_turbo', 'Carregador Turbo', 59.90),
+    ('hardware_wallet', 'Hardware Wallet', 599.90),
+    ('mochila_notebook', 'Mochila Notebook', 179.90)
+]
+CAMPAIGNS = [('upsell_premium', 'upsell'), ('follow_up_7d', 'follow_up'), ('dropship_ofertas', 'dropship')]
+EXPERIMENTS = ['homepage_title', 'cta_button', 'pricing_display', 'upsell_message']
+AB_EVENTS = ['view', 'click', 'conversion']
+
+# Peso relativo de cada hora do dia (pico à tarde/noite)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 9, 10, 10, 10, 9, 9, 9, 10, 11, 11, 9, 6, 3]
+
+class DatasetGenerator:
+    """Linhas sintéticas reprodutíveis a partir de uma semente"""
+
+    def __init__(self, seed=42, days=730, customers=50000, now=None):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.days = days
+        self.customers = customers
+        self.now = now or datetime.utcnow().replace(microsecond=0)
+        self.hours = [hour for hour, weight in enumerate(HOUR_WEIGHTS) for _ in range(weight)]
+        self.btc_brl = self._price_walk()
+
+    def _price_walk(self):
+        """Preço diário do BTC em BRL (passeio aleatório com leve alta)"""
+        prices = [150000.0]
+        for _ in range(self.days):
+            prices.append(max(20000.0, prices[-1] * math.exp(self.rng.gauss(0.001, 0.03))))
+        return prices
+
+    def timestamp(self):
+        """Data com volume crescente até hoje e concentrada no horário comercial"""
+        offset = int(self.days * (1 - math.sqrt(self.rng.random())))
+        day = (self.now - timedelta(days=offset)).replace(hour=0, minute=0, second=0)
+        moment = day + timedelta(hours=self.rng.choice(self.hours), seconds=self.rng.randint(0, 3599))
+        return min(moment, self.now)
+
+    def customer(self, first_id):
+        """Cliente recorrente com mais frequência (cauda longa de compradores únicos)"""
+        customer_id = first_id + int(self.customers * self.rng.random() ** 2)
+        return customer_id, f"cliente{customer_id - 1}@exemplo.com", f"Cliente {customer_id - 1}"
+
+    def amount(self, median=150.0, sigma=1.0, low=5.0, high=50000.0):
+        """Valor log-normal arredondado em centavos"""
+        return round(min(max(self.rng.lognormvariate(math.log(median), sigma), low), high), 2)
+
+    def btc_price(self, created_at, currency):
+        day = min(self.days, max(0, (self.now - created_at).days))
+        return round(self.btc_brl[self.days - day] / FX_TO_BRL[currency], 2)
+
+    def customer_rows(self, first_id, count):
+        created_at = self.now - timedelta(days=self.days)
+        for customer_id in range(first_id, first_id + count):
+            yield {
+                'id': customer_id,
+                'email': f"cliente{customer_id - 1}@exemplo.com",
+                'name': f"Cliente {customer_id - 1}",
+                'stripe_customer_id': f"cus_syn{self.seed}_{customer_id}",
+                'created_at': created_at,
+                'updated_at': created_at
+            }
+
+    def payment_rows(self, first_id, customer_first_id, count):
+        for i in range(count):
+            customer_id, email, name = self.customer(customer_first_id)
+            created_at = self.timestamp()
+            currency = self.rng.choice(CURRENCIES)
+            amount = self.amount(median=150.0 / FX_TO_BRL[currency])
+            status = self.rng.choice(PAYMENT_STATUSES)
+            if status == 'pending' and self.now - created_at > timedelta(days=1):
+                # Pendente antigo vira falha (checkout abandonado)
+                status = 'failed'
+            btc_price = self.btc_price(created_at, currency)
+            fee = round(amount * 0.01, 2)
+            btc_amount = round((amount - fee) / btc_price, 8)
+            yield {
+                'id': first_id + i,
+                'stripe_payment_id': f"pi_syn{self.seed}_{first_id + i}",
+                'customer_email': email,
+                'customer_name': name,
+                'customer_ref_id': customer_id,
+                'amount': amount,
+                'amount_cents': to_minor(amount, currency),
+                'currency': currency,
+                'btc_amount': btc_amount,
+                'btc_amount_sats': to_sats(btc_amount),
+                'btc_price': btc_price,
+                'btc_price_cents': to_minor(btc_price, currency),
+                'conversion_fee': fee,
+                'payment_type': 'subscription' if self.rng.random() < 0.25 else 'unique',
+                'status': status,
+                'created_at': created_at,
+                'updated_at': created_at
+            }
+
+    def subscription_rows(self, first_id, customer_first_id, count):
+        for i in range(count):
+            customer_id, email, name = self.customer(customer_first_id)
+            created_at = self.timestamp()
+            amount = self.rng.choice(PLAN_PRICES)
+            months = max(0, (self.now - created_at).days // 30)
+            period_start = created_at + timedelta(days=30 * months)
+            yield {
+                'id': f"sub_syn{self.seed}_{first_id + i}",
+                'customer_id': f"cus_syn{self.seed}_{customer_id}",
+                'customer_ref_id': customer_id,
+                'customer_email': email,
+                'customer_name': name,
+                'amount': amount,
+                'amount_cents': to_minor(amount),
+                'currency': 'BRL',
+                'status': self.rng.choice(SUBSCRIPTION_STATUSES),
+                'current_period_start': period_start,
+                'current_period_end': period_start + timedelta(days=30),
+                'created_at': created_at,
+                'updated_at': period_start
+            }
+
+    def order_rows(self, first_id, customer_first_id, count):
+        for i in range(count):
+            customer_id, email, name = self.customer(customer_first_id)
+            created_at = self.timestamp()
+            product_id, product_name, list_price = self.rng.choice(PRODUCTS)
+            price = round(list_price * self.rng.uniform(0.9, 1.1), 2)
+            profit = round(price * self.rng.uniform(0.15, 0.45), 2)
+            btc_amount = round(price / self.btc_price(created_at, 'BRL'), 8)
+            yield {
+                'id': first_id + i,
+                'order_id': f"ord_syn{self.seed}_{first_id + i}",
+                'customer_ref_id': customer_id,
+                'customer_email': email,
+                'customer_name': name,
+                'product_name': product_name,
+                'product_id': product_id,
+                'price': price,
+                'price_cents': to_minor(price),
+                'profit': profit,
+                'profit_cents': to_minor(profit),
+                'btc_amount': btc_amount,
+                'btc_amount_sats': to_sats(btc_amount),
+                'status': self.rng.choice(ORDER_STATUSES),
+                'created_at': created_at,
+                'updated_at': created_at
+            }
+
+    def campaign_rows(self, first_id, customer_first_id, count):
+        for i in range(count):
+            customer_id, email, name = self.customer(customer_first_id)
+            sent_at = self.timestamp()
+            campaign_name, campaign_type = self.rng.choice(CAMPAIGNS)
+            # Funil: 35% abrem, 25% dos que abrem clicam, 20% dos que clicam convertem
+            opened_at = sent_at + timedelta(minutes=self.rng.randint(1, 2880)) if self.rng.random() < 0.35 else None
+            clicked_at = opened_at + timedelta(minutes=self.rng.randint(0, 30)) if opened_at and self.rng.random() < 0.25 else None
+            converted_at = clicked_at + timedelta(minutes=self.rng.randint(1, 120)) if clicked_at and self.rng.random() < 0.20 else None
+            amount = self.amount(median=99.0, sigma=0.6) if converted_at else None
+            yield {
+                'id': first_id + i,
+                'campaign_name': campaign_name,
+                'campaign_type': campaign_type,
+                'customer_ref_id': customer_id,
+                'target_email': email,
+                'target_name': name,
+                'amount': amount,
+                'amount_cents': to_minor(amount) if amount else None,
+                'status': 'converted' if converted_at else 'sent',
+                'sent_at': sent_at,
+                'opened_at': opened_at,
+                'clicked_at': clicked_at,
+                'converted_at': converted_at
+            }
+
+    def stats_rows(self, first_id, count):
+        """Contadores A/B no formato do ab_testing (experimentos sintéticos além dos reais)"""
+        names = (
+            (f"{experiment}_syn{first_id}_{n}", variant, event)
+            for n in range(max(1, math.ceil(count / (len(EXPERIMENTS) * 3 * len(AB_EVENTS)))))
+            for experiment in EXPERIMENTS
+            for variant in 'ABC'
+            for event in AB_EVENTS
+        )
+        now = time.time()
+        for i, (experiment, variant, event_type) in zip(range(count), names):
+            views = self.rng.randint(1000, 100000)
+            value = views * {'view': 1.0, 'click': self.rng.uniform(0.05, 0.2), 'conversion': self.rng.uniform(0.01, 0.05)}[event_type]
+            yield {
+                'id': first_id + i,
+                'stat_name': f"ab_test_{experiment}_{variant}_{event_type}",
+                'stat_value': round(value),
+                'stat_data': {
+                    'experiment': experiment,
+                    'variant': variant,
+                    'event_type': event_type,
+                    'total_value': round(value * 99.0, 2) if event_type == 'conversion' else 0,
+                    'first_conversion': now - self.days * 86400,
+                    'last_conversion': now
+                },
+                'updated_at': self.now
+            }
+
+def _next_id(session, model):
+    return (session.query(func.max(model.id)).scalar() or 0) + 1
+
+def bulk_insert(engine, model, rows, batch_size):
+    """Insere em lotes (executemany), uma transação por lote"""
+    table = model.__table__
+    inserted = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with engine.begin() as connection:
+                connection.execute(table.insert(), batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        with engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+        inserted += len(batch)
+    return inserted
+
+def generate(engine, session, generator, counts, batch_size):
+    """Carrega todas as tabelas e devolve {tabela: (linhas, segundos)}"""
+    customer_first_id = _next_id(session, Customer)
+    plan = [
+        (Customer, lambda first: generator.customer_rows(first, counts['customers'])),
+        (Payment, lambda first: generator.payment_rows(first, customer_first_id, counts['payments'])),
+        (Subscription, lambda first: generator.subscription_rows(first, customer_first_id, counts['subscriptions'])),
+        (DropshipOrder, lambda first: generator.order_rows(first, customer_first_id, counts['orders'])),
+        (MarketingCampaign, lambda first: generator.campaign_rows(first, customer_first_id, counts['campaigns'])),
+        (SystemStats, lambda first: generator.stats_rows(first, counts['stats']))
+    ]
+
+    results = {}
+    for model, rows in plan:
+        # Subscription usa o id do Stripe como chave; o contador só entra no nome
+        first_id = session.query(func.count()).select_from(model).scalar() + 1 if model is Subscription else _next_id(session, model)
+        start = time.perf_counter()
+        inserted = bulk_insert(engine, model, rows(first_id), batch_size)
+        elapsed = time.perf_counter() - start
+        results[model.__tablename__] = (inserted, elapsed)
+        print(f"📥 {model.__tablename__}: {inserted:,} linhas em {elapsed:.1f}s ({inserted / max(elapsed, 0.001):,.0f} linhas/s)")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Gerador de dados sintéticos')
+    parser.add_argument('--db', default='sqlite:////tmp/dataset.db')
+    parser.add_argument('--payments', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=None, help='padrão: pagamentos / 20')
+    parser.add_argument('--subscriptions', type=int, default=None, help='padrão: pagamentos / 10')
+    parser.add_argument('--orders', type=int, default=None, help='padrão: pagamentos / 20')
+    parser.add_argument('--campaigns', type=int, default=None, help='padrão: pagamentos / 2')
+    parser.add_argument('--stats', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch', type=int, default=20000)
+    parser.add_argument('--reset', action='store_true', help='apaga as tabelas antes de carregar')
+    args = parser.parse_args()
+
+    counts = {
+        'payments': args.payments,
+        'customers': args.customers if args.customers is not None else max(1, args.payments // 20),
+        'subscriptions': args.subscriptions if args.subscriptions is not None else args.payments // 10,
+        'orders': args.orders if args.orders is not None else args.payments // 20,
+        'campaigns': args.campaigns if args.campaigns is not None else args.payments // 2,
+        'stats': args.stats
+    }
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.db
+    db.init_app(app)
+
+    with app.app_context():
+        configure_engines(db.engine)
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        run_migrations(db.engine)
+
+        print("🚀 GERADOR DE DADOS SINTÉTICOS")
+        print("=" * 60)
+        generator = DatasetGenerator(seed=args.seed, days=args.days, customers=counts['customers'])
+        start = time.perf_counter()
+        results = generate(db.engine, db.session, generator, counts, args.batch)
+        db.session.remove()
+
+        # Inserts em lote não passam pelos eventos: recalcula os rollups
+        rollups = rebuild_stats_rollups()
+        total = sum(rows for rows, _ in results.values())
+        print(f"📊 Rollups recalculados: {rollups['payments.completed.count']:,} pagamentos concluídos")
+        print(f"✅ {total:,} linhas em {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+🧪 Provedores Locais - Stand-ins da API BitPay e do CoinGecko
+Responde POST /invoices, GET /invoices/<id>, POST/GET /payouts e
+GET /simple/price com latência e taxa de erro configuráveis, contando as
+chamadas por endpoint, para testes de carga sem tocar nos provedores reais
+
+Uso: python -m benchmarks.provider_standins --port 8766 --latency 0.05 --jitter 0.02
+     BITPAY_API_URL=http://127.0.0.1:8766 COINGECKO_API_URL=http://127.0.0.1:8766 python app_v2.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_PRICES = {
+    'brl': 400000.0,
+    'usd': 80000.0,
+    'eur': 74000.0
+}
+
+class LocalProviderServer:
+    """Servidor local que imita as rotas BitPay/CoinGecko usadas pelo app"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, prices=None, host='127.0.0.1', port=0,
+                 payout_stall=0.0, drop_payout_responses=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payout_stall = payout_stall  # aceita o payout e só responde depois (timeout do cliente)
+        self.drop_payout_responses = drop_payout_responses  # aceita os N primeiros e fecha sem responder
+        self.prices = dict(prices or DEFAULT_PRICES)
+        self.invoices = {}
+        self.payouts = []
+        self.lock = threading.Lock()
+        self.calls = {}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como o pool do http_client
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self, 'GET')
+
+            def do_POST(self):
+                server._handle(self, 'POST')
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """URL base (serve como BITPAY_API_URL e COINGECKO_API_URL)"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Sobe o servidor em background"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='provider-standins', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Derruba o servidor"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_stats(self):
+        """Chamadas por rota"""
+        with self.lock:
+            return dict(self.calls)
+
+    def _handle(self, handler, method):
+        parsed = urlparse(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length) or b'{}') if length else {}
+
+        if parsed.path == '/simple/price':
+            route = 'GET /simple/price'
+        elif parsed.path.startswith('/invoices/') and method == 'GET':
+            route = 'GET /invoices/<id>'
+        else:
+            route = f"{method} {parsed.path}"
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < self.error_rate:
+            status, payload = 503, {'error': 'Serviço indisponível (stand-in)'}
+        elif route == 'GET /simple/price':
+            status, payload = self._price(parse_qs(parsed.query))
+        elif route == 'POST /invoices':
+            status, payload = self._create_invoice(body)
+        elif route == 'GET /invoices/<id>':
+            status, payload = self._get_invoice(parsed.path.rsplit('/', 1)[-1])
+        elif route == 'POST /payouts':
+            status, payload = self._create_payout(body)
+            with self.lock:
+                drop = self.drop_payout_responses > 0
+                self.drop_payout_responses -= drop
+            if drop:
+                # Payout gravado, resposta perdida: cliente vê a conexão cair
+                handler.close_connection = True
+                return
+        elif route == 'GET /payouts':
+            reference = parse_qs(parsed.query).get('reference', [None])[0]
+            with self.lock:
+                payload = {'data': [p for p in self.payouts if reference is None or p['reference'] == reference]}
+            status = 200
+        else:
+            status, payload = 404, {'error': f"Rota não simulada: {route}"}
+
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _price(self, query):
+        """Formato do CoinGecko: {"bitcoin": {"brl": 400000.0, ...}}"""
+        currencies = query.get('vs_currencies', ['brl'])[0].lower().split(',')
+        return 200, {'bitcoin': {c: self.prices[c] for c in currencies if c in self.prices}}
+
+    def _create_invoice(self, body):
+        invoice = {
+            'id': f"inv_{uuid.uuid4().hex[:16]}",
+            'url': 'http://127.0.0.1/invoice',
+            'status': 'new',
+            'price': body.get('price'),
+            'currency': body.get('currency')
+        }
+        with self.lock:
+            self.invoices[invoice['id']] = invoice
+        return 200, {'data': invoice}
+
+    def _create_payout(self, body):
+        payout = {
+            'id': f"payout_{uuid.uuid4().hex[:16]}",
+            'status': 'new',
+            'amount': body.get('amount'),
+            'address': body.get('address'),
+            'reference': body.get('reference')
+        }
+        with self.lock:
+            self.payouts.append(payout)
+        if self.payout_stall:
+            time.sleep(self.payout_stall)
+        return 200, {'data': payout}
+
+    def _get_invoice(self, invoice_id):
+        with self.lock:
+            invoice = self.invoices.get(invoice_id)
+        if invoice is None:
+            return 404, {'error': 'Invoice não encontrada'}
+        return 200, {'data': {**invoice, 'status': 'paid'}}
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-ins locais da BitPay e do CoinGecko')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.05, help='latência fixa por chamada (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latência extra aleatória até N segundos')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fração de respostas 503')
+    parser.add_argument('--payout-stall', type=float, default=0.0, help='aceita o payout e atrasa a resposta (s)')
+    parser.add_argument('--drop-payout-responses', type=int, default=0, help='aceita os N primeiros payouts sem responder')
+    args = parser.parse_args()
+
+    server = LocalProviderServer(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, host=args.host, port=args.port,
+        payout_stall=args.payout_stall, drop_payout_responses=args.drop_payout_responses
+    ).start()
+    print(f"🧪 Provedores locais em {server.url}")
+    print("   Use BITPAY_API_URL e COINGECKO_API_URL com esta URL (e uma BITPAY_PRIVATE_KEY_HEX de teste)")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"📊 Chamadas: {server.get_stats()}")
+        server.stop()
+
+if __name__ == "__main__":
+    main()
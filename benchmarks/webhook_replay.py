@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+🔁 Replay de Webhooks - Teste de Carga
+Assina eventos Stripe/BitPay (gravados em JSONL ou sintéticos) com um
+segredo de teste e reenvia a uma taxa alvo contra o app em processo (test
+client do Flask, banco temporário, provedores locais) ou por HTTP.
+Reporta latência p50/p95/p99, erros e o tratamento de reenvios (mesmo id)
+
+Uso: python -m benchmarks.webhook_replay --events 2000 --rate 200 --duplicate-rate 0.1
+     python -m benchmarks.webhook_replay --input eventos.jsonl --target http://127.0.0.1:5000 \\
+         --stripe-secret whsec_teste --bitpay-secret bp_teste
+
+Arquivo JSONL: um evento por linha, cru (Stripe tem "object": "event") ou
+{"provider": "stripe"|"bitpay", "event": {...}}
+"""
+
+import argparse
+import contextlib
+import hashlib
+import hmac
+import importlib
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.provider_standins import LocalProviderServer
+
+WEBHOOK_PATHS = {
+    'stripe': '/webhook/stripe',
+    'bitpay': '/webhook/bitpay'
+}
+
+def sign_stripe_payload(payload, secret, timestamp=None):
+    """Cabeçalho Stripe-Signature (t=...,v1=HMAC-SHA256 de "t.corpo")"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode('utf-8') + payload
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def sign_bitpay_payload(payload, secret):
+    """Mesmo HMAC que o endpoint confere em X-Signature"""
+    from src.webhooks.bitpay_webhook import sign_bitpay_payload as sign
+    return sign(payload, secret)
+
+def event_key(provider, event):
+    """Chave de idempotência usada pelo endpoint para o evento"""
+    if provider == 'stripe':
+        return event['id']
+    invoice_id = event.get('data', {}).get('id')
+    return event.get('id') or f"{invoice_id}:{event.get('type')}"
+
+def build_request(provider, event, stripe_secret=None, bitpay_secret=None):
+    """Caminho, corpo e cabeçalhos assinados (assinatura na hora do envio)"""
+    body = json.dumps(event).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if provider == 'stripe' and stripe_secret:
+        headers['Stripe-Signature'] = sign_stripe_payload(body, stripe_secret)
+    elif provider == 'bitpay' and bitpay_secret:
+        headers['X-Signature'] = sign_bitpay_payload(body, bitpay_secret)
+    return WEBHOOK_PATHS[provider], body, headers
+
+# ============================================================================
+# 📦 EVENTOS
+# ============================================================================
+
+def load_events(path):
+    """Eventos gravados: lista de (provedor, evento)"""
+    events = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'provider' in record and 'event' in record:
+                events.append((record['provider'], record['event']))
+            else:
+                events.append(('stripe' if record.get('object') == 'event' else 'bitpay', record))
+    return events
+
+def _stripe_event(rng):
+    kind = rng.random()
+    customer = f"cus_{rng.randrange(10 ** 6):06d}"
+    amount = rng.randrange(1000, 50000)
+    if kind < 0.6:
+        event_type = 'payment_intent.succeeded'
+        obj = {'id': f"pi_{uuid.uuid4().hex[:24]}", 'object': 'payment_intent', 'amount': amount,
+               'currency': 'brl', 'customer': customer, 'status': 'succeeded'}
+    elif kind < 0.9:
+        event_type = 'invoice.paid'
+        obj = {'id': f"in_{uuid.uuid4().hex[:24]}", 'object': 'invoice', 'amount_paid': amount,
+               'currency': 'brl', 'customer': customer}
+    else:
+        event_type = 'customer.subscription.created'
+        obj = {'id': f"sub_{uuid.uuid4().hex[:24]}", 'object': 'subscription', 'customer': customer,
+               'status': 'active'}
+    return {
+        'id': f"evt_{uuid.uuid4().hex[:24]}",
+        'object': 'event',
+        'api_version': '2023-10-16',
+        'created': int(time.time()),
+        'type': event_type,
+        'data': {'object': obj}
+    }
+
+def _bitpay_events(rng):
+    """Ciclo de uma invoice: paga e depois confirmada (ou falha)"""
+    invoice = {
+        'id': f"bp_{uuid.uuid4().hex[:20]}",
+        'price': round(rng.uniform(10, 500), 2),
+        'currency': 'BRL',
+        'btcPaid': None
+    }
+    paid = {**invoice, 'btcPaid': round(invoice['price'] / 400000, 8)}
+    final = 'invoice_failedToConfirm' if rng.random() < 0.1 else 'invoice_confirmed'
+    return [
+        {'id': f"bpevt_{uuid.uuid4().hex[:20]}", 'type': 'invoice_paidInFull', 'data': paid},
+        {'id': f"bpevt_{uuid.uuid4().hex[:20]}", 'type': final,
+         'data': {**paid, 'exceptionStatus': 'paidPartial' if final == 'invoice_failedToConfirm' else False}}
+    ]
+
+def synthetic_events(count, duplicate_rate=0.1, bitpay_ratio=0.3, seed=42):
+    """Eventos sintéticos com reenvios próximos do original (como os provedores fazem)"""
+    rng = random.Random(seed)
+    events = []
+    while len(events) < count:
+        if events and rng.random() < duplicate_rate:
+            events.append(rng.choice(events[-50:]))
+        elif rng.random() < bitpay_ratio:
+            events.extend(('bitpay', event) for event in _bitpay_events(rng))
+        else:
+            events.append(('stripe', _stripe_event(rng)))
+    return events[:count]
+
+# ============================================================================
+# 🎯 ALVOS
+# ============================================================================
+
+class InProcessTarget:
+    """Envia pelo test client do Flask (um client por thread)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def post(self, path, body, headers):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.post(path, data=body, headers=headers)
+        return response.status_code, response.get_json(silent=True) or {}
+
+class HttpTarget:
+    """Envia por HTTP para um servidor em execução (keep-alive por thread)"""
+
+    def __init__(self, base_url, timeout=30):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def post(self, path, body, headers):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        try:
+            response = session.post(self.base_url + path, data=body, headers=headers, timeout=self.timeout)
+        except self.requests.RequestException:
+            return 0, {}
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {}
+
+# ============================================================================
+# 🚀 REPLAY
+# ============================================================================
+
+def percentile(ordered, p):
+    """Percentil por posição (lista já ordenada)"""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+def replay(events, target, rate=0, concurrency=16, stripe_secret=None, bitpay_secret=None):
+    """Envia os eventos em malha aberta a `rate`/s (0: o mais rápido possível)
+
+    A latência é medida do envio à resposta; o atraso entre o horário
+    agendado e o envio é reportado à parte (fila do lado do gerador).
+    """
+    results = [None] * len(events)
+
+    def send(index, provider, event, scheduled):
+        path, body, headers = build_request(provider, event, stripe_secret, bitpay_secret)
+        started = time.perf_counter()
+        status, data = target.post(path, body, headers)
+        results[index] = {
+            'provider': provider,
+            'key': event_key(provider, event),
+            'status': status,
+            'duplicate': bool(data.get('duplicate')),
+            'latency': time.perf_counter() - started,
+            'send_lag': started - scheduled
+        }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, (provider, event) in enumerate(events):
+            scheduled = start + index / rate if rate else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, index, provider, event, scheduled)
+    return results, time.perf_counter() - start
+
+def summarize(results, elapsed):
+    """Latência, erros e reenvios (por provedor e no total)"""
+    def latency_report(rows):
+        ordered = sorted(row['latency'] for row in rows)
+        return {
+            'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+            'max_ms': round((ordered[-1] if ordered else 0) * 1000, 2)
+        }
+
+    by_status, occurrences, accepted = {}, {}, {}
+    errors = 0
+    for row in results:
+        by_status[row['status']] = by_status.get(row['status'], 0) + 1
+        occurrences[row['key']] = occurrences.get(row['key'], 0) + 1
+        if not 200 <= row['status'] < 300:
+            errors += 1
+        elif not row['duplicate']:
+            accepted[row['key']] = accepted.get(row['key'], 0) + 1
+
+    send_lags = sorted(row['send_lag'] for row in results)
+    return {
+        'sent': len(results),
+        'elapsed_s': round(elapsed, 2),
+        'achieved_rate': round(len(results) / elapsed, 1) if elapsed else 0,
+        'errors': errors,
+        'error_rate': round(errors / len(results) * 100, 2) if results else 0,
+        'by_status': by_status,
+        'latency': latency_report(results),
+        'latency_by_provider': {
+            provider: latency_report([row for row in results if row['provider'] == provider])
+            for provider in sorted({row['provider'] for row in results})
+        },
+        'send_lag_p99_ms': round(percentile(send_lags, 99) * 1000, 2),
+        'duplicates': {
+            'unique_events': len(occurrences),
+            'resends': sum(count - 1 for count in occurrences.values()),
+            'acknowledged_as_duplicate': sum(1 for row in results if row['duplicate']),
+            # Deve ser 0: o mesmo evento aceito para processamento mais de uma vez
+            'accepted_more_than_once': sum(1 for count in accepted.values() if count > 1)
+        }
+    }
+
+# ============================================================================
+# 🧪 MODO EM PROCESSO
+# ============================================================================
+
+def configure_environment(args, directory, provider_url):
+    """Variáveis lidas pelo settings na importação do app (antes do import)"""
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'replay.db')}",
+        'STRIPE_WEBHOOK_SECRET': args.stripe_secret,
+        'BITPAY_WEBHOOK_SECRET': args.bitpay_secret,
+        'BITPAY_API_URL': provider_url,
+        'COINGECKO_API_URL': provider_url,
+        'BITPAY_API_TOKEN': 'standin_token',
+        # Chave de teste aleatória: liga o caminho HTTP real do bitpay_handler
+        'BITPAY_PRIVATE_KEY_HEX': os.urandom(32).hex(),
+        'BITPAY_PUBLIC_KEY_HEX': 'standin_public_key',
+        'WEBHOOK_ASYNC': 'False' if args.sync else 'True',
+        'WEBHOOK_WORKERS': str(args.workers),
+        # DEBUG mantém o marketing no envio simulado (sem SMTP de verdade)
+        'DEBUG': 'True'
+    })
+
+def seed_invoices(app, events):
+    """Pagamentos pendentes das invoices BitPay, para os eventos terem o que atualizar"""
+    from src.models.database import db, Payment
+    invoices = {}
+    for provider, event in events:
+        if provider == 'bitpay':
+            invoices.setdefault(event['data']['id'], event['data'])
+    with app.app_context():
+        db.session.add_all([
+            Payment(
+                stripe_payment_id=f"bitpay_{invoice_id}",
+                customer_email=f"{invoice_id}@replay.local",
+                customer_name='Cliente Replay',
+                amount=data.get('price') or 0,
+                currency=(data.get('currency') or 'brl').lower(),
+                btc_amount=data.get('btcPaid'),
+                payment_type='bitcoin',
+                status='pending',
+                bitpay_invoice_id=invoice_id
+            )
+            for invoice_id, data in invoices.items()
+        ])
+        db.session.commit()
+    return len(invoices)
+
+def wait_for_queue(timeout):
+    """Espera os workers esvaziarem a fila; devolve o tempo até lá"""
+    from src.models.webhook_queue import webhook_workers
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        depth = webhook_workers.get_depth()
+        if depth['pending'] + depth['processing'] == 0:
+            break
+        time.sleep(0.1)
+    return time.perf_counter() - start
+
+def processing_report(app):
+    """Métricas do lado do app após o replay (fila, idempotência, lotes, status)"""
+    from sqlalchemy import func
+    from src.models.database import db, Payment, WebhookEvent
+    from src.models.webhook_queue import get_webhook_queue_stats
+    from src.models.idempotency import get_idempotency_stats
+    from src.models.write_behind import get_write_behind_stats
+
+    with app.app_context():
+        queued_twice = db.session.query(WebhookEvent.provider, WebhookEvent.event_id).group_by(
+            WebhookEvent.provider, WebhookEvent.event_id
+        ).having(func.count() > 1).count()
+        bitpay_status = dict(db.session.query(Payment.status, func.count()).filter(
+            Payment.bitpay_invoice_id.isnot(None)
+        ).group_by(Payment.status).all())
+
+    queue = get_webhook_queue_stats()
+    idempotency = get_idempotency_stats()
+    return {
+        'queue': {key: queue.get(key) for key in ('enqueued', 'processed', 'retried', 'dead_lettered', 'avg_processing_ms', 'depth')},
+        'queued_more_than_once': queued_twice,
+        'idempotency': {key: idempotency[key] for key in ('duplicates_rejected', 'lru_hit_rate', 'hit_rate')},
+        'invoice_status_batches': get_write_behind_stats()['invoice_status'],
+        'bitpay_payments_by_status': bitpay_status
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay/teste de carga dos webhooks Stripe e BitPay')
+    parser.add_argument('--target', default='inprocess', help="'inprocess' ou URL base do servidor")
+    parser.add_argument('--app', default='app_v2', help='módulo do app no modo em processo (app_v2 ou app)')
+    parser.add_argument('--input', help='eventos gravados (JSONL); sem isso gera eventos sintéticos')
+    parser.add_argument('--events', type=int, default=1000, help='quantidade de eventos sintéticos')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help='fração de reenvios sintéticos')
+    parser.add_argument('--bitpay-ratio', type=float, default=0.3, help='fração de ciclos BitPay sintéticos')
+    parser.add_argument('--rate', type=float, default=200, help='eventos por segundo (0 = sem limite)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--stripe-secret', default='whsec_replay_test')
+    parser.add_argument('--bitpay-secret', default='bitpay_replay_test')
+    parser.add_argument('--sync', action='store_true', help='processa inline (WEBHOOK_ASYNC=False)')
+    parser.add_argument('--workers', type=int, default=4, help='workers da fila no modo em processo')
+    parser.add_argument('--provider-latency', type=float, default=0.05, help='latência dos provedores locais (s)')
+    parser.add_argument('--provider-jitter', type=float, default=0.02)
+    parser.add_argument('--provider-error-rate', type=float, default=0.0)
+    parser.add_argument('--drain-timeout', type=float, default=120)
+    parser.add_argument('--verbose', action='store_true', help='mantém prints/logs do app')
+    args = parser.parse_args()
+
+    events = load_events(args.input) if args.input else synthetic_events(
+        args.events, args.duplicate_rate, args.bitpay_ratio
+    )
+
+    print("🔁 REPLAY DE WEBHOOKS")
+    print("=" * 60)
+    print(f"{len(events)} eventos, alvo {args.target}, {args.rate or 'sem limite'}/s, {args.concurrency} conexões")
+
+    if args.target != 'inprocess':
+        results, elapsed = replay(events, HttpTarget(args.target), args.rate, args.concurrency,
+                                  args.stripe_secret, args.bitpay_secret)
+        print(f"\n📊 {json.dumps(summarize(results, elapsed), indent=2)}")
+        return
+
+    directory = tempfile.mkdtemp(prefix='webhook_replay_')
+    providers = LocalProviderServer(
+        latency=args.provider_latency, jitter=args.provider_jitter, error_rate=args.provider_error_rate
+    ).start()
+    configure_environment(args, directory, providers.url)
+
+    quiet = contextlib.ExitStack()
+    if not args.verbose:
+        quiet.enter_context(contextlib.redirect_stdout(open(os.devnull, 'w')))
+        logging.disable(logging.WARNING)
+    try:
+        with quiet:
+            app = importlib.import_module(args.app).app
+            seeded = seed_invoices(app, events)
+            results, elapsed = replay(events, InProcessTarget(app), args.rate, args.concurrency,
+                                      args.stripe_secret, args.bitpay_secret)
+            drain = 0 if args.sync else wait_for_queue(args.drain_timeout)
+            report = processing_report(app)
+        logging.disable(logging.NOTSET)
+
+        print(f"\n📊 Endpoint: {json.dumps(summarize(results, elapsed), indent=2)}")
+        print(f"\n⚙️ Processamento ({seeded} invoices semeadas, fila drenada em {drain:.2f}s): "
+              f"{json.dumps(report, indent=2, default=str)}")
+        print(f"\n🧪 Chamadas aos provedores locais: {providers.get_stats()}")
+    finally:
+        from src.models.webhook_queue import webhook_workers
+        from src.models.write_behind import stop_write_behind
+        webhook_workers.stop()
+        stop_write_behind()
+        providers.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,17 @@ Integração Binance API - Conversão BTC com Taxas Menores
 Sistema hacker para reduzir custos de conversão
 """
 
-import requests
 import hmac
 import hashlib
 import time
 import json
 from urllib.parse import urlencode
 from src.config.settings import DEBUG
+from src.utils.http_client import http_client
+from src.utils.price_cache import PriceCache
+from src.utils.shared_price_store import get_shared_price_store
+from src.utils.price_feed import get_book_price
+from src.utils.money import to_minor, to_sats, from_sats, fee_to_bps, apply_fee, fiat_to_sats
 
 class BinanceHandler:
     """Handler para integração com Binance API"""
@@ -25,11 +29,17 @@ class BinanceHandler:
         # Taxas Binance (menores que BitPay)
         self.trading_fee = 0.001  # 0.1% por trade
         self.withdrawal_fee = 0.0005  # 0.0005 BTC por saque
+        self.trading_fee_bps = fee_to_bps(self.trading_fee)
+        self.withdrawal_fee_sats = to_sats(self.withdrawal_fee)
         
-        # Cache de preços
-        self.price_cache = {}
-        self.cache_timestamp = 0
+        # Cache de preços por moeda (compartilhado entre workers se configurado)
         self.cache_duration = 60  # 1 minuto
+        self.price_cache = PriceCache(
+            self._fetch_prices,
+            ttl=self.cache_duration,
+            name='binance',
+            store=get_shared_price_store()
+        )
     
     def load_credentials(self):
         """Carrega credenciais do .env"""
@@ -91,9 +101,9 @@ class BinanceHandler:
             
             # Faz requisição
             if method == 'GET':
-                response = requests.get(url, params=params, headers=headers, timeout=10)
+                response = http_client.get(url, params=params, headers=headers)
             else:
-                response = requests.post(url, data=params, headers=headers, timeout=10)
+                response = http_client.post(url, data=params, headers=headers)
             
             response.raise_for_status()
             return response.json()
@@ -112,30 +122,33 @@ class BinanceHandler:
         else:
             return {'success': True, 'data': 'simulated'}
     
-    def get_bitcoin_price(self, currency='BRL'):
-        """Obtém preço atual do Bitcoin"""
-        try:
-            # Verifica cache
-            cache_key = f"btc_{currency.lower()}"
-            if (time.time() - self.cache_timestamp) < self.cache_duration:
-                if cache_key in self.price_cache:
-                    return self.price_cache[cache_key]
-            
-            # Faz requisição
+    def _fetch_prices(self, currencies):
+        """Busca preços no ticker REST (usado pelo cache)"""
+        prices = {}
+        for currency in currencies:
             symbol = f"BTC{currency.upper()}"
             response = self.make_request('/api/v3/ticker/price', {'symbol': symbol})
             
-            if 'price' in response:
-                price = float(response['price'])
-                self.price_cache[cache_key] = price
-                self.cache_timestamp = time.time()
-                
-                if DEBUG:
-                    print(f"💰 Preço BTC via Binance: {currency} {price:,.2f}")
-                
-                return price
-            else:
+            if 'price' not in response:
                 raise Exception("Preço não encontrado na resposta")
+            
+            prices[currency] = float(response['price'])
+            
+            if DEBUG:
+                print(f"💰 Preço BTC via Binance: {currency.upper()} {prices[currency]:,.2f}")
+        
+        return prices
+    
+    def get_bitcoin_price(self, currency='BRL'):
+        """Obtém preço atual do Bitcoin"""
+        try:
+            # Livro de preços do stream: leitura em memória, sem rede
+            book_price = get_book_price(f"BTC{currency.upper()}")
+            if book_price is not None:
+                return book_price
+            
+            # Cache por moeda; threads concorrentes compartilham a mesma chamada
+            return self.price_cache.get(currency)
                 
         except Exception as e:
             if DEBUG:
@@ -149,11 +162,12 @@ class BinanceHandler:
             # Obtém preço atual
             btc_price = self.get_bitcoin_price(currency)
             
-            # Calcula quantidade de BTC
-            btc_amount = amount / btc_price
+            # Calcula quantidade de BTC em satoshis (centavos / preço em centavos)
+            btc_sats = fiat_to_sats(to_minor(amount, currency), to_minor(btc_price, currency))
             
             # Aplica taxa de trading
-            btc_amount_after_fee = btc_amount * (1 - self.trading_fee)
+            fee_sats, btc_sats_after_fee = apply_fee(btc_sats, self.trading_fee_bps)
+            btc_amount_after_fee = from_sats(btc_sats_after_fee)
             
             if DEBUG:
                 print(f"🔄 Conversão via Binance: {currency} {amount:,.2f} = {btc_amount_after_fee:.8f} BTC")
@@ -161,9 +175,10 @@ class BinanceHandler:
             return {
                 'success': True,
                 'btc_amount': btc_amount_after_fee,
+                'btc_amount_satoshi': btc_sats_after_fee,
                 'btc_price': btc_price,
                 'trading_fee': self.trading_fee,
-                'fee_amount': btc_amount * self.trading_fee,
+                'fee_amount': from_sats(fee_sats),
                 'exchange': 'binance'
             }
             
@@ -211,8 +226,8 @@ class BinanceHandler:
             # Obtém preço atual
             btc_price = self.get_bitcoin_price(currency)
             
-            # Calcula quantidade de BTC
-            btc_quantity = amount / btc_price
+            # Calcula quantidade de BTC (truncada em satoshis)
+            btc_quantity = from_sats(fiat_to_sats(to_minor(amount, currency), to_minor(btc_price, currency)))
             
             # Parâmetros da ordem
             params = {
@@ -258,7 +273,8 @@ class BinanceHandler:
         try:
             # Taxa BitPay (1%)
             bitpay_fee = 0.01
-            bitpay_btc = amount / 400000 * (1 - bitpay_fee)  # Preço simulado
+            bitpay_sats = fiat_to_sats(to_minor(amount, currency), to_minor(400000, currency))  # Preço simulado
+            bitpay_btc = from_sats(apply_fee(bitpay_sats, fee_to_bps(bitpay_fee))[1])
             
             # Taxa Binance (0.1%)
             binance_btc = self.convert_fiat_to_btc(amount, currency)
@@ -1,8 +1,11 @@
-import requests
 import hashlib
+import time
 import ecdsa
 import base64
-from src.config.settings import BITPAY_API_TOKEN, BITPAY_PRIVATE_KEY_HEX, BITPAY_PUBLIC_KEY_HEX, BITCOIN_WALLET_ADDRESS, BITPAY_API_URL
+from src.utils.single_flight import single_flight
+from src.utils.http_client import http_client
+from src.config.settings import BITPAY_API_TOKEN, BITPAY_PRIVATE_KEY_HEX, BITPAY_PUBLIC_KEY_HEX, BITCOIN_WALLET_ADDRESS, BITPAY_API_URL, PAYOUT_BATCHING_ENABLED
+from src.utils.money import to_sats
 
 # Validação de chaves ECDSA
 def validate_hex_key(key, length=64):
@@ -62,7 +65,7 @@ def create_invoice(price, currency='BRL'):
         'Authorization': f'Token {BITPAY_API_TOKEN}'
     }
     payload = {'price': price, 'currency': currency, 'token': BITPAY_API_TOKEN}
-    response = requests.post(url, json=payload, headers=headers)
+    response = http_client.post(url, json=payload, headers=headers)
     response.raise_for_status()
     return response.json()
 
@@ -78,12 +81,12 @@ def get_invoice_status(invoice_id):
         'X-Signature': sign_request(url, {}),
         'Authorization': f'Token {BITPAY_API_TOKEN}'
     }
-    response = requests.get(url, headers=headers)
+    response = http_client.get(url, headers=headers)
     response.raise_for_status()
     return response.json()
 
-def send_to_wallet(amount_btc):
-    """Envia Bitcoin para wallet configurada"""
+def send_to_wallet(amount_btc, reference=None):
+    """Envia Bitcoin para wallet configurada (reference identifica o lote de payout)"""
     if not BITPAY_ENABLED:
         # Modo de desenvolvimento - simula envio
         return {
@@ -91,7 +94,8 @@ def send_to_wallet(amount_btc):
                 'id': f'payout_dev_{int(time.time())}',
                 'status': 'completed',
                 'amount': amount_btc,
-                'address': BITCOIN_WALLET_ADDRESS or 'dev_wallet_address'
+                'address': BITCOIN_WALLET_ADDRESS or 'dev_wallet_address',
+                'reference': reference
             }
         }
     
@@ -104,33 +108,75 @@ def send_to_wallet(amount_btc):
         'Authorization': f'Token {BITPAY_API_TOKEN}'
     }
     payload = {'amount': amount_btc, 'currency': 'BTC', 'address': BITCOIN_WALLET_ADDRESS}
-    response = requests.post(url, json=payload, headers=headers)
+    if reference:
+        payload['reference'] = reference
+    response = http_client.post(url, json=payload, headers=headers)
     response.raise_for_status()
     return response.json()
 
-def process_payment_conversion(fiat_amount, currency):
-    """Processa conversão completa: cria fatura, converte e envia"""
+def find_payout(reference):
+    """Payout já registrado na BitPay com esta reference (None se não existe)"""
+    if not BITPAY_ENABLED:
+        # Modo de desenvolvimento: o envio simulado nunca fica sem resposta
+        return None
+
+    url = f'{BITPAY_API_URL}/payouts'
+    headers = {
+        'X-Accept-Version': '2.0.0',
+        'X-Identity': BITPAY_PUBLIC_KEY_HEX,
+        'X-Signature': sign_request(url, {'reference': reference}),
+        'Authorization': f'Token {BITPAY_API_TOKEN}'
+    }
+    response = http_client.get(url, headers=headers, params={'reference': reference})
+    response.raise_for_status()
+    payouts = [p for p in response.json().get('data', []) if p.get('reference') == reference]
+    return payouts[0] if payouts else None
+
+def process_payment_conversion(fiat_amount, currency, source_id=None):
+    """Processa conversão completa: cria fatura, converte e envia
+
+    Com PAYOUT_BATCHING_ENABLED o valor é creditado no ledger de payouts
+    uma vez por source_id (obrigatório) e sai no próximo payout em lote.
+    A fatura fica registrada no crédito: uma reentrega cria a fatura só se
+    a tentativa anterior falhou antes de registrá-la.
+    """
     try:
-        import time
-        
-        # Cria fatura BitPay
-        invoice = create_invoice(fiat_amount, currency)
-        
         # Converte para Bitcoin
         from src.utils.bitcoin_converter import convert_fiat_to_btc
         btc_amount = convert_fiat_to_btc(fiat_amount, currency)
         
-        # Envia para wallet
-        payout = send_to_wallet(btc_amount)
-        
-        return {
+        result = {
             'success': True,
-            'invoice_id': invoice.get('data', {}).get('id'),
             'btc_amount': btc_amount,
-            'payout_id': payout.get('data', {}).get('id'),
             'wallet_address': BITCOIN_WALLET_ADDRESS or 'dev_wallet_address',
             'mode': 'development' if not BITPAY_ENABLED else 'production'
         }
+        
+        if PAYOUT_BATCHING_ENABLED:
+            if not source_id:
+                raise ValueError('source_id é obrigatório com payouts em lote (sem ele não há deduplicação)')
+            
+            # Crédito primeiro: reentrega do mesmo pagamento não credita de novo
+            from src.models.payouts import credit_converted_payment, get_payout_invoice, attach_payout_invoice
+            credited = credit_converted_payment('stripe', source_id, to_sats(btc_amount), fiat_amount, currency)
+            invoice_id = None if credited else get_payout_invoice('stripe', source_id)
+            if invoice_id is None:
+                # Falha aqui propaga: o webhook é reprocessado e encontra o crédito sem fatura
+                invoice = create_invoice(fiat_amount, currency)
+                invoice_id = invoice.get('data', {}).get('id')
+                if not attach_payout_invoice('stripe', source_id, invoice_id):
+                    invoice_id = get_payout_invoice('stripe', source_id)
+            
+            return {**result, 'invoice_id': invoice_id, 'payout_id': None, 'payout': 'batched',
+                    'duplicate_credit': not credited}
+        
+        # Cria fatura BitPay
+        invoice = create_invoice(fiat_amount, currency)
+        
+        # Envia para wallet
+        payout = send_to_wallet(btc_amount)
+        return {**result, 'invoice_id': invoice.get('data', {}).get('id'),
+                'payout_id': payout.get('data', {}).get('id'), 'payout': 'sent'}
     except Exception as e:
         return {
             'success': False,
@@ -173,10 +219,14 @@ def create_bitpay_invoice(amount, currency="brl", email=None):
         print(f"Erro ao criar invoice BitPay: {e}")
         return None
 
+def _fetch_bitpay_rates():
+    """Busca tabela de cotações BTC no BitPay"""
+    return http_client.get(f"{BITPAY_API_URL}/rates/BTC")
+
 def get_bitcoin_price():
     """Obtém preço atual do Bitcoin via BitPay"""
     try:
-        response = requests.get(f"{BITPAY_API_URL}/rates/BTC")
+        response = single_flight.do("bitpay:rates:BTC", _fetch_bitpay_rates)
         if response.status_code == 200:
             rates = response.json()['data']
             # Retorna preço em USD
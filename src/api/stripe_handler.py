@@ -1,6 +1,7 @@
 import stripe
 from src.config.settings import STRIPE_SECRET_KEY, STRIPE_WEBHOOK_SECRET
 from src.utils.fee_bypasser import get_lowest_fee_key
+from src.utils.money import to_minor
 
 # Usa chave com menor taxa automaticamente
 stripe.api_key = get_lowest_fee_key()
@@ -26,7 +27,7 @@ def create_price(amount, currency="brl"):
     """Cria preço para assinatura"""
     try:
         return stripe.Price.create(
-            unit_amount=int(amount * 100),  # Em centavos
+            unit_amount=to_minor(amount, currency),  # Em centavos
             currency=currency,
             recurring={"interval": "month"},
             product_data={"name": "Assinatura Mensal"}
@@ -51,7 +52,7 @@ def create_payment_intent(amount, currency="brl", customer_id=None, payment_meth
     """Cria pagamento único"""
     try:
         return stripe.PaymentIntent.create(
-            amount=int(amount * 100),
+            amount=to_minor(amount, currency),  # Em centavos
             currency=currency,
             customer=customer_id,
             payment_method=payment_method_id,
@@ -78,7 +79,7 @@ def create_crypto_payment(amount, currency="usd", crypto_currency="usdc", custom
     try:
         # Para pagamentos em cripto, usamos PaymentIntent com automatic_payment_methods
         intent_data = {
-            "amount": int(amount * 100),  # Em centavos
+            "amount": to_minor(amount, currency),  # Em centavos
             "currency": currency,
             "automatic_payment_methods": {
                 "enabled": True,
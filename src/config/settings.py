@@ -4,6 +4,13 @@ from dotenv import load_dotenv
 # Carrega variáveis de ambiente
 load_dotenv()
 
+def _parse_map(value, cast=str):
+    """Converte "chave:valor,chave:valor" em dict"""
+    return {
+        item.split(':')[0].strip().lower(): cast(item.split(':')[1])
+        for item in value.split(',') if ':' in item
+    }
+
 # Configurações principais
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
@@ -11,6 +18,7 @@ STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY')
 BITPAY_API_TOKEN = os.getenv('BITPAY_API_TOKEN')
 BITPAY_PRIVATE_KEY_HEX = os.getenv('BITPAY_PRIVATE_KEY_HEX')
 BITPAY_PUBLIC_KEY_HEX = os.getenv('BITPAY_PUBLIC_KEY_HEX')
+BITPAY_WEBHOOK_SECRET = os.getenv('BITPAY_WEBHOOK_SECRET')  # HMAC-SHA256 do corpo (opcional)
 BITCOIN_WALLET_ADDRESS = os.getenv('BITCOIN_WALLET_ADDRESS')
 APP_SECRET_KEY = os.getenv('APP_SECRET_KEY')
 DEBUG = os.getenv('DEBUG', 'True') == 'True'
@@ -23,7 +31,114 @@ required_keys = [STRIPE_SECRET_KEY, BITPAY_API_TOKEN, BITCOIN_WALLET_ADDRESS]
 if any(key is None for key in required_keys):
     raise ValueError("Faltando keys no .env! Configura direito, bro.")
 
-# URLs das APIs
-BITPAY_API_URL = 'https://bitpay.com/api'
+# URLs das APIs (BitPay/CoinGecko apontáveis para stand-ins locais em testes de carga)
+BITPAY_API_URL = os.getenv('BITPAY_API_URL', 'https://bitpay.com/api')
 STRIPE_API_URL = 'https://api.stripe.com/v1'
-COINGECKO_API_URL = 'https://api.coingecko.com/api/v3'
+COINGECKO_API_URL = os.getenv('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3')
+
+# Cache de preços (segundos) - PRICE_CACHE_TTLS aceita TTL por moeda: "usd:60,eur:120"
+PRICE_CACHE_TTL = int(os.getenv('PRICE_CACHE_TTL', 300))
+PRICE_CACHE_TTLS = _parse_map(os.getenv('PRICE_CACHE_TTLS', ''), int)
+
+# Moedas buscadas juntas em cada atualização de preço
+PRICE_CURRENCIES = [c.strip().lower() for c in os.getenv('PRICE_CURRENCIES', 'brl,usd,eur').split(',') if c.strip()]
+
+# Feed de preços em streaming (Binance miniTicker ou stand-in local NDJSON)
+PRICE_FEED_ENABLED = os.getenv('PRICE_FEED_ENABLED', 'False') == 'True'
+PRICE_FEED_URL = os.getenv('PRICE_FEED_URL', 'wss://stream.binance.com:9443/stream?streams=btcbrl@miniTicker/btcusdt@miniTicker')
+PRICE_FEED_MAX_AGE = float(os.getenv('PRICE_FEED_MAX_AGE', 10))
+
+# Agregador de preços multi-fonte (deadline em segundos, pesos para média ponderada)
+PRICE_SOURCES = [s.strip().lower() for s in os.getenv('PRICE_SOURCES', 'coingecko,binance,coinbase,bitpay').split(',') if s.strip()]
+PRICE_SOURCE_DEADLINE = float(os.getenv('PRICE_SOURCE_DEADLINE', 2.0))
+PRICE_SOURCE_DEADLINES = _parse_map(os.getenv('PRICE_SOURCE_DEADLINES', ''), float)
+PRICE_SOURCE_WEIGHTS = _parse_map(os.getenv('PRICE_SOURCE_WEIGHTS', ''), float)
+
+# Cache de preços compartilhado entre workers: 'memory' (por processo) ou 'sqlite' (arquivo WAL)
+PRICE_CACHE_BACKEND = os.getenv('PRICE_CACHE_BACKEND', 'memory').lower()
+PRICE_CACHE_DB_PATH = os.getenv('PRICE_CACHE_DB_PATH', 'instance/price_cache.db')
+
+# Histórico de preços em memória (amostras por moeda no ring buffer)
+PRICE_HISTORY_SIZE = int(os.getenv('PRICE_HISTORY_SIZE', 4096))
+
+# Cliente HTTP compartilhado (timeouts em segundos, retry só para métodos idempotentes)
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.2))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+
+# Banco principal (vazio: SQLite em instance/bitcoin_payment.db)
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+
+# Cache de /api/database_stats (segundos) - atraso máximo dos totais vindos de outros
+# processos (escritas do próprio processo invalidam na hora)
+DATABASE_STATS_TTL = float(os.getenv('DATABASE_STATS_TTL', 5))
+
+# Histórico paginado (/api/payments)
+PAYMENTS_PAGE_SIZE = int(os.getenv('PAYMENTS_PAGE_SIZE', 50))
+PAYMENTS_MAX_PAGE_SIZE = int(os.getenv('PAYMENTS_MAX_PAGE_SIZE', 500))
+
+# Write-behind: escritas não críticas em fila limitada gravadas em lote
+# WRITE_BEHIND_ON_FULL: 'block' (espera vaga), 'sync' (grava no request) ou 'drop' (descarta)
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'True') == 'True'
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', 10000))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', 1.0))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 500))
+WRITE_BEHIND_ON_FULL = os.getenv('WRITE_BEHIND_ON_FULL', 'block').lower()
+
+# Commit em grupo dos pagamentos (janela em ms para juntar requests simultâneos)
+GROUP_COMMIT_ENABLED = os.getenv('GROUP_COMMIT_ENABLED', 'True') == 'True'
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('GROUP_COMMIT_WINDOW_MS', 2))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv('GROUP_COMMIT_MAX_BATCH', 100))
+
+# Atualizações de status por invoice BitPay em lote (janela em ms)
+INVOICE_BATCH_WINDOW_MS = float(os.getenv('INVOICE_BATCH_WINDOW_MS', 20))
+INVOICE_BATCH_MAX = int(os.getenv('INVOICE_BATCH_MAX', 200))
+
+# Perfil SQLite de produção (PRAGMAs em toda conexão) e pools do SQLAlchemy
+SQLITE_PRODUCTION_PROFILE = os.getenv('SQLITE_PRODUCTION_PROFILE', 'True') == 'True'
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))  # 256 MB
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))  # 64 MB
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 20))
+
+# Arquivamento de pagamentos liquidados antigos (partição fria payments_archive)
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'False') == 'True'
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 5000))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', 3600))  # segundos entre execuções
+ARCHIVE_STATUSES = [s.strip() for s in os.getenv('ARCHIVE_STATUSES', 'completed,failed,refunded,canceled').split(',') if s.strip()]
+
+# Roteamento de leituras: réplica (2º arquivo SQLite ou réplica PostgreSQL) para
+# endpoints/helpers marcados como replica-safe, com limite de defasagem
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL', '')
+READ_REPLICA_MAX_LAG = float(os.getenv('READ_REPLICA_MAX_LAG', 5))  # segundos
+READ_YOUR_WRITES = os.getenv('READ_YOUR_WRITES', 'True') == 'True'
+READ_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('READ_REPLICA_LAG_CHECK_INTERVAL', 1.0))
+READ_REPLICA_SYNC_INTERVAL = float(os.getenv('READ_REPLICA_SYNC_INTERVAL', 1.0))  # só SQLite local
+
+# Ingestão assíncrona de webhooks (fila durável webhook_events + workers)
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'True') == 'True'
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 0.5))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))  # depois disso vai para dead-letter
+WEBHOOK_RETRY_BACKOFF = float(os.getenv('WEBHOOK_RETRY_BACKOFF', 2.0))  # segundos, dobra a cada tentativa
+WEBHOOK_RETRY_MAX_DELAY = float(os.getenv('WEBHOOK_RETRY_MAX_DELAY', 3600))
+WEBHOOK_LEASE_SECONDS = float(os.getenv('WEBHOOK_LEASE_SECONDS', 300))  # evento travado volta para a fila
+
+# Idempotência de webhooks (LRU em memória na frente de webhook_event_keys)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+IDEMPOTENCY_RETENTION_DAYS = int(os.getenv('IDEMPOTENCY_RETENTION_DAYS', 30))  # Stripe reenvia por até 3 dias
+
+# Payouts em lote (ledger payout_ledger; um payout por intervalo ou ao atingir o limite)
+PAYOUT_BATCHING_ENABLED = os.getenv('PAYOUT_BATCHING_ENABLED', 'True') == 'True'
+PAYOUT_THRESHOLD_BTC = float(os.getenv('PAYOUT_THRESHOLD_BTC', 0.01))  # envia assim que o pendente atingir
+PAYOUT_INTERVAL = float(os.getenv('PAYOUT_INTERVAL', 3600))  # segundos desde o crédito pendente mais antigo
+PAYOUT_CHECK_INTERVAL = float(os.getenv('PAYOUT_CHECK_INTERVAL', 30))
+PAYOUT_MAX_ATTEMPTS = int(os.getenv('PAYOUT_MAX_ATTEMPTS', 5))  # depois disso o lote fica 'failed'
+PAYOUT_LEASE_SECONDS = float(os.getenv('PAYOUT_LEASE_SECONDS', 120))  # lote em envio por um processo
@@ -0,0 +1,143 @@
+"""
+Arquivador de Pagamentos - Partição Fria
+Move pagamentos liquidados mais antigos que ARCHIVE_AFTER_DAYS da tabela
+payments para payments_archive, em lotes, para que índices e consultas do
+caminho quente só cubram os pagamentos recentes ou ainda em aberto
+"""
+
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from src.config.settings import (
+    DEBUG, ARCHIVE_ENABLED, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE,
+    ARCHIVE_INTERVAL, ARCHIVE_STATUSES
+)
+from src.models.database import db, Payment, PaymentArchive, invalidate_stats_cache
+
+def archive_settled_payments(engine, older_than_days=None, batch_size=None, statuses=None):
+    """Move pagamentos liquidados antigos para o arquivo, um lote por transação
+
+    INSERT ... SELECT + DELETE pelo mesmo conjunto de ids: cada lote é atômico
+    (a linha está em uma tabela ou na outra, nunca nas duas nem em nenhuma).
+    SQL direto, sem eventos do ORM: os rollups de estatística são totais de
+    todo o histórico e não mudam ao arquivar, mas o cache de estatísticas
+    só é invalidado pelo commit da sessão, então é descartado aqui.
+    """
+    older_than_days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    statuses = statuses or ARCHIVE_STATUSES
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    hot = Payment.__table__
+    cold = PaymentArchive.__table__
+    columns = [column.name for column in hot.columns]
+    moved = 0
+
+    while True:
+        with engine.begin() as connection:
+            ids = connection.execute(
+                select(hot.c.id)
+                .where(hot.c.status.in_(statuses), hot.c.created_at < cutoff)
+                .order_by(hot.c.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+
+            connection.execute(cold.insert().from_select(
+                columns,
+                select(*[hot.c[name] for name in columns]).where(hot.c.id.in_(ids))
+            ))
+            connection.execute(hot.delete().where(hot.c.id.in_(ids)))
+        moved += len(ids)
+
+        if len(ids) < batch_size:
+            break
+
+    if moved:
+        invalidate_stats_cache()
+    return moved
+
+class PaymentArchiver:
+    """Thread que arquiva periodicamente"""
+
+    def __init__(self, interval=3600):
+        self.interval = interval
+        self.engine = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+        self.stats = {
+            'runs': 0,
+            'archived': 0,
+            'errors': 0,
+            'last_run': None,
+            'last_run_ms': 0
+        }
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, engine):
+        if self.running:
+            return
+        self.engine = engine
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='payment-archiver', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        if not self.running:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.run_once()
+            self.stop_event.wait(self.interval)
+
+    def run_once(self):
+        """Executa um arquivamento completo"""
+        start = time.perf_counter()
+        try:
+            moved = archive_settled_payments(self.engine)
+            self.stats['archived'] += moved
+            if moved and DEBUG:
+                print(f"🗄️ {moved} pagamento(s) movido(s) para payments_archive")
+        except Exception as e:
+            moved = 0
+            self.stats['errors'] += 1
+            print(f"❌ Erro ao arquivar pagamentos: {e}")
+        self.stats['runs'] += 1
+        self.stats['last_run'] = datetime.utcnow().isoformat()
+        self.stats['last_run_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return moved
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'running': self.running,
+            'after_days': ARCHIVE_AFTER_DAYS,
+            'statuses': ARCHIVE_STATUSES
+        }
+
+# Instância global
+payment_archiver = PaymentArchiver(interval=ARCHIVE_INTERVAL)
+
+def start_archiver(app):
+    """Inicia o arquivador (chamado pelo init_database)"""
+    if not ARCHIVE_ENABLED:
+        return
+    with app.app_context():
+        engine = db.engine
+    payment_archiver.start(engine)
+
+atexit.register(payment_archiver.stop)
+
+def get_archiver_stats():
+    """Estatísticas do arquivador"""
+    return payment_archiver.get_stats()
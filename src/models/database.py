@@ -3,15 +3,58 @@ Banco de Dados Persistente - SQLAlchemy
 Migração de in-memory para PostgreSQL
 """
 
+import base64
+import click
+import threading
+import time
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, event, inspect, case, tuple_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, declared_attr
+from sqlalchemy.dialects import postgresql, sqlite
+from src.config.settings import DATABASE_URL, DATABASE_STATS_TTL, PAYMENTS_PAGE_SIZE, PAYMENTS_MAX_PAGE_SIZE
+from src.models.sqlite_profile import configure_app, configure_engines
+from src.models.routing import configure_read_routing, read_session, replica_safe
+from src.utils.money import to_minor, to_sats, from_minor, from_sats
 
 db = SQLAlchemy()
 
-class Payment(db.Model):
-    """Modelo para pagamentos"""
-    __tablename__ = 'payments'
+class Customer(db.Model):
+    """Cliente único por email (referenciado por pagamentos, assinaturas, pedidos e campanhas)"""
+    __tablename__ = 'customers'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=True)
+    stripe_customer_id = db.Column(db.String(100), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Customer {self.id}: {self.email}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'name': self.name,
+            'stripe_customer_id': self.stripe_customer_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CustomerRef:
+    """FK para customers.id (preenchida na inserção a partir do email)"""
+    
+    # Subscription.customer_id já é o id do cliente no Stripe
+    @declared_attr
+    def customer_ref_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
+
+class PaymentColumns(CustomerRef):
+    """Colunas de pagamento (tabela quente e arquivo compartilham o schema)"""
     
     id = db.Column(db.Integer, primary_key=True)
     stripe_payment_id = db.Column(db.String(100), unique=True, nullable=False)
@@ -22,13 +65,17 @@ class Payment(db.Model):
     btc_amount = db.Column(db.Float, nullable=True)
     btc_price = db.Column(db.Float, nullable=True)
     conversion_fee = db.Column(db.Float, nullable=True)
+    amount_cents = db.Column(db.BigInteger, nullable=True)  # amount em centavos
+    btc_amount_sats = db.Column(db.BigInteger, nullable=True)  # btc_amount em satoshis
+    btc_price_cents = db.Column(db.BigInteger, nullable=True)  # btc_price em centavos
     payment_type = db.Column(db.String(20), nullable=False)  # 'unique' ou 'subscription'
     status = db.Column(db.String(20), nullable=False, default='pending')
+    bitpay_invoice_id = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Payment {self.id}: {self.customer_email} - R${self.amount}>'
+        return f'<{type(self).__name__} {self.id}: {self.customer_email} - R${self.amount}>'
     
     def to_dict(self):
         return {
@@ -41,21 +88,56 @@ class Payment(db.Model):
             'btc_amount': self.btc_amount,
             'btc_price': self.btc_price,
             'conversion_fee': self.conversion_fee,
+            'amount_cents': self.amount_cents,
+            'btc_amount_sats': self.btc_amount_sats,
             'payment_type': self.payment_type,
             'status': self.status,
+            'bitpay_invoice_id': self.bitpay_invoice_id,
+            'customer_ref_id': self.customer_ref_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-class Subscription(db.Model):
+class Payment(PaymentColumns, db.Model):
+    """Modelo para pagamentos (partição quente: recentes e não liquidados)"""
+    __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_status_created_at', 'status', 'created_at'),
+        db.Index('ix_payments_customer_email_created_at', 'customer_email', 'created_at'),
+        db.Index('ix_payments_created_at_id', 'created_at', 'id'),
+        db.Index('ix_payments_customer_ref_id_created_at', 'customer_ref_id', 'created_at'),
+        db.Index('ix_payments_bitpay_invoice_id', 'bitpay_invoice_id'),
+    )
+
+class PaymentArchive(PaymentColumns, db.Model):
+    """Pagamentos liquidados antigos movidos pelo arquivador (partição fria)"""
+    __tablename__ = 'payments_archive'
+    __table_args__ = (
+        db.Index('ix_payments_archive_status_created_at', 'status', 'created_at'),
+        db.Index('ix_payments_archive_customer_email_created_at', 'customer_email', 'created_at'),
+        db.Index('ix_payments_archive_created_at_id', 'created_at', 'id'),
+        db.Index('ix_payments_archive_customer_ref_id_created_at', 'customer_ref_id', 'created_at'),
+        db.Index('ix_payments_archive_bitpay_invoice_id', 'bitpay_invoice_id'),
+    )
+    
+    # Mantém o id original da tabela quente
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+class Subscription(CustomerRef, db.Model):
     """Modelo para assinaturas"""
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_status_created_at', 'status', 'created_at'),
+        db.Index('ix_subscriptions_customer_email_created_at', 'customer_email', 'created_at'),
+        db.Index('ix_subscriptions_customer_ref_id_created_at', 'customer_ref_id', 'created_at'),
+    )
     
     id = db.Column(db.String(100), primary_key=True)  # Stripe subscription ID
     customer_id = db.Column(db.String(100), nullable=False)
     customer_email = db.Column(db.String(120), nullable=False)
     customer_name = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=True)  # amount em centavos
     currency = db.Column(db.String(3), nullable=False, default='BRL')
     status = db.Column(db.String(20), nullable=False, default='active')
     current_period_start = db.Column(db.DateTime, nullable=True)
@@ -70,9 +152,11 @@ class Subscription(db.Model):
         return {
             'id': self.id,
             'customer_id': self.customer_id,
+            'customer_ref_id': self.customer_ref_id,
             'customer_email': self.customer_email,
             'customer_name': self.customer_name,
             'amount': self.amount,
+            'amount_cents': self.amount_cents,
             'currency': self.currency,
             'status': self.status,
             'current_period_start': self.current_period_start.isoformat() if self.current_period_start else None,
@@ -81,9 +165,14 @@ class Subscription(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-class DropshipOrder(db.Model):
+class DropshipOrder(CustomerRef, db.Model):
     """Modelo para pedidos dropship"""
     __tablename__ = 'dropship_orders'
+    __table_args__ = (
+        db.Index('ix_dropship_orders_status_created_at', 'status', 'created_at'),
+        db.Index('ix_dropship_orders_customer_email_created_at', 'customer_email', 'created_at'),
+        db.Index('ix_dropship_orders_customer_ref_id_created_at', 'customer_ref_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.String(100), unique=True, nullable=False)
@@ -94,6 +183,9 @@ class DropshipOrder(db.Model):
     price = db.Column(db.Float, nullable=False)
     profit = db.Column(db.Float, nullable=False)
     btc_amount = db.Column(db.Float, nullable=True)
+    price_cents = db.Column(db.BigInteger, nullable=True)  # price em centavos
+    profit_cents = db.Column(db.BigInteger, nullable=True)  # profit em centavos
+    btc_amount_sats = db.Column(db.BigInteger, nullable=True)  # btc_amount em satoshis
     status = db.Column(db.String(20), nullable=False, default='pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -105,6 +197,7 @@ class DropshipOrder(db.Model):
         return {
             'id': self.id,
             'order_id': self.order_id,
+            'customer_ref_id': self.customer_ref_id,
             'customer_email': self.customer_email,
             'customer_name': self.customer_name,
             'product_name': self.product_name,
@@ -117,9 +210,16 @@ class DropshipOrder(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-class MarketingCampaign(db.Model):
+class MarketingCampaign(CustomerRef, db.Model):
     """Modelo para campanhas de marketing"""
     __tablename__ = 'marketing_campaigns'
+    __table_args__ = (
+        db.Index('ix_marketing_campaigns_opened_at', 'opened_at'),
+        db.Index('ix_marketing_campaigns_clicked_at', 'clicked_at'),
+        db.Index('ix_marketing_campaigns_converted_at', 'converted_at'),
+        db.Index('ix_marketing_campaigns_target_email_sent_at', 'target_email', 'sent_at'),
+        db.Index('ix_marketing_campaigns_customer_ref_id_sent_at', 'customer_ref_id', 'sent_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     campaign_name = db.Column(db.String(100), nullable=False)
@@ -127,6 +227,7 @@ class MarketingCampaign(db.Model):
     target_email = db.Column(db.String(120), nullable=False)
     target_name = db.Column(db.String(100), nullable=True)
     amount = db.Column(db.Float, nullable=True)
+    amount_cents = db.Column(db.BigInteger, nullable=True)  # amount em centavos
     status = db.Column(db.String(20), nullable=False, default='sent')
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
     opened_at = db.Column(db.DateTime, nullable=True)
@@ -143,6 +244,7 @@ class MarketingCampaign(db.Model):
             'campaign_type': self.campaign_type,
             'target_email': self.target_email,
             'target_name': self.target_name,
+            'customer_ref_id': self.customer_ref_id,
             'amount': self.amount,
             'status': self.status,
             'sent_at': self.sent_at.isoformat() if self.sent_at else None,
@@ -173,47 +275,528 @@ class SystemStats(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class StatsRollup(db.Model):
+    """Totais acumulados das estatísticas (atualizados a cada escrita)"""
+    __tablename__ = 'stats_rollups'
+    
+    name = db.Column(db.String(80), primary_key=True)  # ex.: 'payments.completed.count'
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StatsRollup {self.name}: {self.value}>'
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'value': self.value,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class WebhookEvent(db.Model):
+    """Evento de webhook recebido (fila durável processada pelos workers)"""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.Index('ix_webhook_events_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_webhook_events_provider_event_id', 'provider', 'event_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False)  # 'stripe', 'stripe_v2' (handlers do app_v2) ou 'bitpay'
+    event_id = db.Column(db.String(255), nullable=True)
+    event_type = db.Column(db.String(100), nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # corpo original do request
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    claim_token = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<WebhookEvent {self.id}: {self.provider} {self.event_type} - {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'provider': self.provider,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+class WebhookEventKey(db.Model):
+    """Id de evento já recebido por provedor (chave de idempotência)"""
+    __tablename__ = 'webhook_event_keys'
+    
+    provider = db.Column(db.String(20), primary_key=True)
+    event_id = db.Column(db.String(255), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<WebhookEventKey {self.provider}:{self.event_id}>'
+    
+    def to_dict(self):
+        return {
+            'provider': self.provider,
+            'event_id': self.event_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class PayoutBatch(db.Model):
+    """Payout agregado para a wallet (várias entradas do ledger, uma chamada à BitPay)"""
+    __tablename__ = 'payout_batches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reference = db.Column(db.String(64), unique=True, nullable=False)  # mesma em todo reenvio do lote
+    status = db.Column(db.String(20), nullable=False, default='sending', index=True)  # sending, sent, unknown, failed
+    total_sats = db.Column(db.BigInteger, nullable=False)
+    entries = db.Column(db.Integer, nullable=False)
+    payout_id = db.Column(db.String(100), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<PayoutBatch {self.id}: {self.total_sats} sats - {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'reference': self.reference,
+            'status': self.status,
+            'total_sats': self.total_sats,
+            'btc_amount': from_sats(self.total_sats),
+            'entries': self.entries,
+            'payout_id': self.payout_id,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+class PayoutEntry(db.Model):
+    """Valor convertido aguardando payout (uma linha por pagamento de origem)"""
+    __tablename__ = 'payout_ledger'
+    __table_args__ = (
+        # Reprocessar o mesmo pagamento não credita duas vezes
+        db.UniqueConstraint('source', 'source_id', name='uq_payout_ledger_source'),
+        db.Index('ix_payout_ledger_status_created_at', 'status', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(20), nullable=False)  # 'stripe'
+    source_id = db.Column(db.String(255), nullable=False)  # PaymentIntent/Invoice
+    amount_sats = db.Column(db.BigInteger, nullable=False)
+    fiat_amount_cents = db.Column(db.BigInteger, nullable=True)
+    currency = db.Column(db.String(3), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, batched, paid
+    batch_id = db.Column(db.Integer, db.ForeignKey('payout_batches.id'), nullable=True, index=True)
+    invoice_id = db.Column(db.String(100), nullable=True)  # fatura BitPay do pagamento (None = ainda não criada)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PayoutEntry {self.source}:{self.source_id} {self.amount_sats} sats - {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'source_id': self.source_id,
+            'amount_sats': self.amount_sats,
+            'btc_amount': from_sats(self.amount_sats),
+            'fiat_amount_cents': self.fiat_amount_cents,
+            'currency': self.currency,
+            'status': self.status,
+            'batch_id': self.batch_id,
+            'invoice_id': self.invoice_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# ============================================================================
+# 💰 COLUNAS EM MENOR UNIDADE (CENTAVOS / SATOSHIS)
+# ============================================================================
+
+# (coluna float, coluna int, tipo) - a coluna int é derivada na escrita
+MINOR_UNIT_COLUMNS = {
+    Payment: [('amount', 'amount_cents', 'fiat'), ('btc_amount', 'btc_amount_sats', 'btc'), ('btc_price', 'btc_price_cents', 'fiat')],
+    Subscription: [('amount', 'amount_cents', 'fiat')],
+    DropshipOrder: [('price', 'price_cents', 'fiat'), ('profit', 'profit_cents', 'fiat'), ('btc_amount', 'btc_amount_sats', 'btc')],
+    MarketingCampaign: [('amount', 'amount_cents', 'fiat')]
+}
+
+def _sync_minor_units(mapper, connection, target):
+    """Mantém colunas inteiras em sincronia com os valores float"""
+    currency = getattr(target, 'currency', None) or 'BRL'
+    for float_attr, int_attr, kind in MINOR_UNIT_COLUMNS[type(target)]:
+        value = getattr(target, float_attr)
+        setattr(target, int_attr, to_sats(value) if kind == 'btc' else to_minor(value, currency))
+
+for _model in MINOR_UNIT_COLUMNS:
+    event.listen(_model, 'before_insert', _sync_minor_units)
+    event.listen(_model, 'before_update', _sync_minor_units)
+
+# ============================================================================
+# 👤 CLIENTES
+# ============================================================================
+
+# (atributo de email, atributo de nome, atributo do id Stripe) de cada modelo
+CUSTOMER_COLUMNS = {
+    Payment: ('customer_email', 'customer_name', None),
+    Subscription: ('customer_email', 'customer_name', 'customer_id'),
+    DropshipOrder: ('customer_email', 'customer_name', None),
+    MarketingCampaign: ('target_email', 'target_name', None)
+}
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+def upsert_customer(connection, email, name=None, stripe_customer_id=None):
+    """Id do cliente pelo email, criando se não existir (seguro entre workers)"""
+    table = Customer.__table__
+    email = normalize_email(email)
+    lookup = select(table.c.id, table.c.stripe_customer_id).where(table.c.email == email)
+    row = connection.execute(lookup).first()
+    now = datetime.utcnow()
+    
+    if row is None:
+        values = {
+            'email': email,
+            'name': name or None,
+            'stripe_customer_id': stripe_customer_id or None,
+            'created_at': now,
+            'updated_at': now
+        }
+        if connection.dialect.name in ('postgresql', 'sqlite'):
+            # Outro worker pode inserir o mesmo email ao mesmo tempo: ignora e relê
+            dialect_insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+            statement = dialect_insert(table).values(**values).on_conflict_do_nothing(index_elements=['email'])
+        else:
+            statement = table.insert().values(**values)
+        connection.execute(statement)
+        row = connection.execute(lookup).first()
+    elif stripe_customer_id and row.stripe_customer_id != stripe_customer_id:
+        connection.execute(
+            table.update().where(table.c.id == row.id).values(stripe_customer_id=stripe_customer_id, updated_at=now)
+        )
+    
+    return row.id
+
+def _link_customer(mapper, connection, target):
+    """Preenche customer_ref_id na inserção a partir do email da linha
+
+    Sempre resolve pelo email nesta conexão: um customer_ref_id que sobrou
+    de um flush desfeito (lote do commit em grupo regravado linha a linha)
+    pode apontar para um cliente que o rollback removeu.
+    """
+    email_attr, name_attr, stripe_attr = CUSTOMER_COLUMNS[type(target)]
+    email = normalize_email(getattr(target, email_attr))
+    if email:
+        target.customer_ref_id = upsert_customer(
+            connection, email, getattr(target, name_attr),
+            getattr(target, stripe_attr) if stripe_attr else None
+        )
+
+for _model in CUSTOMER_COLUMNS:
+    event.listen(_model, 'before_insert', _link_customer)
+
+def get_customer(email=None, stripe_customer_id=None):
+    """Busca cliente por email ou id Stripe (ambos indexados)"""
+    query = Customer.query
+    if email is not None:
+        query = query.filter(Customer.email == normalize_email(email))
+    if stripe_customer_id is not None:
+        query = query.filter(Customer.stripe_customer_id == stripe_customer_id)
+    return query.first()
+
+@replica_safe
+def get_customer_summary(email, recent=10):
+    """Cliente com totais por moeda e pagamentos recentes (consultas por customer_ref_id)"""
+    with read_session() as session:
+        customer = session.query(Customer).filter(Customer.email == normalize_email(email)).first()
+        if customer is None:
+            return None
+        
+        # Totais por moeda: centavos de BRL e ienes não podem ser somados
+        payments_count, lifetime = 0, {}
+        for model in (Payment, PaymentArchive):
+            rows = session.query(
+                model.currency, func.count(model.id), func.sum(model.amount_cents)
+            ).filter(model.customer_ref_id == customer.id, model.status == 'completed').group_by(model.currency).all()
+            for currency, count, cents in rows:
+                payments_count += count
+                currency = currency.upper()  # gravada como veio ('brl' ou 'BRL')
+                lifetime[currency] = lifetime.get(currency, 0) + int(cents or 0)
+        
+        subs = session.query(
+            Subscription.currency, func.count(Subscription.id), func.sum(Subscription.amount_cents)
+        ).filter(Subscription.customer_ref_id == customer.id, Subscription.status == 'active').group_by(Subscription.currency).all()
+        recurring = {}
+        for currency, _, cents in subs:
+            recurring[currency.upper()] = recurring.get(currency.upper(), 0) + int(cents or 0)
+        orders, orders_cents = session.query(
+            func.count(DropshipOrder.id), func.sum(DropshipOrder.price_cents)
+        ).filter(DropshipOrder.customer_ref_id == customer.id).one()
+        if orders_cents:
+            # Pedidos dropship são sempre em reais
+            lifetime['BRL'] = lifetime.get('BRL', 0) + int(orders_cents)
+        
+        summary = {
+            'customer': customer.to_dict(),
+            'completed_payments': payments_count,
+            'active_subscriptions': sum(count for _, count, _ in subs),
+            'monthly_recurring': {currency: from_minor(cents, currency) for currency, cents in recurring.items()},
+            'dropship_orders': orders,
+            'lifetime_value': {currency: from_minor(cents, currency) for currency, cents in lifetime.items()}
+        }
+    
+    summary['recent_payments'] = get_payments_page(limit=recent, customer_email=customer.email)['payments']
+    return summary
+
+# ============================================================================
+# 📊 ROLLUPS DE ESTATÍSTICAS
+# ============================================================================
+
+def _rollup_currency(get):
+    # Menor unidade depende da moeda: um total por moeda, nunca somados entre si
+    return (get('currency') or 'BRL').upper()
+
+def _payment_rollup(get):
+    if get('status') != 'completed':
+        return {}
+    return {
+        'payments.completed.count': 1,
+        f"payments.completed.amount_cents.{_rollup_currency(get)}": get('amount_cents') or 0,
+        'payments.completed.btc_sats': get('btc_amount_sats') or 0
+    }
+
+def _subscription_rollup(get):
+    if get('status') != 'active':
+        return {}
+    return {
+        'subscriptions.active.count': 1,
+        f"subscriptions.active.amount_cents.{_rollup_currency(get)}": get('amount_cents') or 0
+    }
+
+def _dropship_rollup(get):
+    return {
+        'dropship.count': 1,
+        'dropship.profit_cents': get('profit_cents') or 0,
+        'dropship.btc_sats': get('btc_amount_sats') or 0
+    }
+
+# modelo -> (contribuição da linha aos totais, atributos usados)
+ROLLUP_RULES = {
+    Payment: (_payment_rollup, ['status', 'currency', 'amount_cents', 'btc_amount_sats']),
+    Subscription: (_subscription_rollup, ['status', 'currency', 'amount_cents']),
+    DropshipOrder: (_dropship_rollup, ['profit_cents', 'btc_amount_sats'])
+}
+
+def _rollup_delta(old, new):
+    """Diferença entre duas contribuições (nomes com delta zero são omitidos)"""
+    delta = {}
+    for name in set(old) | set(new):
+        value = new.get(name, 0) - old.get(name, 0)
+        if value:
+            delta[name] = value
+    return delta
+
+def _apply_rollup_delta(connection, delta):
+    """Soma o delta nos totais dentro da mesma transação da escrita"""
+    table = StatsRollup.__table__
+    now = datetime.utcnow()
+    for name, value in delta.items():
+        if connection.dialect.name in ('postgresql', 'sqlite'):
+            # Upsert: dois writers criando o mesmo nome (1º pagamento em JPY) não colidem no INSERT
+            dialect_insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+            statement = dialect_insert(table).values(name=name, value=value, updated_at=now)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=['name'],
+                set_={'value': table.c.value + statement.excluded.value, 'updated_at': now}
+            ))
+            continue
+        
+        result = connection.execute(
+            table.update().where(table.c.name == name).values(value=table.c.value + value, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, value=value, updated_at=now))
+
+def _previous_value(target, attr):
+    """Valor antes do flush atual"""
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+def _rollup_after_insert(mapper, connection, target):
+    rule, _ = ROLLUP_RULES[type(target)]
+    _apply_rollup_delta(connection, rule(lambda attr: getattr(target, attr)))
+
+def _rollup_after_update(mapper, connection, target):
+    rule, _ = ROLLUP_RULES[type(target)]
+    old = rule(lambda attr: _previous_value(target, attr))
+    new = rule(lambda attr: getattr(target, attr))
+    _apply_rollup_delta(connection, _rollup_delta(old, new))
+
+def _rollup_before_delete(mapper, connection, target):
+    rule, _ = ROLLUP_RULES[type(target)]
+    contribution = rule(lambda attr: getattr(target, attr))
+    _apply_rollup_delta(connection, {name: -value for name, value in contribution.items() if value})
+
+def _keep_previous(target, value, oldvalue, initiator):
+    return value
+
+for _model, (_rule, _attrs) in ROLLUP_RULES.items():
+    # active_history: o valor antigo é carregado antes da troca, mesmo com a instância expirada
+    for _attr in _attrs:
+        event.listen(getattr(_model, _attr), 'set', _keep_previous, active_history=True, retval=True)
+    event.listen(_model, 'after_insert', _rollup_after_insert)
+    event.listen(_model, 'after_update', _rollup_after_update)
+    event.listen(_model, 'before_delete', _rollup_before_delete)
+
+def compute_stats_rollups(connection):
+    """Totais calculados direto das tabelas (mesmos nomes dos rollups)"""
+    rollups = {}
+    
+    def add(name, value):
+        rollups[name] = rollups.get(name, 0) + int(value or 0)
+    
+    # Pagamentos: soma da partição quente e do arquivo (totais de todo o histórico), por moeda
+    add('payments.completed.count', 0)
+    add('payments.completed.btc_sats', 0)
+    for model in (Payment, PaymentArchive):
+        table = model.__table__
+        rows = connection.execute(
+            select(table.c.currency, func.count(table.c.id), func.sum(table.c.amount_cents), func.sum(table.c.btc_amount_sats))
+            .where(table.c.status == 'completed').group_by(table.c.currency)
+        ).all()
+        for currency, count, cents, sats in rows:
+            add('payments.completed.count', count)
+            add(f"payments.completed.amount_cents.{(currency or 'BRL').upper()}", cents)
+            add('payments.completed.btc_sats', sats)
+    
+    add('subscriptions.active.count', 0)
+    table = Subscription.__table__
+    rows = connection.execute(
+        select(table.c.currency, func.count(table.c.id), func.sum(table.c.amount_cents))
+        .where(table.c.status == 'active').group_by(table.c.currency)
+    ).all()
+    for currency, count, cents in rows:
+        add('subscriptions.active.count', count)
+        add(f"subscriptions.active.amount_cents.{(currency or 'BRL').upper()}", cents)
+    
+    table = DropshipOrder.__table__
+    dropship = connection.execute(
+        select(func.count(table.c.id), func.sum(table.c.profit_cents), func.sum(table.c.btc_amount_sats))
+    ).one()
+    add('dropship.count', dropship[0])
+    add('dropship.profit_cents', dropship[1])
+    add('dropship.btc_sats', dropship[2])
+    return rollups
+
+def rebuild_stats_rollups(engine=None):
+    """Recalcula todos os totais a partir das tabelas (inicialização/migração e CLI)
+
+    Roda em uma transação que bloqueia os writers antes de ler as tabelas:
+    escrita concluída antes entra na soma, escrita posterior aplica seu
+    delta sobre o total recalculado; nenhum delta se perde.
+    """
+    engine = engine or db.engine
+    table = StatsRollup.__table__
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            # EXCLUSIVE conflita com o ROW EXCLUSIVE dos writers, não com leituras
+            connection.execute(text(f"LOCK TABLE {table.name} IN EXCLUSIVE MODE"))
+        # No SQLite o DELETE já pega o lock de escrita antes das leituras abaixo
+        connection.execute(table.delete())
+        rollups = compute_stats_rollups(connection)
+        now = datetime.utcnow()
+        connection.execute(table.insert(), [
+            {'name': name, 'value': value, 'updated_at': now} for name, value in rollups.items()
+        ])
+    
+    invalidate_stats_cache()
+    return rollups
+
+@replica_safe
+def get_stats_rollups():
+    """Retorna {nome: total} com uma única leitura
+
+    Totais do momento da leitura (deltas aplicados na mesma transação da
+    escrita); quem lê via get_database_stats recebe o cache, que pode
+    estar até DATABASE_STATS_TTL segundos atrasado. Nunca recalcula aqui (leitura pode ir à réplica e um rebuild
+    concorrente perderia deltas): rollups vazios são recalculados na
+    inicialização ou por `flask rebuild-stats`.
+    """
+    with read_session() as session:
+        return {name: value for name, value in session.query(StatsRollup.name, StatsRollup.value)}
+
+def _totals_by_currency(rollups, prefix):
+    """{moeda: valor} a partir dos rollups '<prefixo>.<MOEDA>', cada um na sua escala"""
+    return {
+        name[len(prefix) + 1:]: from_minor(value, name[len(prefix) + 1:])
+        for name, value in rollups.items()
+        if name.startswith(prefix + '.') and value
+    }
+
 # Funções de conveniência para consultas
-def get_payment_stats():
+def get_payment_stats(rollups=None):
     """Retorna estatísticas de pagamentos"""
-    total_converted = db.session.query(func.sum(Payment.amount)).filter(Payment.status == 'completed').scalar() or 0
-    btc_received = db.session.query(func.sum(Payment.btc_amount)).filter(Payment.status == 'completed').scalar() or 0
-    total_payments = Payment.query.filter(Payment.status == 'completed').count()
+    # Totais em centavos/satoshis mantidos pelos rollups: leitura O(1)
+    if rollups is None:
+        rollups = get_stats_rollups()
     
     return {
-        'total_converted': float(total_converted),
-        'btc_received': float(btc_received),
-        'total_payments': total_payments
+        'total_converted': _totals_by_currency(rollups, 'payments.completed.amount_cents'),
+        'btc_received': from_sats(rollups.get('payments.completed.btc_sats', 0)),
+        'total_payments': rollups.get('payments.completed.count', 0)
     }
 
-def get_subscription_stats():
+def get_subscription_stats(rollups=None):
     """Retorna estatísticas de assinaturas"""
-    active_subs = Subscription.query.filter_by(status='active').count()
-    total_revenue = db.session.query(func.sum(Subscription.amount)).filter(Subscription.status == 'active').scalar() or 0
+    if rollups is None:
+        rollups = get_stats_rollups()
     
     return {
-        'active_subs': active_subs,
-        'total_revenue': float(total_revenue)
+        'active_subs': rollups.get('subscriptions.active.count', 0),
+        'total_revenue': _totals_by_currency(rollups, 'subscriptions.active.amount_cents')
     }
 
-def get_dropship_stats():
+def get_dropship_stats(rollups=None):
     """Retorna estatísticas de dropship"""
-    total_orders = DropshipOrder.query.count()
-    total_profit = db.session.query(func.sum(DropshipOrder.profit)).scalar() or 0
-    total_btc = db.session.query(func.sum(DropshipOrder.btc_amount)).scalar() or 0
+    if rollups is None:
+        rollups = get_stats_rollups()
     
     return {
-        'total_orders': total_orders,
-        'total_profit': float(total_profit),
-        'total_btc': float(total_btc)
+        'total_orders': rollups.get('dropship.count', 0),
+        'total_profit': from_minor(rollups.get('dropship.profit_cents', 0)),
+        'total_btc': from_sats(rollups.get('dropship.btc_sats', 0))
     }
 
+@replica_safe
 def get_marketing_stats():
     """Retorna estatísticas de marketing"""
-    total_campaigns = MarketingCampaign.query.count()
-    opened_campaigns = MarketingCampaign.query.filter(MarketingCampaign.opened_at.isnot(None)).count()
-    clicked_campaigns = MarketingCampaign.query.filter(MarketingCampaign.clicked_at.isnot(None)).count()
-    converted_campaigns = MarketingCampaign.query.filter(MarketingCampaign.converted_at.isnot(None)).count()
+    # Uma consulta com agregação condicional em vez de um COUNT por coluna
+    with read_session() as session:
+        total_campaigns, opened_campaigns, clicked_campaigns, converted_campaigns = session.query(
+            func.count(MarketingCampaign.id),
+            func.sum(case((MarketingCampaign.opened_at.isnot(None), 1), else_=0)),
+            func.sum(case((MarketingCampaign.clicked_at.isnot(None), 1), else_=0)),
+            func.sum(case((MarketingCampaign.converted_at.isnot(None), 1), else_=0))
+        ).one()
+    opened_campaigns = int(opened_campaigns or 0)
+    clicked_campaigns = int(clicked_campaigns or 0)
+    converted_campaigns = int(converted_campaigns or 0)
     
     return {
         'total_campaigns': total_campaigns,
@@ -225,20 +808,292 @@ def get_marketing_stats():
         'conversion_rate': (converted_campaigns / total_campaigns * 100) if total_campaigns > 0 else 0
     }
 
+# ============================================================================
+# 🗃️ CACHE DE ESTATÍSTICAS E CONTAGEM DE CONSULTAS
+# ============================================================================
+
+_query_counters = threading.local()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_query_counters, 'stack', ()):
+        counter['queries'] += 1
+
+@contextmanager
+def count_queries():
+    """Conta as consultas SQL executadas nesta thread dentro do bloco"""
+    counter = {'queries': 0}
+    stack = getattr(_query_counters, 'stack', None)
+    if stack is None:
+        stack = _query_counters.stack = []
+    stack.append(counter)
+    try:
+        yield counter
+    finally:
+        stack.remove(counter)
+
+# Modelos cujas escritas invalidam o cache de estatísticas
+STATS_MODELS = (Payment, Subscription, DropshipOrder, MarketingCampaign)
+
+_stats_cache = {'data': None, 'expires_at': 0}
+_stats_cache_lock = threading.Lock()
+
+def invalidate_stats_cache():
+    """Descarta estatísticas em cache (só deste processo)"""
+    with _stats_cache_lock:
+        _stats_cache['data'] = None
+        _stats_cache['expires_at'] = 0
+
+@event.listens_for(Session, 'after_flush')
+def _mark_stats_dirty(session, flush_context):
+    if any(isinstance(obj, STATS_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['stats_dirty'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('stats_dirty', False):
+        invalidate_stats_cache()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stats_mark(session):
+    session.info.pop('stats_dirty', None)
+
+@replica_safe
+def get_database_stats():
+    """Estatísticas de todas as tabelas (cache curto por processo)
+
+    Escritas deste processo (commit do ORM, lotes de status de invoice e o
+    arquivador) invalidam o cache na hora; escritas de outros workers não,
+    então os totais podem estar até DATABASE_STATS_TTL segundos atrasados.
+    """
+    now = time.time()
+    with _stats_cache_lock:
+        if _stats_cache['data'] is not None and now < _stats_cache['expires_at']:
+            return {**_stats_cache['data'], 'cached': True, 'queries': 0}
+    
+    with count_queries() as counter:
+        # Uma leitura dos rollups (pagamentos/assinaturas/dropship) + uma de marketing
+        rollups = get_stats_rollups()
+        stats = {
+            'payments': get_payment_stats(rollups),
+            'subscriptions': get_subscription_stats(rollups),
+            'dropship': get_dropship_stats(rollups),
+            'marketing': get_marketing_stats()
+        }
+    
+    with _stats_cache_lock:
+        _stats_cache['data'] = stats
+        _stats_cache['expires_at'] = now + DATABASE_STATS_TTL
+    
+    return {**stats, 'cached': False, 'queries': counter['queries']}
+
+def run_migrations(engine):
+    """Aplica migrações pendentes (ver src/models/migrations.py)"""
+    from src.models.migrations import run_migrations as _run_migrations
+    return _run_migrations(engine)
+
+# ============================================================================
+# 📜 HISTÓRICO PAGINADO (KEYSET)
+# ============================================================================
+
+def encode_cursor(created_at, payment_id):
+    """Cursor opaco com a posição (created_at, id) do último item da página"""
+    raw = f"{created_at.isoformat()}|{payment_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Cursor -> (created_at, id); ValueError se inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, payment_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(payment_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+def _payments_page_query(session, model, limit, cursor, status, currency, payment_type, customer_ref_id=None):
+    """Consulta keyset de uma partição (mesmos filtros nas duas tabelas)"""
+    query = session.query(model)
+    
+    if customer_ref_id is not None:
+        query = query.filter(model.customer_ref_id == customer_ref_id)
+    if status:
+        query = query.filter(model.status == status)
+    if currency:
+        query = query.filter(model.currency.in_([currency.lower(), currency.upper()]))
+    if payment_type:
+        query = query.filter(model.payment_type == payment_type)
+    if cursor:
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(*cursor))
+    
+    # Um item a mais indica se existe próxima página
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+@replica_safe
+def get_payments_page(limit=None, cursor=None, status=None, currency=None, payment_type=None, customer_email=None):
+    """Página de pagamentos do mais recente ao mais antigo
+    
+    Paginação por cursor em (created_at, id): cada página é uma busca no
+    índice a partir da última posição, sem OFFSET, com custo constante.
+    O arquivo só é consultado quando a página alcança a data dele.
+    """
+    limit = min(max(int(limit or PAYMENTS_PAGE_SIZE), 1), PAYMENTS_MAX_PAGE_SIZE)
+    position = decode_cursor(cursor) if cursor else None
+    
+    with read_session() as session:
+        customer_ref_id = None
+        if customer_email:
+            # Histórico do cliente pelo índice (customer_ref_id, created_at)
+            customer_ref_id = session.query(Customer.id).filter(Customer.email == normalize_email(customer_email)).scalar()
+            if customer_ref_id is None:
+                return {'payments': [], 'count': 0, 'limit': limit, 'has_more': False, 'next_cursor': None}
+        
+        filters = (status, currency, payment_type, customer_ref_id)
+        rows = _payments_page_query(session, Payment, limit, position, *filters)
+        
+        # Página cheia só com linhas mais novas que o arquivo: não toca a partição fria
+        newest_archived = get_archive_boundary(session)
+        if newest_archived is not None and (len(rows) <= limit or rows[-1].created_at <= newest_archived):
+            archived = _payments_page_query(session, PaymentArchive, limit, position, *filters)
+            rows = sorted(rows + archived, key=lambda row: (row.created_at, row.id), reverse=True)[:limit + 1]
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        payments = [payment.to_dict() for payment in rows]
+    
+    return {
+        'payments': payments,
+        'count': len(rows),
+        'limit': limit,
+        'has_more': has_more,
+        'next_cursor': encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    }
+
+def get_archive_boundary(session=None):
+    """created_at mais recente do arquivo (None se vazio)
+    
+    MAX na ponta do índice (created_at, id): uma busca, sem varrer o arquivo.
+    Lido a cada página para ver arquivamentos feitos por outros workers.
+    """
+    return (session or db.session).query(func.max(PaymentArchive.created_at)).scalar()
+
+def find_payment(payment_id=None, stripe_payment_id=None):
+    """Busca pagamento na partição quente e, se não achar, no arquivo"""
+    for model in (Payment, PaymentArchive):
+        query = model.query
+        if payment_id is not None:
+            query = query.filter(model.id == payment_id)
+        if stripe_payment_id is not None:
+            query = query.filter(model.stripe_payment_id == stripe_payment_id)
+        payment = query.first()
+        if payment is not None:
+            return payment
+    return None
+
+def register_commands(app):
+    """Comandos de manutenção (flask --app app_v2 <comando>)"""
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Recalcula os rollups de estatísticas a partir das tabelas"""
+        rollups = rebuild_stats_rollups()
+        for name, value in sorted(rollups.items()):
+            print(f"📊 {name}: {value}")
+    
+    @app.cli.command('archive-payments')
+    def archive_payments_command():
+        """Move pagamentos liquidados antigos para payments_archive"""
+        from src.models.archiver import archive_settled_payments
+        moved = archive_settled_payments(db.engine)
+        print(f"🗄️ {moved} pagamento(s) arquivado(s)")
+    
+    @app.cli.command('webhooks-drain')
+    def webhooks_drain_command():
+        """Processa agora os webhooks pendentes da fila"""
+        from src.models.webhook_queue import webhook_workers
+        webhook_workers.app, webhook_workers.engine = app, db.engine
+        processed = webhook_workers.drain()
+        print(f"📨 {processed} webhook(s) processado(s)")
+    
+    @app.cli.command('webhooks-requeue')
+    def webhooks_requeue_command():
+        """Devolve os webhooks da dead-letter para a fila"""
+        from src.models.webhook_queue import webhook_workers
+        webhook_workers.engine = db.engine
+        print(f"🔁 {webhook_workers.requeue_dead()} webhook(s) devolvido(s) para a fila")
+    
+    @app.cli.command('webhooks-purge-keys')
+    def webhooks_purge_keys_command():
+        """Apaga chaves de idempotência fora da janela de reenvio"""
+        from src.models.idempotency import idempotency_store
+        print(f"🧹 {idempotency_store.purge()} chave(s) de idempotência removida(s)")
+    
+    @app.cli.command('payouts-flush')
+    def payouts_flush_command():
+        """Envia agora um payout com todos os créditos pendentes"""
+        from src.models.payouts import payout_aggregator
+        payout_aggregator.engine = db.engine
+        sent = payout_aggregator.run_once(force=True)
+        print(f"💸 {sent} lote(s) de payout enviado(s)")
+    
+    @app.cli.command('payouts-status')
+    def payouts_status_command():
+        """Saldos pendentes, em envio e pagos do ledger de payouts"""
+        from src.models.payouts import payout_aggregator
+        payout_aggregator.engine = db.engine
+        for key, value in payout_aggregator.get_balances().items():
+            print(f"   {key}: {value}")
+    
+    @app.cli.command('payouts-retry')
+    @click.option('--unknown', is_flag=True, help="Inclui lotes 'unknown' (confira na BitPay antes)")
+    def payouts_retry_command(unknown):
+        """Devolve lotes de payout com falha para reenvio (mesma reference)"""
+        from src.models.payouts import payout_aggregator
+        payout_aggregator.engine = db.engine
+        print(f"🔁 {payout_aggregator.requeue_failed(include_unknown=unknown)} lote(s) devolvido(s) para envio")
+    
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Aplica migrações pendentes do schema"""
+        applied = run_migrations(db.engine)
+        print(f"✅ {len(applied)} migração(ões) aplicada(s): {', '.join(applied) or 'nenhuma pendente'}")
+
 def init_database(app):
     """Inicializa o banco de dados"""
     # Configura SQLite como fallback se não houver configuração
     if 'SQLALCHEMY_DATABASE_URI' not in app.config:
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bitcoin_payment.db'
+        app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL or 'sqlite:///bitcoin_payment.db'
     
+    # Perfil SQLite (WAL, busy_timeout...) e pool dimensionado
+    configure_app(app)
     db.init_app(app)
+    register_commands(app)
     
     with app.app_context():
         try:
+            configure_engines(db.engine)
+            configure_read_routing(db.engine)
             db.create_all()
+            run_migrations(db.engine)
+            if not StatsRollup.query.first():
+                rebuild_stats_rollups()
             print("✅ Banco de dados inicializado com sucesso!")
         except Exception as e:
             print(f"❌ Erro ao inicializar banco de dados: {e}")
+    
+    # Threads de escrita em lote (write-behind e commit em grupo)
+    from src.models.write_behind import start_write_behind
+    start_write_behind(app)
+    
+    # Arquivador de pagamentos liquidados antigos (se habilitado)
+    from src.models.archiver import start_archiver
+    start_archiver(app)
+    
+    # Workers da fila durável de webhooks
+    from src.models.webhook_queue import start_webhook_workers
+    start_webhook_workers(app)
+    
+    # Agregador de payouts em lote (se habilitado)
+    from src.models.payouts import start_payouts
+    start_payouts(app)
 
 # ============================================================================
 # 🆕 FUNÇÕES ADICIONAIS PARA APP_V2
@@ -247,8 +1102,12 @@ def init_database(app):
 def save_payment(payment_data: dict) -> Payment:
     """Salvar pagamento no banco de dados"""
     try:
+        # Pagamento BitPay não tem PaymentIntent: id próprio mantém a coluna única
+        invoice_id = payment_data.get('bitpay_invoice_id')
+        payment_id = payment_data.get('stripe_payment_intent_id') or (f"bitpay_{invoice_id}" if invoice_id else '')
+        
         payment = Payment(
-            stripe_payment_id=payment_data.get('stripe_payment_intent_id', ''),
+            stripe_payment_id=payment_id,
             customer_email=payment_data.get('customer_email', ''),
             customer_name=payment_data.get('customer_name', ''),
             amount=payment_data.get('amount', 0),
@@ -257,16 +1116,15 @@ def save_payment(payment_data: dict) -> Payment:
             btc_price=payment_data.get('btc_price'),
             conversion_fee=payment_data.get('conversion_fee'),
             payment_type=payment_data.get('payment_type', 'unique'),
-            status=payment_data.get('status', 'pending')
+            status=payment_data.get('status', 'pending'),
+            bitpay_invoice_id=invoice_id
         )
         
-        db.session.add(payment)
-        db.session.commit()
-        
-        return payment
+        # Durável antes de responder, mas requests simultâneos dividem o commit
+        from src.models.write_behind import commit_critical
+        return commit_critical(payment)
         
     except Exception as e:
-        db.session.rollback()
         print(f"Erro ao salvar pagamento: {e}")
         raise
 
@@ -274,7 +1132,8 @@ def save_subscription(subscription_data: dict) -> Subscription:
     """Salvar assinatura no banco de dados"""
     try:
         subscription = Subscription(
-            stripe_subscription_id=subscription_data.get('stripe_subscription_id', ''),
+            id=subscription_data.get('stripe_subscription_id', ''),
+            customer_id=subscription_data.get('customer_id', ''),
             customer_email=subscription_data.get('customer_email', ''),
             customer_name=subscription_data.get('customer_name', ''),
             amount=subscription_data.get('amount', 0),
@@ -282,12 +1141,9 @@ def save_subscription(subscription_data: dict) -> Subscription:
             status=subscription_data.get('status', 'active')
         )
         
-        db.session.add(subscription)
-        db.session.commit()
-        
-        return subscription
+        from src.models.write_behind import commit_critical
+        return commit_critical(subscription)
         
     except Exception as e:
-        db.session.rollback()
         print(f"Erro ao salvar assinatura: {e}")
         raise
@@ -0,0 +1,153 @@
+"""
+Idempotência de Webhooks
+Stripe e BitPay reenviam eventos; cada (provedor, id do evento) é aceito
+uma única vez. Um LRU limitado em memória responde reenvios recentes em
+O(1) e a tabela webhook_event_keys (chave primária) garante a regra entre
+processos e reinícios
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, event
+from sqlalchemy.exc import IntegrityError
+from src.config.settings import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_RETENTION_DAYS
+from src.models.database import db, WebhookEvent, WebhookEventKey
+
+class IdempotencyStore:
+    """LRU de chaves já vistas na frente de uma tabela indexada"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.engine = None
+
+        self.stats = {
+            'lookups': 0,
+            'lru_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'duplicates_rejected': 0,
+            'recorded': 0
+        }
+
+    def remember(self, key):
+        with self.lock:
+            self.cache[key] = True
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def _engine(self):
+        return self.engine or db.engine
+
+    def seen(self, provider, event_id):
+        """True se o evento já foi recebido (LRU primeiro, depois a chave primária)"""
+        key = (provider, event_id)
+        self.stats['lookups'] += 1
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats['lru_hits'] += 1
+                return True
+
+        table = WebhookEventKey.__table__
+        with self._engine().connect() as connection:
+            found = connection.execute(
+                select(table.c.provider).where(table.c.provider == provider, table.c.event_id == event_id)
+            ).first() is not None
+        if found:
+            self.stats['db_hits'] += 1
+            self.remember(key)
+        else:
+            self.stats['misses'] += 1
+        return found
+
+    def reject(self, provider, event_id):
+        """Conta um reenvio rejeitado e guarda a chave no LRU"""
+        self.stats['duplicates_rejected'] += 1
+        self.remember((provider, event_id))
+
+    def record(self, provider, event_id):
+        """Registra a chave na própria transação; False se já existia"""
+        try:
+            with self._engine().begin() as connection:
+                connection.execute(WebhookEventKey.__table__.insert().values(
+                    provider=provider, event_id=event_id, created_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            self.reject(provider, event_id)
+            return False
+        self.stats['recorded'] += 1
+        self.remember((provider, event_id))
+        return True
+
+    def forget(self, provider, event_id):
+        """Remove a chave (processamento inline falhou: o reenvio deve passar)"""
+        table = WebhookEventKey.__table__
+        with self.lock:
+            self.cache.pop((provider, event_id), None)
+        with self._engine().begin() as connection:
+            connection.execute(table.delete().where(table.c.provider == provider, table.c.event_id == event_id))
+
+    def purge(self, older_than_days=None):
+        """Apaga chaves mais antigas que a janela de reenvio dos provedores"""
+        days = IDEMPOTENCY_RETENTION_DAYS if older_than_days is None else older_than_days
+        table = WebhookEventKey.__table__
+        with self._engine().begin() as connection:
+            result = connection.execute(
+                table.delete().where(table.c.created_at < datetime.utcnow() - timedelta(days=days))
+            )
+        return result.rowcount
+
+    def get_stats(self):
+        lookups = self.stats['lookups']
+        return {
+            **self.stats,
+            'hit_rate': round((self.stats['lru_hits'] + self.stats['db_hits']) / lookups * 100, 2) if lookups else 0,
+            'lru_hit_rate': round(self.stats['lru_hits'] / lookups * 100, 2) if lookups else 0,
+            'cache_size': len(self.cache),
+            'cache_capacity': self.maxsize
+        }
+
+@event.listens_for(WebhookEvent, 'after_insert')
+def _record_event_key(mapper, connection, target):
+    """Chave gravada no mesmo flush do evento na fila
+
+    Evento e chave entram juntos ou nenhum entra: um reenvio simultâneo
+    falha na chave primária e o endpoint responde como duplicado.
+    """
+    if target.event_id:
+        connection.execute(WebhookEventKey.__table__.insert().values(
+            provider=target.provider, event_id=target.event_id, created_at=datetime.utcnow()
+        ))
+
+# Instância global
+idempotency_store = IdempotencyStore(maxsize=IDEMPOTENCY_CACHE_SIZE)
+
+def is_duplicate_event(provider, event_id):
+    """Verifica e contabiliza reenvio de evento já recebido"""
+    if not event_id:
+        return False
+    if idempotency_store.seen(provider, event_id):
+        idempotency_store.reject(provider, event_id)
+        return True
+    return False
+
+def claim_event(provider, event_id):
+    """Processamento inline: registra a chave; False se o evento é reenvio"""
+    if not event_id:
+        return True
+    if is_duplicate_event(provider, event_id):
+        return False
+    return idempotency_store.record(provider, event_id)
+
+def release_event(provider, event_id):
+    """Libera a chave de um evento cujo processamento inline falhou"""
+    if event_id:
+        idempotency_store.forget(provider, event_id)
+
+def get_idempotency_stats():
+    """Métricas do store de idempotência"""
+    return idempotency_store.get_stats()
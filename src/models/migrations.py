@@ -0,0 +1,239 @@
+"""
+Migrações de Schema - Versionadas
+create_all só cria tabelas novas; colunas e índices adicionados depois
+chegam aos bancos existentes (SQLite/PostgreSQL) por aqui, uma vez cada
+"""
+
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from src.models.database import (
+    db, Customer, Payment, PaymentArchive, Subscription, DropshipOrder, MarketingCampaign,
+    PayoutEntry, StatsRollup, MINOR_UNIT_COLUMNS, CUSTOMER_COLUMNS
+)
+from src.utils.money import MINOR_UNIT_DIGITS
+
+class SchemaMigration(db.Model):
+    """Migrações já aplicadas"""
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.name}>'
+
+def _create_indexes(connection, model, *names):
+    """Cria os índices declarados no modelo (se ainda não existirem)"""
+    indexes = {index.name: index for index in model.__table__.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+def _minor_scale(kind, has_currency):
+    """Expressão SQL do fator float -> menor unidade (minor_digits da moeda da linha)"""
+    if kind == 'btc':
+        return '100000000'
+    if not has_currency:
+        return '100'
+    cases = ' '.join(f"WHEN '{currency}' THEN {10 ** digits}" for currency, digits in MINOR_UNIT_DIGITS.items())
+    return f"(CASE UPPER(currency) {cases} ELSE 100 END)"
+
+def _minor_unit_columns(connection):
+    """Colunas em centavos/satoshis e preenchimento a partir dos floats"""
+    inspector = inspect(connection)
+    for model, columns in MINOR_UNIT_COLUMNS.items():
+        table = model.__tablename__
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for float_attr, int_attr, kind in columns:
+            if int_attr not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {int_attr} BIGINT"))
+
+            scale = _minor_scale(kind, 'currency' in existing)
+            connection.execute(text(
+                f"UPDATE {table} SET {int_attr} = CAST(ROUND({float_attr} * {scale}) AS BIGINT) "
+                f"WHERE {int_attr} IS NULL AND {float_attr} IS NOT NULL"
+            ))
+
+def _minor_units_by_currency(connection):
+    """Corrige o backfill antigo (sempre x100) das moedas com outra escala e zera os rollups"""
+    inspector = inspect(connection)
+    other_scales = ', '.join(f"'{currency}'" for currency, digits in MINOR_UNIT_DIGITS.items() if digits != 2)
+    models = {**MINOR_UNIT_COLUMNS, PaymentArchive: MINOR_UNIT_COLUMNS[Payment]}
+    for model, columns in models.items():
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        if 'currency' not in existing:
+            continue
+        for float_attr, int_attr, kind in columns:
+            if kind == 'btc':
+                continue
+            connection.execute(text(
+                f"UPDATE {table} SET {int_attr} = CAST(ROUND({float_attr} * {_minor_scale(kind, True)}) AS BIGINT) "
+                f"WHERE {float_attr} IS NOT NULL AND UPPER(currency) IN ({other_scales})"
+            ))
+
+    # Rollups agora são por moeda: o init_database recalcula logo após as migrações
+    if inspector.has_table(StatsRollup.__tablename__):
+        connection.execute(StatsRollup.__table__.delete())
+
+def _composite_indexes(connection):
+    """Índices para filtros de status/cliente ordenados por data"""
+    _create_indexes(connection, Payment, 'ix_payments_status_created_at', 'ix_payments_customer_email_created_at')
+    _create_indexes(connection, Subscription, 'ix_subscriptions_status_created_at', 'ix_subscriptions_customer_email_created_at')
+    _create_indexes(connection, DropshipOrder, 'ix_dropship_orders_status_created_at', 'ix_dropship_orders_customer_email_created_at')
+    _create_indexes(
+        connection, MarketingCampaign,
+        'ix_marketing_campaigns_opened_at', 'ix_marketing_campaigns_clicked_at',
+        'ix_marketing_campaigns_converted_at', 'ix_marketing_campaigns_target_email_sent_at'
+    )
+
+def _payments_keyset_index(connection):
+    """Índice para o histórico paginado por (created_at, id)"""
+    _create_indexes(connection, Payment, 'ix_payments_created_at_id')
+
+def _customers_table(connection):
+    """Tabela customers, FK customer_ref_id nas demais e backfill pelos emails"""
+    Customer.__table__.create(connection, checkfirst=True)
+    inspector = inspect(connection)
+    models = {**CUSTOMER_COLUMNS, PaymentArchive: CUSTOMER_COLUMNS[Payment]}
+    
+    # Um cliente por email (normalizado), nome mais recente de qualquer tabela
+    emails = []
+    for model, (email_attr, name_attr, _) in models.items():
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        if 'customer_ref_id' not in existing:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN customer_ref_id INTEGER REFERENCES customers(id)"))
+        date_column = 'sent_at' if model is MarketingCampaign else 'created_at'
+        emails.append(
+            f"SELECT LOWER(TRIM({email_attr})) AS email, {name_attr} AS name, {date_column} AS seen_at "
+            f"FROM {table} WHERE {email_attr} IS NOT NULL AND TRIM({email_attr}) <> ''"
+        )
+    
+    # Nome da linha com o seen_at mais recente (datas nulas por último em qualquer banco)
+    connection.execute(text(
+        "INSERT INTO customers (email, name, created_at, updated_at) "
+        "SELECT email, name, first_seen, last_seen FROM ("
+        "SELECT email, name, MIN(seen_at) OVER (PARTITION BY email) AS first_seen, "
+        "MAX(seen_at) OVER (PARTITION BY email) AS last_seen, "
+        "ROW_NUMBER() OVER (PARTITION BY email ORDER BY CASE WHEN seen_at IS NULL THEN 1 ELSE 0 END, seen_at DESC) AS recency "
+        f"FROM ({' UNION ALL '.join(emails)}) AS seen) AS ranked "
+        "WHERE recency = 1 AND email NOT IN (SELECT email FROM customers)"
+    ))
+    
+    # Id Stripe vindo da assinatura mais recente do cliente
+    connection.execute(text(
+        "UPDATE customers SET stripe_customer_id = ("
+        "SELECT s.customer_id FROM subscriptions s WHERE LOWER(TRIM(s.customer_email)) = customers.email "
+        "AND s.customer_id <> '' ORDER BY s.created_at DESC LIMIT 1) "
+        "WHERE stripe_customer_id IS NULL"
+    ))
+    
+    # FK por busca no índice único de email
+    for model, (email_attr, _, _) in models.items():
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        connection.execute(text(
+            f"UPDATE {table} SET customer_ref_id = (SELECT c.id FROM customers c "
+            f"WHERE c.email = LOWER(TRIM({table}.{email_attr}))) WHERE customer_ref_id IS NULL"
+        ))
+    
+    _create_indexes(connection, Payment, 'ix_payments_customer_ref_id_created_at')
+    _create_indexes(connection, PaymentArchive, 'ix_payments_archive_customer_ref_id_created_at')
+    _create_indexes(connection, Subscription, 'ix_subscriptions_customer_ref_id_created_at')
+    _create_indexes(connection, DropshipOrder, 'ix_dropship_orders_customer_ref_id_created_at')
+    _create_indexes(connection, MarketingCampaign, 'ix_marketing_campaigns_customer_ref_id_sent_at')
+
+def _bitpay_invoice_id(connection):
+    """Coluna/índice do id da invoice BitPay nos pagamentos (quente e arquivo)"""
+    inspector = inspect(connection)
+    for model, index in ((Payment, 'ix_payments_bitpay_invoice_id'), (PaymentArchive, 'ix_payments_archive_bitpay_invoice_id')):
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        if 'bitpay_invoice_id' not in existing:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN bitpay_invoice_id VARCHAR(100)"))
+        _create_indexes(connection, model, index)
+
+def _payout_ledger_invoice_id(connection):
+    """Fatura BitPay de cada crédito do ledger de payouts"""
+    inspector = inspect(connection)
+    table = PayoutEntry.__tablename__
+    if not inspector.has_table(table):
+        return
+    existing = {column['name'] for column in inspector.get_columns(table)}
+    if 'invoice_id' not in existing:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN invoice_id VARCHAR(100)"))
+
+# (versão, nome, função) - sempre acrescentar no final, nunca reordenar
+MIGRATIONS = [
+    (1, 'minor_unit_columns', _minor_unit_columns),
+    (2, 'composite_indexes', _composite_indexes),
+    (3, 'payments_keyset_index', _payments_keyset_index),
+    (4, 'customers_table', _customers_table),
+    (5, 'bitpay_invoice_id', _bitpay_invoice_id),
+    (6, 'minor_units_by_currency', _minor_units_by_currency),
+    (7, 'payout_ledger_invoice_id', _payout_ledger_invoice_id),
+    # Mesma correção da 6 para as moedas zero-decimal acrescentadas depois
+    (8, 'zero_decimal_currencies', _minor_units_by_currency),
+]
+
+def get_applied_versions(engine):
+    """Versões já aplicadas no banco"""
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(SchemaMigration.__table__.select().with_only_columns(SchemaMigration.version))}
+
+# Chave do advisory lock das migrações no PostgreSQL (int64 fixo)
+MIGRATION_LOCK_KEY = 7_202_604_019
+
+def run_migrations(engine):
+    """Aplica as migrações pendentes em ordem, cada uma em sua transação
+
+    No PostgreSQL um advisory lock serializa workers subindo ao mesmo tempo:
+    o segundo espera e encontra as versões já registradas.
+    """
+    if engine.dialect.name != 'postgresql':
+        return _apply_pending(engine)
+
+    with engine.connect() as lock_connection:
+        lock_connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        lock_connection.commit()
+        try:
+            return _apply_pending(engine)
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            lock_connection.commit()
+
+def _apply_pending(engine):
+    applied = get_applied_versions(engine)
+    executed = []
+
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+
+        try:
+            with engine.begin() as connection:
+                migrate(connection)
+                connection.execute(SchemaMigration.__table__.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+        except (IntegrityError, OperationalError, ProgrammingError):
+            # Outro worker aplicou a mesma migração ao mesmo tempo (versão
+            # repetida ou DDL já feita): só segue se ela foi mesmo registrada
+            if version in get_applied_versions(engine):
+                continue
+            raise
+
+        executed.append(name)
+        print(f"🗂️ Migração {version:03d} aplicada: {name}")
+
+    return executed
@@ -0,0 +1,472 @@
+"""
+Payouts em Lote
+Cada pagamento convertido vira um crédito em payout_ledger (único por
+pagamento de origem) e um único payout BitPay leva todos os créditos
+pendentes quando o total atinge PAYOUT_THRESHOLD_BTC ou o crédito mais
+antigo passa de PAYOUT_INTERVAL, em vez de um payout (e uma taxa de rede)
+por pagamento
+"""
+
+import atexit
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import requests
+from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from urllib3.exceptions import NewConnectionError
+from src.config.settings import (
+    DEBUG, PAYOUT_BATCHING_ENABLED, PAYOUT_THRESHOLD_BTC, PAYOUT_INTERVAL,
+    PAYOUT_CHECK_INTERVAL, PAYOUT_MAX_ATTEMPTS, PAYOUT_LEASE_SECONDS
+)
+from src.api.bitpay_handler import send_to_wallet, find_payout
+from src.models.database import db, PayoutBatch, PayoutEntry
+from src.utils.money import to_minor, to_sats, from_sats
+
+def credit_payout(connection, source, source_id, amount_sats, fiat_amount=None, currency=None):
+    """Credita o ledger na transação do chamador; False se o pagamento já tinha crédito"""
+    table = PayoutEntry.__table__
+    values = {
+        'source': source,
+        'source_id': source_id,
+        'amount_sats': amount_sats,
+        'fiat_amount_cents': to_minor(fiat_amount, currency) if fiat_amount is not None else None,
+        'currency': currency.upper() if currency else None,
+        'status': 'pending',
+        'created_at': datetime.utcnow()
+    }
+    if connection.dialect.name in ('postgresql', 'sqlite'):
+        # Worker repetindo o mesmo evento: o segundo INSERT não faz nada
+        dialect_insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+        statement = dialect_insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=['source', 'source_id']
+        )
+        return connection.execute(statement).rowcount == 1
+
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(**values))
+    except IntegrityError:
+        return False
+    return True
+
+def never_reached_provider(error):
+    """True se o erro garante que a BitPay não aceitou o POST (reenvio seguro)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and 400 <= error.response.status_code < 500
+    if isinstance(error, requests.ConnectionError):
+        # Só falha ao abrir a conexão; conexão caída no meio pode ter entregue o corpo
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+class PayoutAggregator:
+    """Thread que fecha lotes do ledger e envia um payout por lote
+
+    O crédito é único por pagamento de origem e cada crédito entra em um
+    único lote (UPDATE condicional em 'pending'); o lote é gravado como
+    'sending' antes da chamada à BitPay. Só erros que garantem que o POST
+    não foi aceito (conexão recusada, 4xx) são reenviados automaticamente,
+    e todo reenvio procura antes o payout pela reference. Timeout, 5xx ou
+    lease vencido (processo morreu no envio) deixam o resultado ambíguo: o
+    lote vai para 'unknown' e só sai de lá quando a reference aparece na
+    BitPay ou um operador manda reenviar (payouts-retry --unknown).
+    """
+
+    def __init__(self, threshold_sats, interval=3600, check_interval=30, max_attempts=5, lease_seconds=120):
+        self.threshold_sats = threshold_sats
+        self.interval = interval
+        self.check_interval = check_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.engine = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()
+
+        self.stats = {
+            'credits': 0,
+            'duplicate_credits': 0,
+            'batches_created': 0,
+            'batches_sent': 0,
+            'entries_paid': 0,
+            'send_errors': 0,
+            'batches_failed': 0,
+            'unknown': 0,
+            'reconciled': 0,
+            'lookup_errors': 0,
+            'last_run': None
+        }
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _engine(self):
+        return self.engine or db.engine
+
+    def start(self, engine):
+        if self.running:
+            return
+        self.engine = engine
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='payout-aggregator', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        if not self.running:
+            return
+        self.stop_event.set()
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+    def credit(self, source, source_id, amount_sats, fiat_amount=None, currency=None):
+        """Credita um pagamento convertido; acorda a thread se o limite foi atingido"""
+        entries = PayoutEntry.__table__
+        with self._engine().begin() as connection:
+            credited = credit_payout(connection, source, source_id, amount_sats, fiat_amount, currency)
+            pending = connection.execute(
+                select(func.coalesce(func.sum(entries.c.amount_sats), 0)).where(entries.c.status == 'pending')
+            ).scalar() if credited else 0
+
+        if not credited:
+            self.stats['duplicate_credits'] += 1
+            return False
+        self.stats['credits'] += 1
+        if pending >= self.threshold_sats:
+            self.wakeup.set()
+        return True
+
+    def invoice_for(self, source, source_id):
+        """Fatura já registrada no crédito (None se o crédito ainda não tem fatura)"""
+        entries = PayoutEntry.__table__
+        with self._engine().connect() as connection:
+            return connection.execute(
+                select(entries.c.invoice_id).where(entries.c.source == source, entries.c.source_id == source_id)
+            ).scalar()
+
+    def attach_invoice(self, source, source_id, invoice_id):
+        """Grava a fatura no crédito; False se outra chamada gravou antes"""
+        entries = PayoutEntry.__table__
+        with self._engine().begin() as connection:
+            return connection.execute(
+                update(entries)
+                .where(entries.c.source == source, entries.c.source_id == source_id, entries.c.invoice_id.is_(None))
+                .values(invoice_id=invoice_id)
+            ).rowcount == 1
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Erro no agregador de payouts: {e}")
+            self.wakeup.wait(self.check_interval)
+            self.wakeup.clear()
+
+    def run_once(self, force=False):
+        """Reconcilia lotes ambíguos, reenvia os seguros e fecha um novo lote se for a hora
+
+        Retorna quantos lotes passaram a 'sent'.
+        """
+        self.stats['last_run'] = datetime.utcnow().isoformat()
+        sent = 0
+        for batch_id in self._unresolved_batches():
+            sent += self._reconcile(batch_id)
+        for batch_id in self._retry_batches():
+            sent += self._send(batch_id)
+        if force or self._due():
+            batch_id = self._create_batch()
+            if batch_id is not None:
+                sent += self._send(batch_id)
+        return sent
+
+    def _due(self):
+        """Pendente atingiu o limite ou o crédito mais antigo passou do intervalo"""
+        entries = PayoutEntry.__table__
+        with self._engine().connect() as connection:
+            count, total, oldest = connection.execute(
+                select(func.count(), func.coalesce(func.sum(entries.c.amount_sats), 0), func.min(entries.c.created_at))
+                .where(entries.c.status == 'pending')
+            ).one()
+        if not count:
+            return False
+        return total >= self.threshold_sats or oldest <= datetime.utcnow() - timedelta(seconds=self.interval)
+
+    def _retry_batches(self):
+        """Lotes liberados para (re)envio: novos ou com erro anterior ao envio"""
+        batches = PayoutBatch.__table__
+        with self._engine().connect() as connection:
+            return connection.execute(
+                select(batches.c.id)
+                .where(batches.c.status == 'sending', batches.c.locked_until.is_(None))
+                .order_by(batches.c.id)
+            ).scalars().all()
+
+    def _unresolved_batches(self):
+        """Lotes de resultado ambíguo: 'unknown' ou em envio com lease vencido"""
+        batches = PayoutBatch.__table__
+        with self._engine().connect() as connection:
+            return connection.execute(
+                select(batches.c.id)
+                .where(or_(
+                    batches.c.status == 'unknown',
+                    and_(batches.c.status == 'sending', batches.c.locked_until < datetime.utcnow())
+                ))
+                .order_by(batches.c.id)
+            ).scalars().all()
+
+    def _create_batch(self):
+        """Move todos os créditos pendentes para um novo lote (uma transação)"""
+        batches, entries = PayoutBatch.__table__, PayoutEntry.__table__
+        with self._engine().begin() as connection:
+            batch_id = connection.execute(batches.insert().values(
+                reference=f"payout_{uuid.uuid4().hex}",
+                status='sending',
+                total_sats=0,
+                entries=0,
+                attempts=0,
+                created_at=datetime.utcnow()
+            )).inserted_primary_key[0]
+
+            # Condicional em 'pending': outro processo fechando lote ao mesmo tempo não pega os mesmos créditos
+            connection.execute(
+                update(entries).where(entries.c.status == 'pending').values(status='batched', batch_id=batch_id)
+            )
+            count, total = connection.execute(
+                select(func.count(), func.coalesce(func.sum(entries.c.amount_sats), 0))
+                .where(entries.c.batch_id == batch_id)
+            ).one()
+            if not count:
+                connection.execute(batches.delete().where(batches.c.id == batch_id))
+                return None
+            connection.execute(update(batches).where(batches.c.id == batch_id).values(total_sats=total, entries=count))
+
+        self.stats['batches_created'] += 1
+        return batch_id
+
+    def _mark_sent(self, batch, payout):
+        """Lote confirmado na BitPay: créditos pagos (uma vez, mesmo com reconciliações simultâneas)"""
+        batches, entries = PayoutBatch.__table__, PayoutEntry.__table__
+        with self._engine().begin() as connection:
+            marked = connection.execute(
+                update(batches).where(batches.c.id == batch.id, batches.c.status != 'sent').values(
+                    status='sent',
+                    payout_id=payout.get('id'),
+                    sent_at=datetime.utcnow(),
+                    locked_until=None,
+                    last_error=None
+                )
+            ).rowcount == 1
+            if not marked:
+                return 0
+            connection.execute(update(entries).where(entries.c.batch_id == batch.id).values(status='paid'))
+
+        self.stats['batches_sent'] += 1
+        self.stats['entries_paid'] += batch.entries
+        return 1
+
+    def _reconcile(self, batch_id):
+        """Procura o payout do lote pela reference; achou: 'sent', não achou: 'unknown'"""
+        batches = PayoutBatch.__table__
+        with self._engine().connect() as connection:
+            batch = connection.execute(select(batches).where(batches.c.id == batch_id)).one()
+
+        try:
+            payout = find_payout(batch.reference)
+        except Exception as e:
+            # BitPay indisponível: tenta reconciliar no próximo ciclo
+            self.stats['lookup_errors'] += 1
+            if DEBUG:
+                print(f"⚠️ Não foi possível consultar o payout {batch.reference}: {e}")
+            return 0
+
+        if payout is not None:
+            self.stats['reconciled'] += 1
+            return self._mark_sent(batch, payout)
+        if batch.status == 'sending' and batch.attempts == 0:
+            # Morreu antes do primeiro POST (attempts sobe antes do envio): reenvio seguro
+            with self._engine().begin() as connection:
+                connection.execute(
+                    update(batches)
+                    .where(batches.c.id == batch_id, batches.c.status == 'sending', batches.c.locked_until == batch.locked_until)
+                    .values(locked_until=None)
+                )
+        elif batch.status == 'sending':
+            with self._engine().begin() as connection:
+                connection.execute(
+                    update(batches)
+                    .where(batches.c.id == batch_id, batches.c.status == 'sending', batches.c.locked_until == batch.locked_until)
+                    .values(status='unknown', locked_until=None, last_error='Envio interrompido (lease vencido) sem payout na BitPay')
+                )
+            self.stats['unknown'] += 1
+            print(f"⚠️ Lote de payout {batch.reference} com resultado desconhecido: reconcilie antes de reenviar")
+        return 0
+
+    def _send(self, batch_id):
+        """Reserva o lote (lease), chama a BitPay e grava o resultado; 1 se enviado"""
+        batches = PayoutBatch.__table__
+        with self._engine().begin() as connection:
+            claimed = connection.execute(
+                update(batches)
+                .where(batches.c.id == batch_id, batches.c.status == 'sending', batches.c.locked_until.is_(None))
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+            ).rowcount == 1
+            if not claimed:
+                return 0
+            batch = connection.execute(select(batches).where(batches.c.id == batch_id)).one()
+
+        def release(**values):
+            with self._engine().begin() as connection:
+                connection.execute(update(batches).where(batches.c.id == batch_id).values(locked_until=None, **values))
+
+        if batch.attempts > 0:
+            # Já houve POST deste lote: a BitPay pode ter aceitado mesmo sem resposta
+            try:
+                payout = find_payout(batch.reference)
+            except Exception as e:
+                self.stats['lookup_errors'] += 1
+                release(last_error=f"{type(e).__name__}: {e}")
+                return 0
+            if payout is not None:
+                self.stats['reconciled'] += 1
+                return self._mark_sent(batch, payout)
+
+        with self._engine().begin() as connection:
+            connection.execute(update(batches).where(batches.c.id == batch_id).values(attempts=batches.c.attempts + 1))
+        attempts = batch.attempts + 1
+
+        start = time.perf_counter()
+        try:
+            payout = send_to_wallet(from_sats(batch.total_sats), reference=batch.reference)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            self.stats['send_errors'] += 1
+            if not never_reached_provider(e):
+                release(status='unknown', last_error=error)
+                self.stats['unknown'] += 1
+                print(f"⚠️ Payout do lote {batch.reference} com resultado desconhecido: {error}")
+            elif attempts >= self.max_attempts:
+                release(status='failed', last_error=error)
+                self.stats['batches_failed'] += 1
+                print(f"❌ Payout do lote {batch.reference} falhou após {attempts} tentativas: {error}")
+            else:
+                release(last_error=error)
+                print(f"❌ Payout do lote {batch.reference} recusado (tentativa {attempts}): {error}")
+            return 0
+
+        sent = self._mark_sent(batch, payout.get('data', {}))
+        if DEBUG:
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"💸 Payout de {from_sats(batch.total_sats)} BTC ({batch.entries} pagamentos) enviado em {elapsed:.0f}ms")
+        return sent
+
+    def requeue_failed(self, include_unknown=False):
+        """Devolve lotes para reenvio com a mesma reference
+
+        'failed' só tem recusas anteriores ao envio (tentativas zeradas).
+        'unknown' exige conferência do operador; as tentativas são mantidas
+        para o reenvio ainda procurar o payout pela reference antes do POST.
+        """
+        batches = PayoutBatch.__table__
+        with self._engine().begin() as connection:
+            result = connection.execute(
+                update(batches).where(batches.c.status == 'failed').values(status='sending', attempts=0, locked_until=None)
+            )
+            requeued = result.rowcount
+            if include_unknown:
+                requeued += connection.execute(
+                    update(batches).where(batches.c.status == 'unknown').values(status='sending', locked_until=None)
+                ).rowcount
+        self.wakeup.set()
+        return requeued
+
+    def get_balances(self):
+        """Saldos do ledger por estado (duas consultas agregadas)"""
+        batches, entries = PayoutBatch.__table__, PayoutEntry.__table__
+        with self._engine().connect() as connection:
+            ledger = connection.execute(
+                select(entries.c.status, func.count(), func.sum(entries.c.amount_sats), func.min(entries.c.created_at))
+                .group_by(entries.c.status)
+            ).all()
+            batch_rows = connection.execute(
+                select(batches.c.status, func.count(), func.sum(batches.c.total_sats)).group_by(batches.c.status)
+            ).all()
+
+        by_status = {status: (count, total or 0, oldest) for status, count, total, oldest in ledger}
+        count, total, oldest = by_status.get('pending', (0, 0, None))
+        in_flight = by_status.get('batched', (0, 0, None))
+        paid = by_status.get('paid', (0, 0, None))
+        batch_status = {status: (count, total or 0) for status, count, total in batch_rows}
+        return {
+            'pending_entries': count,
+            'pending_sats': total,
+            'pending_btc': from_sats(total),
+            'oldest_pending_age_s': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+            'in_flight_entries': in_flight[0],
+            'in_flight_btc': from_sats(in_flight[1]),
+            'failed_batches': batch_status.get('failed', (0, 0))[0],
+            'failed_btc': from_sats(batch_status.get('failed', (0, 0))[1]),
+            # Resultado ambíguo: precisa de reconciliação antes de qualquer reenvio
+            'unknown_batches': batch_status.get('unknown', (0, 0))[0],
+            'unknown_btc': from_sats(batch_status.get('unknown', (0, 0))[1]),
+            'paid_entries': paid[0],
+            'paid_btc': from_sats(paid[1]),
+            'batches_sent': batch_status.get('sent', (0, 0))[0]
+        }
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            # Chamadas de payout evitadas em relação a um payout por pagamento
+            'payout_calls_saved': self.stats['entries_paid'] - self.stats['batches_sent'],
+            'running': self.running,
+            'threshold_btc': from_sats(self.threshold_sats),
+            'interval_s': self.interval
+        }
+
+# Instância global
+payout_aggregator = PayoutAggregator(
+    threshold_sats=to_sats(PAYOUT_THRESHOLD_BTC),
+    interval=PAYOUT_INTERVAL,
+    check_interval=PAYOUT_CHECK_INTERVAL,
+    max_attempts=PAYOUT_MAX_ATTEMPTS,
+    lease_seconds=PAYOUT_LEASE_SECONDS
+)
+
+def start_payouts(app):
+    """Inicia o agregador de payouts (chamado pelo init_database)"""
+    if not PAYOUT_BATCHING_ENABLED:
+        return
+    with app.app_context():
+        engine = db.engine
+    payout_aggregator.start(engine)
+
+atexit.register(payout_aggregator.stop)
+
+def credit_converted_payment(source, source_id, amount_sats, fiat_amount=None, currency=None):
+    """Função de conveniência para creditar um pagamento convertido no ledger"""
+    return payout_aggregator.credit(source, source_id, amount_sats, fiat_amount, currency)
+
+def get_payout_invoice(source, source_id):
+    """Fatura BitPay registrada no crédito do pagamento (None se falta criar)"""
+    return payout_aggregator.invoice_for(source, source_id)
+
+def attach_payout_invoice(source, source_id, invoice_id):
+    """Registra a fatura BitPay no crédito do pagamento"""
+    return payout_aggregator.attach_invoice(source, source_id, invoice_id)
+
+def flush_payouts():
+    """Fecha e envia agora um lote com todos os créditos pendentes"""
+    return payout_aggregator.run_once(force=True)
+
+def get_payout_stats():
+    """Saldos pendentes e métricas dos payouts em lote"""
+    stats = payout_aggregator.get_stats()
+    if payout_aggregator.engine is not None:
+        stats['balances'] = payout_aggregator.get_balances()
+    return stats
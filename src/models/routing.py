@@ -0,0 +1,300 @@
+"""
+Roteamento Leitura/Escrita
+Escritas sempre no banco principal; leituras de endpoints e helpers
+marcados com @replica_safe vão para a réplica (segundo arquivo SQLite
+sincronizado localmente ou réplica PostgreSQL) enquanto a defasagem dela
+estiver dentro de READ_REPLICA_MAX_LAG
+"""
+
+import atexit
+import functools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from src.config.settings import (
+    DEBUG, DATABASE_READ_URL, READ_REPLICA_MAX_LAG, READ_YOUR_WRITES,
+    READ_REPLICA_LAG_CHECK_INTERVAL, READ_REPLICA_SYNC_INTERVAL,
+    SQLITE_PRODUCTION_PROFILE, SQLITE_BUSY_TIMEOUT_MS, DB_READ_POOL_SIZE,
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT
+)
+from src.models.sqlite_profile import is_sqlite_file, install_sqlite_pragmas
+
+# Defasagem medida na réplica PostgreSQL (0 se já reproduziu todo o WAL recebido)
+POSTGRES_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() IS NULL "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_routing = threading.local()
+
+def replica_safe(func):
+    """Marca endpoint/helper cujas leituras podem vir da réplica"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_routing, 'replica_safe', 0)
+        _routing.replica_safe = depth + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _routing.replica_safe = depth
+    return wrapper
+
+def in_replica_safe_context():
+    return getattr(_routing, 'replica_safe', 0) > 0
+
+def _sqlite_path(url):
+    return make_url(url).database
+
+class SQLiteReplicaSync:
+    """Réplica SQLite local: copia o arquivo principal pela API de backup
+
+    Substituto local de uma réplica real; cada cópia lê o banco inteiro,
+    então o intervalo deve crescer junto com o arquivo.
+    """
+
+    def __init__(self, source_path, replica_path, interval=1.0):
+        self.source_path = source_path
+        self.replica_path = replica_path
+        self.interval = interval
+        self.synced_at = None  # início da última cópia concluída (posição da réplica)
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stats = {'syncs': 0, 'errors': 0, 'last_sync_ms': 0}
+
+    def sync(self):
+        """Copia o banco principal para a réplica (uma transação de leitura)"""
+        started = time.time()
+        timeout = SQLITE_BUSY_TIMEOUT_MS / 1000
+        source = sqlite3.connect(self.source_path, timeout=timeout)
+        replica = sqlite3.connect(self.replica_path, timeout=timeout)
+        try:
+            source.backup(replica)
+        finally:
+            replica.close()
+            source.close()
+        self.synced_at = started
+        self.stats['syncs'] += 1
+        self.stats['last_sync_ms'] = round((time.time() - started) * 1000, 2)
+
+    def lag(self):
+        if self.synced_at is None:
+            return float('inf')
+        return time.time() - self.synced_at
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='replica-sync', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self.stats['errors'] += 1
+                if DEBUG:
+                    print(f"❌ Erro ao sincronizar réplica SQLite: {e}")
+            self.stop_event.wait(self.interval)
+
+class RoutingSession(Session):
+    """Sessão que lê no engine de leitura e grava (flush/DML) no principal"""
+
+    def __init__(self, write_engine, read_engine, **kwargs):
+        super().__init__(**kwargs)
+        self.write_engine = write_engine
+        self.read_engine = read_engine
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            return self.write_engine
+        return self.read_engine
+
+class ReadRouter:
+    """Escolhe o engine de cada leitura: réplica, leitura local ou principal"""
+
+    def __init__(self, max_lag=5.0, read_your_writes=True, lag_check_interval=1.0):
+        self.max_lag = max_lag
+        self.read_your_writes = read_your_writes
+        self.lag_check_interval = lag_check_interval
+        self.write_engine = None
+        self.local_engine = None  # mesmo banco, pool próprio (query_only no SQLite)
+        self.replica_engine = None
+        self.replica_sync = None
+        self.last_write_at = 0.0
+        self._lag = (0.0, float('inf'))  # (medido em, defasagem)
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'replica_reads': 0,
+            'primary_reads': 0,
+            'lag_fallbacks': 0,
+            'read_your_writes_fallbacks': 0
+        }
+
+    def configure(self, write_engine, replica_url=None):
+        """Cria o engine de leitura local e, se configurada, a réplica"""
+        self.write_engine = write_engine
+        self.local_engine = self._local_read_engine(write_engine)
+        # Toda transação confirmada no principal marca o momento da escrita
+        if not event.contains(write_engine, 'commit', self._record_write):
+            event.listen(write_engine, 'commit', self._record_write)
+
+        if replica_url and make_url(replica_url) != write_engine.url:
+            self.replica_engine = self._replica_engine(write_engine, replica_url)
+        return self
+
+    def _local_read_engine(self, write_engine):
+        url = write_engine.url
+        if not SQLITE_PRODUCTION_PROFILE or not is_sqlite_file(url):
+            # Memória/PostgreSQL: lê pelo engine principal
+            return write_engine
+
+        engine = create_engine(
+            url,
+            pool_size=DB_READ_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+        return install_sqlite_pragmas(engine, read_only=True)
+
+    def _replica_engine(self, write_engine, replica_url):
+        if is_sqlite_file(replica_url):
+            path = _sqlite_path(replica_url)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            if is_sqlite_file(write_engine.url):
+                # Segundo arquivo SQLite: sincronizado localmente a partir do principal
+                self.replica_sync = SQLiteReplicaSync(
+                    _sqlite_path(write_engine.url), path, interval=READ_REPLICA_SYNC_INTERVAL
+                )
+                self.replica_sync.start()
+            engine = create_engine(
+                replica_url,
+                pool_size=DB_READ_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT
+            )
+            return install_sqlite_pragmas(engine, read_only=True)
+
+        return create_engine(
+            replica_url,
+            pool_size=DB_READ_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+            execution_options={'postgresql_readonly': True}
+        )
+
+    def _record_write(self, connection):
+        self.last_write_at = time.time()
+
+    def replica_lag(self):
+        """Defasagem da réplica em segundos (medição reaproveitada por lag_check_interval)"""
+        if self.replica_engine is None:
+            return None
+        if self.replica_sync is not None:
+            return self.replica_sync.lag()
+
+        measured_at, lag = self._lag
+        if time.time() - measured_at < self.lag_check_interval:
+            return lag
+        with self._lock:
+            measured_at, lag = self._lag
+            if time.time() - measured_at >= self.lag_check_interval:
+                try:
+                    with self.replica_engine.connect() as connection:
+                        lag = float(connection.execute(text(POSTGRES_LAG_SQL)).scalar() or 0)
+                except Exception as e:
+                    lag = float('inf')
+                    if DEBUG:
+                        print(f"⚠️ Réplica indisponível, lendo do principal: {e}")
+                self._lag = (time.time(), lag)
+        return lag
+
+    def engine_for_read(self, replica_ok=None):
+        """Engine para a próxima leitura
+
+        A réplica só é usada em contexto replica-safe, com defasagem até
+        max_lag e (read-your-writes) já contendo a última escrita deste
+        processo; fora disso a leitura vai para o banco principal.
+        """
+        if replica_ok is None:
+            replica_ok = in_replica_safe_context()
+        local = self.local_engine or self.write_engine
+
+        if replica_ok and self.replica_engine is not None:
+            lag = self.replica_lag()
+            if lag > self.max_lag:
+                self.stats['lag_fallbacks'] += 1
+            elif self.read_your_writes and self.last_write_at > time.time() - lag:
+                self.stats['read_your_writes_fallbacks'] += 1
+            else:
+                self.stats['replica_reads'] += 1
+                return self.replica_engine
+
+        self.stats['primary_reads'] += 1
+        return local
+
+    def dispose(self):
+        if self.replica_sync is not None:
+            self.replica_sync.stop()
+
+    def get_stats(self):
+        lag = self.replica_lag()
+        stats = {
+            **self.stats,
+            'replica_configured': self.replica_engine is not None,
+            # None: sem réplica ou réplica ainda sem posição conhecida
+            'replica_lag_s': round(lag, 3) if lag is not None and lag != float('inf') else None,
+            'max_lag_s': self.max_lag,
+            'read_your_writes': self.read_your_writes
+        }
+        if self.replica_sync is not None:
+            stats['sync'] = dict(self.replica_sync.stats)
+        return stats
+
+# Instância global
+read_router = ReadRouter(
+    max_lag=READ_REPLICA_MAX_LAG,
+    read_your_writes=READ_YOUR_WRITES,
+    lag_check_interval=READ_REPLICA_LAG_CHECK_INTERVAL
+)
+
+atexit.register(read_router.dispose)
+
+def configure_read_routing(write_engine):
+    """Configura leitura local e réplica (chamado pelo init_database)"""
+    return read_router.configure(write_engine, DATABASE_READ_URL or None)
+
+@contextmanager
+def read_session(replica_ok=None):
+    """Sessão de leitura roteada (réplica em contexto replica-safe)"""
+    write_engine = read_router.write_engine
+    if write_engine is None:
+        from src.models.database import db
+        write_engine = db.engine
+    read_engine = read_router.engine_for_read(replica_ok) if read_router.write_engine else write_engine
+    session = RoutingSession(write_engine, read_engine)
+    try:
+        yield session
+    finally:
+        session.close()
+
+def get_routing_stats():
+    """Estatísticas do roteamento de leituras"""
+    return read_router.get_stats()
@@ -0,0 +1,72 @@
+"""
+Perfil SQLite de Produção
+PRAGMAs aplicados em toda conexão (WAL, synchronous=NORMAL, busy_timeout,
+mmap e cache) e pool dimensionado; o engine de leitura fica em
+src.models.routing
+"""
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from src.config.settings import (
+    SQLITE_PRODUCTION_PROFILE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_SYNCHRONOUS,
+    SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT
+)
+
+def is_sqlite_file(url):
+    """True para SQLite em arquivo (memória não tem WAL nem segundo engine)"""
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def sqlite_pragmas(read_only=False):
+    """PRAGMAs do perfil de produção"""
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}',
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+        f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+        # Negativo = tamanho em KiB (independe do page_size)
+        f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}',
+        'PRAGMA temp_store=MEMORY'
+    ]
+    if read_only:
+        pragmas.append('PRAGMA query_only=ON')
+    return pragmas
+
+def install_sqlite_pragmas(engine, read_only=False):
+    """Aplica os PRAGMAs em cada nova conexão do engine"""
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+def engine_options(url):
+    """Opções de pool para SQLALCHEMY_ENGINE_OPTIONS"""
+    if make_url(url).get_backend_name() == 'sqlite' and not is_sqlite_file(url):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': make_url(url).get_backend_name() != 'sqlite'
+    }
+
+def configure_app(app):
+    """Define pool do engine principal antes do db.init_app"""
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(url).items():
+        options.setdefault(key, value)
+
+def configure_engines(write_engine):
+    """PRAGMAs no engine principal (conexões já abertas são descartadas)"""
+    if SQLITE_PRODUCTION_PROFILE and is_sqlite_file(write_engine.url):
+        install_sqlite_pragmas(write_engine)
+        # Descarta conexões abertas antes do listener (ficariam sem os PRAGMAs)
+        write_engine.dispose()
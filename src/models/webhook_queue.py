@@ -0,0 +1,293 @@
+"""
+Fila Durável de Webhooks
+O endpoint só verifica a assinatura, grava o corpo em webhook_events e
+responde; um pool de workers processa os eventos com novas tentativas
+(backoff exponencial), dead-letter e métricas de profundidade da fila
+"""
+
+import atexit
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from src.config.settings import (
+    DEBUG, WEBHOOK_WORKERS, WEBHOOK_POLL_INTERVAL, WEBHOOK_MAX_ATTEMPTS,
+    WEBHOOK_RETRY_BACKOFF, WEBHOOK_RETRY_MAX_DELAY, WEBHOOK_LEASE_SECONDS
+)
+from src.models.database import db, WebhookEvent
+from src.models.idempotency import idempotency_store, is_duplicate_event
+
+# provider -> função(evento decodificado) que processa o evento
+_handlers = {}
+
+def register_webhook_handler(provider, handler):
+    """Registra o processador de eventos de um provedor"""
+    _handlers[provider] = handler
+
+def retry_delay(attempts, base=WEBHOOK_RETRY_BACKOFF, max_delay=WEBHOOK_RETRY_MAX_DELAY):
+    """Backoff exponencial com jitter (evita reprocessar tudo junto)"""
+    delay = min(max_delay, base * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+class WebhookWorkerPool:
+    """Workers que drenam webhook_events (seguro entre processos)"""
+
+    def __init__(self, workers=4, poll_interval=0.5, max_attempts=8, lease_seconds=300):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.app = None
+        self.engine = None
+        self.threads = []
+        self.running = False
+        self.wakeup = threading.Event()
+
+        self.stats = {
+            'enqueued': 0,
+            'duplicates': 0,
+            'processed': 0,
+            'retried': 0,
+            'dead_lettered': 0,
+            'claim_conflicts': 0,
+            'processing_ms_total': 0.0
+        }
+
+    def start(self, app, engine):
+        if self.running:
+            return
+        self.app = app
+        self.engine = engine
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self._run, name=f'webhook-worker-{n}', daemon=True)
+            for n in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def enqueue(self, provider, payload, event_id=None, event_type=None):
+        """Grava o evento de forma durável e devolve o id na fila
+
+        Retorna None para reenvio de evento já recebido (nada é gravado).
+        """
+        from src.models.write_behind import commit_critical
+
+        # Reenvio recente: rejeitado no LRU antes de qualquer escrita
+        if is_duplicate_event(provider, event_id):
+            self.stats['duplicates'] += 1
+            return None
+
+        try:
+            event = commit_critical(WebhookEvent(
+                provider=provider,
+                event_id=event_id,
+                event_type=event_type,
+                payload=payload.decode('utf-8') if isinstance(payload, bytes) else payload,
+                status='pending',
+                attempts=0,
+                next_attempt_at=datetime.utcnow(),
+                created_at=datetime.utcnow()
+            ))
+        except IntegrityError:
+            # Reenvio simultâneo: a chave de idempotência já foi gravada por outro request
+            idempotency_store.reject(provider, event_id)
+            self.stats['duplicates'] += 1
+            return None
+
+        if event_id:
+            idempotency_store.remember((provider, event_id))
+        self.stats['enqueued'] += 1
+        # Acorda um worker em vez de esperar o próximo poll
+        self.wakeup.set()
+        return event.id
+
+    def _available(self, table, now):
+        """Pendente e vencido, ou em processamento com lease expirado"""
+        return or_(
+            and_(table.c.status == 'pending', table.c.next_attempt_at <= now),
+            and_(table.c.status == 'processing', table.c.locked_until < now)
+        )
+
+    def claim(self):
+        """Reserva o próximo evento disponível (um UPDATE condicional)
+
+        Um único UPDATE é atômico no SQLite e, com a condição repetida fora
+        da subconsulta, só um worker (ou processo) ganha cada evento.
+        """
+        table = WebhookEvent.__table__
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        candidate = (
+            select(table.c.id)
+            .where(self._available(table, now))
+            .order_by(table.c.next_attempt_at, table.c.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(table)
+                .where(table.c.id == candidate, self._available(table, now))
+                .values(
+                    status='processing',
+                    claim_token=token,
+                    locked_until=now + timedelta(seconds=self.lease_seconds),
+                    attempts=table.c.attempts + 1
+                )
+            )
+            if result.rowcount != 1:
+                return None
+            return connection.execute(select(table).where(table.c.claim_token == token)).first()
+
+    def _finish(self, row, **values):
+        """Grava o resultado se o evento ainda é deste worker"""
+        table = WebhookEvent.__table__
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(table)
+                .where(table.c.id == row.id, table.c.claim_token == row.claim_token)
+                .values(claim_token=None, locked_until=None, **values)
+            )
+
+    def process(self, row):
+        """Processa um evento reservado: done, nova tentativa ou dead-letter"""
+        start = time.perf_counter()
+        try:
+            handler = _handlers.get(row.provider)
+            if handler is None:
+                raise LookupError(f"Sem processador para webhooks '{row.provider}'")
+            with self.app.app_context():
+                handler(json.loads(row.payload))
+
+            self._finish(row, status='done', processed_at=datetime.utcnow(), last_error=None)
+            self.stats['processed'] += 1
+            return True
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if row.attempts >= self.max_attempts:
+                self._finish(row, status='dead', last_error=error)
+                self.stats['dead_lettered'] += 1
+                print(f"☠️ Webhook {row.provider} {row.event_id} em dead-letter após {row.attempts} tentativas: {error}")
+            else:
+                next_attempt = datetime.utcnow() + timedelta(seconds=retry_delay(row.attempts))
+                self._finish(row, status='pending', next_attempt_at=next_attempt, last_error=error)
+                self.stats['retried'] += 1
+                if DEBUG:
+                    print(f"🔁 Webhook {row.provider} {row.event_id} falhou (tentativa {row.attempts}): {error}")
+            return False
+        finally:
+            self.stats['processing_ms_total'] += (time.perf_counter() - start) * 1000
+
+    def drain(self, limit=None):
+        """Processa eventos disponíveis na thread atual (CLI/testes)"""
+        processed = 0
+        while limit is None or processed < limit:
+            row = self.claim()
+            if row is None:
+                break
+            self.process(row)
+            processed += 1
+        return processed
+
+    def _run(self):
+        while self.running:
+            try:
+                row = self.claim()
+            except Exception as e:
+                # Disputa de lock com outro processo: tenta no próximo ciclo
+                row = None
+                self.stats['claim_conflicts'] += 1
+                if DEBUG:
+                    print(f"⚠️ Erro ao reservar webhook: {e}")
+
+            if row is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            self.process(row)
+
+    def requeue_dead(self, ids=None):
+        """Devolve eventos da dead-letter para a fila (zera as tentativas)"""
+        table = WebhookEvent.__table__
+        statement = update(table).where(table.c.status == 'dead')
+        if ids:
+            statement = statement.where(table.c.id.in_(ids))
+        with self.engine.begin() as connection:
+            result = connection.execute(statement.values(
+                status='pending', attempts=0, next_attempt_at=datetime.utcnow(), last_error=None
+            ))
+        self.wakeup.set()
+        return result.rowcount
+
+    def get_depth(self):
+        """Eventos por status e idade do pendente mais antigo (uma consulta)"""
+        table = WebhookEvent.__table__
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.status, func.count(), func.min(table.c.created_at)).group_by(table.c.status)
+            ).all()
+        depth = {status: count for status, count, _ in rows}
+        oldest = min((created for status, _, created in rows if status in ('pending', 'processing')), default=None)
+        return {
+            'pending': depth.get('pending', 0),
+            'processing': depth.get('processing', 0),
+            'done': depth.get('done', 0),
+            'dead': depth.get('dead', 0),
+            'oldest_pending_age_s': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0
+        }
+
+    def get_stats(self):
+        finished = self.stats['processed'] + self.stats['retried'] + self.stats['dead_lettered']
+        stats = {
+            **{key: value for key, value in self.stats.items() if key != 'processing_ms_total'},
+            'avg_processing_ms': round(self.stats['processing_ms_total'] / finished, 2) if finished else 0,
+            'running': self.running,
+            'workers': self.workers
+        }
+        if self.engine is not None:
+            stats['depth'] = self.get_depth()
+        return stats
+
+# Instância global
+webhook_workers = WebhookWorkerPool(
+    workers=WEBHOOK_WORKERS,
+    poll_interval=WEBHOOK_POLL_INTERVAL,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    lease_seconds=WEBHOOK_LEASE_SECONDS
+)
+
+def start_webhook_workers(app):
+    """Inicia os workers (chamado pelo init_database)"""
+    with app.app_context():
+        engine = db.engine
+    if WEBHOOK_WORKERS > 0:
+        webhook_workers.start(app, engine)
+    else:
+        # Sem workers neste processo: só enfileira (outro processo drena)
+        webhook_workers.app = app
+        webhook_workers.engine = engine
+
+atexit.register(webhook_workers.stop)
+
+def enqueue_webhook(provider, payload, event_id=None, event_type=None):
+    """Função de conveniência para enfileirar um webhook"""
+    return webhook_workers.enqueue(provider, payload, event_id, event_type)
+
+def get_webhook_queue_stats():
+    """Métricas da fila de webhooks"""
+    return webhook_workers.get_stats()
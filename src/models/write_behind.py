@@ -0,0 +1,579 @@
+"""
+Write-Behind - Escritas em Lote
+Escritas não críticas (contadores A/B, atualizações de status) entram numa
+fila limitada e são gravadas em lote por uma thread; pagamentos continuam
+síncronos, mas requests simultâneos compartilham um único commit
+"""
+
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from sqlalchemy import update, select
+from sqlalchemy.orm import Session
+from src.config.settings import (
+    DEBUG, WRITE_BEHIND_ENABLED, WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_ON_FULL, GROUP_COMMIT_ENABLED,
+    GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_BATCH, INVOICE_BATCH_WINDOW_MS,
+    INVOICE_BATCH_MAX
+)
+from src.models.database import (
+    db, SystemStats, Payment, PaymentArchive, ROLLUP_RULES, _rollup_delta, _apply_rollup_delta,
+    invalidate_stats_cache
+)
+
+def apply_stat_increment(session, stat_name, count=1, value=0, defaults=None):
+    """Soma contagem/valor em um SystemStats (cria se não existir)"""
+    stat = session.query(SystemStats).filter_by(stat_name=stat_name).first()
+    now = time.time()
+
+    if stat:
+        stat.stat_value += count
+        if value > 0:
+            data = dict(stat.stat_data or {})
+            data['total_value'] = data.get('total_value', 0) + value
+            data['last_conversion'] = now
+            # JSON precisa de novo objeto para o SQLAlchemy detectar a mudança
+            stat.stat_data = data
+    else:
+        stat = SystemStats(
+            stat_name=stat_name,
+            stat_value=count,
+            stat_data={
+                **(defaults or {}),
+                'total_value': value,
+                'first_conversion': now,
+                'last_conversion': now
+            }
+        )
+        session.add(stat)
+    return stat
+
+def apply_status_update(session, model, pk, status):
+    """Atualiza status de uma linha pelo id (ignora se não existir)"""
+    row = session.get(model, pk)
+    if row is not None:
+        row.status = status
+    return row
+
+class WriteBehindQueue:
+    """Fila limitada de escritas não críticas, gravadas em lote"""
+
+    def __init__(self, maxsize=10000, flush_interval=1.0, batch_size=500, on_full='block'):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.on_full = on_full
+        self.engine = None
+        self.thread = None
+        self.running = False
+        self.flush_lock = threading.Lock()
+
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'commits': 0,
+            'dropped': 0,
+            'sync_writes': 0,
+            'batch_fallbacks': 0,
+            'errors': 0,
+            'last_flush_ms': 0
+        }
+
+    def start(self, engine):
+        """Inicia a thread de flush usando o engine informado"""
+        if self.running:
+            return
+        self.engine = engine
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        """Para a thread gravando o que estiver na fila"""
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while self.running:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            # Primeiro item chegou: junta o que vier até o intervalo ou o lote encher
+            batch = [item]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.running = False
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _enqueue(self, op):
+        """Coloca operação na fila; sem thread ou com fila cheia aplica a política"""
+        if not self.running:
+            return self._write_sync([op])
+
+        try:
+            if self.on_full == 'block':
+                self.queue.put(op)
+            else:
+                self.queue.put_nowait(op)
+        except queue.Full:
+            if self.on_full == 'drop':
+                self.stats['dropped'] += 1
+                if DEBUG:
+                    print("⚠️ Fila write-behind cheia - escrita descartada")
+                return False
+            return self._write_sync([op])
+
+        self.stats['enqueued'] += 1
+        return True
+
+    def increment_stat(self, stat_name, count=1, value=0, defaults=None):
+        """Agenda incremento de contador em SystemStats"""
+        return self._enqueue(('stat', stat_name, count, value, defaults))
+
+    def update_status(self, model, pk, status):
+        """Agenda troca de status (a última escrita para a mesma linha vence)"""
+        return self._enqueue(('status', model, pk, status))
+
+    def _coalesce(self, batch):
+        """Agrupa incrementos do mesmo contador e status da mesma linha"""
+        stats = {}
+        statuses = {}
+        for op in batch:
+            if op[0] == 'stat':
+                _, stat_name, count, value, defaults = op
+                current = stats.setdefault(stat_name, [0, 0, defaults])
+                current[0] += count
+                current[1] += value
+            else:
+                _, model, pk, status = op
+                statuses[(model, pk)] = status
+        return stats, statuses
+
+    def _apply(self, session, batch):
+        stats, statuses = self._coalesce(batch)
+        for stat_name, (count, value, defaults) in stats.items():
+            apply_stat_increment(session, stat_name, count, value, defaults)
+        for (model, pk), status in statuses.items():
+            apply_status_update(session, model, pk, status)
+
+    def _groups(self, batch):
+        """Operações separadas pela linha que alteram (contador ou modelo/id)"""
+        groups = {}
+        for op in batch:
+            key = op[:2] if op[0] == 'stat' else op[:3]
+            groups.setdefault(key, []).append(op)
+        return list(groups.values())
+
+    def _commit_batch(self, batch):
+        with Session(self.engine) as session:
+            self._apply(session, batch)
+            session.commit()
+        self.stats['written'] += len(batch)
+        self.stats['commits'] += 1
+
+    def _write(self, batch):
+        """Grava o lote em uma transação (um commit/fsync para tudo)"""
+        start = time.perf_counter()
+        with self.flush_lock:
+            try:
+                self._commit_batch(batch)
+            except Exception:
+                # Uma operação inválida não derruba o lote: grava linha a linha
+                self.stats['batch_fallbacks'] += 1
+                for ops in self._groups(batch):
+                    try:
+                        self._commit_batch(ops)
+                    except Exception as e:
+                        self.stats['errors'] += 1
+                        target = ops[0][1] if ops[0][0] == 'stat' else f"{ops[0][1].__tablename__}:{ops[0][2]}"
+                        print(f"❌ Escrita write-behind descartada ({len(ops)} operações em {target}): {e}")
+            self.stats['batches'] += 1
+        self.stats['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _write_sync(self, batch):
+        """Escrita imediata (sem thread ou fila cheia)
+
+        Sessão própria, como no lote: o commit não leva junto mudanças
+        pendentes da sessão do request, e uma falha aqui não as desfaz.
+        """
+        try:
+            with Session(self.engine or db.engine) as session:
+                self._apply(session, batch)
+                session.commit()
+            self.stats['sync_writes'] += len(batch)
+            return True
+        except Exception as e:
+            self.stats['errors'] += 1
+            if DEBUG:
+                print(f"❌ Erro na escrita síncrona: {e}")
+            return False
+
+    def flush(self):
+        """Grava imediatamente tudo o que está na fila"""
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        if batch and self.engine is not None:
+            self._write(batch)
+        return len(batch)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'running': self.running,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'on_full': self.on_full
+        }
+
+class GroupCommitter:
+    """Commit em grupo: pagamentos de requests simultâneos em uma transação
+
+    Cada request continua esperando seu pagamento estar gravado (durável),
+    mas N requests dentro da janela custam um commit em vez de N.
+    """
+
+    def __init__(self, window_ms=2, max_batch=100):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        self.engine = None
+        self.thread = None
+        self.running = False
+
+        self.stats = {
+            'submitted': 0,
+            'commits': 0,
+            'batch_fallbacks': 0,
+            'errors': 0,
+            'max_batch_seen': 0
+        }
+
+    def start(self, engine):
+        if self.running:
+            return
+        self.engine = engine
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        if not self.running:
+            return
+        self.running = False
+        self.pending.put(None)
+        self.thread.join(timeout)
+
+    def submit(self, obj):
+        """Grava o objeto no próximo commit do grupo e espera o resultado"""
+        future = Future()
+        self.stats['submitted'] += 1
+        self.pending.put((obj, future))
+        return future.result(timeout=30)
+
+    def _run(self):
+        while self.running:
+            item = self.pending.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                try:
+                    item = self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.running = False
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+        # Encerrando: grava quem ainda está esperando
+        leftover = []
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftover.append(item)
+        if leftover:
+            self._commit(leftover)
+
+    def _commit(self, batch):
+        self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(batch))
+        try:
+            self._commit_objects(batch)
+        except Exception:
+            # Um objeto inválido não derruba o grupo: grava um a um
+            self.stats['batch_fallbacks'] += 1
+            for item in batch:
+                try:
+                    self._commit_objects([item])
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    item[1].set_exception(e)
+
+    def _commit_objects(self, batch):
+        # expire_on_commit=False: o request recebe o objeto com id preenchido
+        with Session(self.engine, expire_on_commit=False) as session:
+            session.add_all(obj for obj, _ in batch)
+            session.commit()
+            session.expunge_all()
+        self.stats['commits'] += 1
+        for obj, future in batch:
+            if not future.done():
+                future.set_result(obj)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'running': self.running,
+            'waiting': self.pending.qsize()
+        }
+
+# Transições de status por invoice BitPay: status novo <- status de onde pode vir.
+# Aplicadas nesta ordem; terminais (completed/failed) nunca regridem, então
+# eventos fora de ordem ou repetidos não desfazem o estado.
+INVOICE_TRANSITIONS = [
+    ('paid', ('pending',)),
+    ('completed', ('pending', 'paid')),
+    ('failed', ('pending', 'paid'))
+]
+
+class InvoiceStatusBatcher:
+    """UPDATEs de status em lote, chaveados por bitpay_invoice_id
+
+    Webhooks simultâneos entram na mesma janela e viram no máximo um
+    UPDATE por par (status de origem, status novo), com IN na lista de
+    invoices, em uma transação. Cada chamador espera o commit do lote.
+    """
+
+    def __init__(self, window_ms=20, max_batch=200):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        self.engine = None
+        self.thread = None
+        self.running = False
+
+        self.stats = {
+            'submitted': 0,
+            'batches': 0,
+            'statements': 0,
+            'rows_updated': 0,
+            'unmatched': 0,
+            'unknown_invoices': 0,
+            'errors': 0,
+            'max_batch_seen': 0
+        }
+
+    def start(self, engine):
+        if self.running:
+            return
+        self.engine = engine
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='invoice-status', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        if not self.running:
+            return
+        self.running = False
+        self.pending.put(None)
+        self.thread.join(timeout)
+
+    def submit(self, invoice_id, status):
+        """Agenda a transição e espera o lote
+
+        True se a linha mudou, False se o pagamento já está em estado
+        posterior e None se nenhum pagamento tem essa invoice.
+        """
+        self.stats['submitted'] += 1
+        if not self.running:
+            # Sem thread (CLI/testes): lote de um, na hora
+            return self.apply(self.engine or db.engine, [(invoice_id, status)])[invoice_id]
+
+        future = Future()
+        self.pending.put((invoice_id, status, future))
+        return future.result(timeout=30)
+
+    def _run(self):
+        while self.running:
+            item = self.pending.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                try:
+                    item = self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.running = False
+                    break
+                batch.append(item)
+
+            try:
+                results = self.apply(self.engine, [(invoice_id, status) for invoice_id, status, _ in batch])
+                for invoice_id, _, future in batch:
+                    future.set_result(results[invoice_id])
+            except Exception as e:
+                self.stats['errors'] += 1
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+    def apply(self, engine, transitions):
+        """Aplica o lote em uma transação, com rollups atualizados junto
+
+        UPDATE ... RETURNING devolve as linhas que mudaram; como cada
+        instrução tem um único status de origem, o delta dos rollups é exato.
+        """
+        self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(transitions))
+        requested = {}
+        for invoice_id, status in transitions:
+            requested.setdefault(status, set()).add(invoice_id)
+
+        table = Payment.__table__
+        rule, attrs = ROLLUP_RULES[Payment]
+        changed = set()
+        now = datetime.utcnow()
+
+        with engine.begin() as connection:
+            for new_status, from_statuses in INVOICE_TRANSITIONS:
+                invoice_ids = requested.get(new_status)
+                if not invoice_ids:
+                    continue
+                for old_status in from_statuses:
+                    rows = connection.execute(
+                        update(table)
+                        .where(table.c.bitpay_invoice_id.in_(invoice_ids), table.c.status == old_status)
+                        .values(status=new_status, updated_at=now)
+                        .returning(table.c.bitpay_invoice_id, *[table.c[attr] for attr in attrs if attr != 'status'])
+                    ).mappings().all()
+                    self.stats['statements'] += 1
+
+                    delta = {}
+                    for row in rows:
+                        changed.add(row['bitpay_invoice_id'])
+                        old = rule(lambda attr: old_status if attr == 'status' else row[attr])
+                        new = rule(lambda attr: new_status if attr == 'status' else row[attr])
+                        for name, value in _rollup_delta(old, new).items():
+                            delta[name] = delta.get(name, 0) + value
+                    if delta:
+                        _apply_rollup_delta(connection, delta)
+                    self.stats['rows_updated'] += len(rows)
+
+            # Sem mudança: pagamento já em estado posterior ou ainda não gravado?
+            unmatched = {invoice_id for invoice_id, _ in transitions if invoice_id not in changed}
+            known = set()
+            if unmatched:
+                for model in (Payment, PaymentArchive):
+                    model_table = model.__table__
+                    known.update(connection.execute(
+                        select(model_table.c.bitpay_invoice_id).where(model_table.c.bitpay_invoice_id.in_(unmatched))
+                    ).scalars())
+
+        self.stats['batches'] += 1
+        if changed:
+            invalidate_stats_cache()
+        results = {
+            invoice_id: True if invoice_id in changed else (False if invoice_id in known else None)
+            for invoice_id, _ in transitions
+        }
+        self.stats['unmatched'] += sum(1 for matched in results.values() if matched is False)
+        self.stats['unknown_invoices'] += sum(1 for matched in results.values() if matched is None)
+        return results
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'running': self.running,
+            'waiting': self.pending.qsize()
+        }
+
+# Instâncias globais
+write_behind = WriteBehindQueue(
+    maxsize=WRITE_BEHIND_QUEUE_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    on_full=WRITE_BEHIND_ON_FULL
+)
+group_committer = GroupCommitter(window_ms=GROUP_COMMIT_WINDOW_MS, max_batch=GROUP_COMMIT_MAX_BATCH)
+invoice_status = InvoiceStatusBatcher(window_ms=INVOICE_BATCH_WINDOW_MS, max_batch=INVOICE_BATCH_MAX)
+
+def start_write_behind(app):
+    """Inicia as threads de escrita (chamado pelo init_database)"""
+    with app.app_context():
+        engine = db.engine
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start(engine)
+    if GROUP_COMMIT_ENABLED:
+        group_committer.start(engine)
+        invoice_status.start(engine)
+
+def stop_write_behind():
+    """Grava pendências e para as threads"""
+    invoice_status.stop()
+    group_committer.stop()
+    write_behind.stop()
+
+atexit.register(stop_write_behind)
+
+def commit_critical(obj):
+    """Grava objeto crítico de forma durável (commit em grupo se ativo)"""
+    if group_committer.running:
+        return group_committer.submit(obj)
+
+    try:
+        db.session.add(obj)
+        db.session.commit()
+        return obj
+    except Exception:
+        db.session.rollback()
+        raise
+
+def update_invoice_status(invoice_id, status):
+    """Transição de status do pagamento da invoice (lote com webhooks simultâneos)
+
+    True: mudou; False: já em estado posterior; None: invoice sem pagamento.
+    """
+    return invoice_status.submit(invoice_id, status)
+
+def get_write_behind_stats():
+    """Estatísticas da fila, do commit em grupo e dos lotes de invoices"""
+    return {
+        'write_behind': write_behind.get_stats(),
+        'group_commit': group_committer.get_stats(),
+        'invoice_status': invoice_status.get_stats()
+    }
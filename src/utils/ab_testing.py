@@ -9,6 +9,7 @@ import time
 from flask import session, request
 from src.config.settings import DEBUG
 from src.models.database import SystemStats, db
+from src.models.write_behind import write_behind
 
 class ABTesting:
     """Sistema de A/B testing para otimização"""
@@ -100,36 +101,13 @@ class ABTesting:
             
             variant = session.get('ab_tests', {}).get(experiment_name, 'A')
             
-            # Salva no banco de dados
+            # Contador gravado em lote pela fila write-behind (sem commit por evento)
             stat_name = f"ab_test_{experiment_name}_{variant}_{event_type}"
-            
-            # Busca estatística existente
-            stat = SystemStats.query.filter_by(stat_name=stat_name).first()
-            
-            if stat:
-                # Atualiza valor existente
-                stat.stat_value += 1
-                if value > 0:
-                    stat.stat_data = stat.stat_data or {}
-                    stat.stat_data['total_value'] = stat.stat_data.get('total_value', 0) + value
-                    stat.stat_data['last_conversion'] = time.time()
-            else:
-                # Cria nova estatística
-                stat = SystemStats(
-                    stat_name=stat_name,
-                    stat_value=1,
-                    stat_data={
-                        'experiment': experiment_name,
-                        'variant': variant,
-                        'event_type': event_type,
-                        'total_value': value,
-                        'first_conversion': time.time(),
-                        'last_conversion': time.time()
-                    }
-                )
-                db.session.add(stat)
-            
-            db.session.commit()
+            write_behind.increment_stat(stat_name, 1, value, defaults={
+                'experiment': experiment_name,
+                'variant': variant,
+                'event_type': event_type
+            })
             
             if DEBUG:
                 print(f"📊 Conversão registrada: {experiment_name} - {variant} - {event_type}")
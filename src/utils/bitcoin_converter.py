@@ -1,36 +1,76 @@
-import requests
-import time
-from src.config.settings import CONVERSION_FEE, COINGECKO_API_URL
+from collections import defaultdict
+from src.config.settings import CONVERSION_FEE, COINGECKO_API_URL, PRICE_CACHE_TTL, PRICE_CACHE_TTLS, PRICE_CURRENCIES
+from src.utils.http_client import http_client
+from src.utils.price_cache import PriceCache
+from src.utils.shared_price_store import get_shared_price_store
+from src.utils.price_history import price_history
+from src.utils.single_flight import get_single_flight_stats
+from src.utils.money import to_minor, from_minor, from_sats, fee_to_bps, apply_fee, fiat_to_sats, minor_digits, SATOSHIS_PER_BTC, BASIS_POINTS
 
-# Cache para preços
-_price_cache = {'brl': None, 'usd': None, 'timestamp': 0}
+# NumPy é opcional: acelera conversões em lote, sem ele usa Python puro
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _fetch_bitcoin_prices(currencies, timeout=None):
+    """Busca preços do Bitcoin em várias moedas com uma única chamada à CoinGecko"""
+    url = f"{COINGECKO_API_URL}/simple/price?ids=bitcoin&vs_currencies={','.join(currencies)}"
+    # Com timeout (deadline do agregador) a chamada não repete: o prazo é de uma tentativa
+    response = http_client.get(url, timeout=timeout, retries=0) if timeout else http_client.get(url)
+    response.raise_for_status()
+    return response.json()['bitcoin']
+
+# Taxa de conversão em basis points (aritmética inteira)
+CONVERSION_FEE_BPS = fee_to_bps(CONVERSION_FEE)
+
+# Cache por moeda com stale-while-revalidate
+_price_cache = PriceCache(
+    _fetch_bitcoin_prices,
+    ttl=PRICE_CACHE_TTL,
+    ttls=PRICE_CACHE_TTLS,
+    currencies=PRICE_CURRENCIES,
+    store=get_shared_price_store(),
+    history=price_history
+)
+
+def _fallback_price(currency):
+    """Preço de fallback se a API falhar"""
+    return 200000.0 if currency.lower() == 'brl' else 50000.0
 
 def get_bitcoin_price(currency='brl'):
     """Obtém preço do Bitcoin via CoinGecko com cache"""
-    if time.time() - _price_cache['timestamp'] < 300:  # Cache 5 min
-        return _price_cache[currency]
-    
     try:
-        url = f"{COINGECKO_API_URL}/simple/price?ids=bitcoin&vs_currencies={currency}"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        price = response.json()['bitcoin'][currency]
-        
-        # Atualiza cache
-        _price_cache[currency] = price
-        _price_cache['timestamp'] = time.time()
-        
-        return price
+        return _price_cache.get(currency)
     except Exception as e:
         # Fallback se API falhar
-        return 200000.0 if currency == 'brl' else 50000.0
+        return _fallback_price(currency)
+
+def get_bitcoin_prices(currencies=None):
+    """Obtém preços do Bitcoin em várias moedas (uma chamada para todas)"""
+    currencies = [c.lower() for c in (currencies or PRICE_CURRENCIES)]
+    try:
+        return _price_cache.get_many(currencies)
+    except Exception as e:
+        return {currency: _fallback_price(currency) for currency in currencies}
+
+def get_price_cache_stats():
+    """Retorna estatísticas do cache de preços"""
+    return {
+        **_price_cache.get_stats(),
+        'single_flight': get_single_flight_stats()
+    }
+
+def convert_fiat_to_btc_sats(amount, currency='brl'):
+    """Converte fiat para satoshis aplicando taxa (centavos/satoshis em int)"""
+    price = get_bitcoin_price(currency)
+    _, net = apply_fee(to_minor(amount, currency), CONVERSION_FEE_BPS)
+    return fiat_to_sats(net, to_minor(price, currency))
 
 def convert_fiat_to_btc(amount, currency='brl'):
     """Converte fiat para Bitcoin aplicando taxa"""
     try:
-        price = get_bitcoin_price(currency)
-        btc = amount / price
-        return btc * (1 - CONVERSION_FEE)  # Aplica taxa de conversão
+        return from_sats(convert_fiat_to_btc_sats(amount, currency))
     except Exception as e:
         raise ValueError(f"Erro na conversão: {str(e)}")
 
@@ -45,19 +85,18 @@ def get_conversion_preview(amount, currency='brl'):
     """Retorna preview da conversão"""
     try:
         price = get_bitcoin_price(currency)
-        fee_amount = amount * CONVERSION_FEE
-        amount_after_fee = amount - fee_amount
-        btc_amount = amount_after_fee / price
+        fee_minor, net_minor = apply_fee(to_minor(amount, currency), CONVERSION_FEE_BPS)
+        satoshis = fiat_to_sats(net_minor, to_minor(price, currency))
         
         return {
             'success': True,
             'original_amount': amount,
             'currency': currency.upper(),
             'btc_price': price,
-            'fee_amount': fee_amount,
-            'amount_after_fee': amount_after_fee,
-            'btc_amount': btc_amount,
-            'btc_amount_satoshi': int(btc_amount * 100000000)
+            'fee_amount': from_minor(fee_minor, currency),
+            'amount_after_fee': from_minor(net_minor, currency),
+            'btc_amount': from_sats(satoshis),
+            'btc_amount_satoshi': satoshis
         }
     except Exception as e:
         return {
@@ -65,40 +104,139 @@ def get_conversion_preview(amount, currency='brl'):
             'error': str(e)
         }
 
-def compare_exchanges():
+def _group_by_currency(amounts, currencies):
+    """Agrupa índices dos valores por moeda"""
+    if isinstance(currencies, str):
+        currencies = [currencies] * len(amounts)
+    if len(currencies) != len(amounts):
+        raise ValueError("amounts e currencies devem ter o mesmo tamanho")
+
+    groups = defaultdict(list)
+    for index, currency in enumerate(currencies):
+        groups[currency.lower()].append(index)
+    return groups
+
+def _convert_group(amounts, price, currency):
+    """Calcula taxa, valor líquido e satoshis de um grupo (inteiros na menor unidade)"""
+    price_minor = to_minor(price, currency)
+    if price_minor <= 0:
+        raise ValueError("Preço BTC inválido")
+
+    if np is not None:
+        minor = np.rint(np.asarray(amounts, dtype=np.float64) * 10 ** minor_digits(currency)).astype(np.int64)
+        fees = (minor * CONVERSION_FEE_BPS + BASIS_POINTS // 2) // BASIS_POINTS
+        net = minor - fees
+        satoshis = net * SATOSHIS_PER_BTC // price_minor
+        return fees.tolist(), net.tolist(), satoshis.tolist()
+
+    fees, net = zip(*(apply_fee(to_minor(amount, currency), CONVERSION_FEE_BPS) for amount in amounts))
+    satoshis = [fiat_to_sats(value, price_minor) for value in net]
+    return list(fees), list(net), satoshis
+
+def convert_fiat_to_btc_batch(amounts, currencies='brl'):
+    """Converte vários valores para Bitcoin (um preço por moeda, cálculo vetorizado)"""
+    amounts = list(amounts)
+    groups = _group_by_currency(amounts, currencies)
+    prices = get_bitcoin_prices(list(groups))
+
+    result = [0.0] * len(amounts)
+    for currency, indexes in groups.items():
+        _, _, satoshis = _convert_group([amounts[i] for i in indexes], prices[currency], currency)
+        for i, value in zip(indexes, satoshis):
+            result[i] = from_sats(value)
+    return result
+
+def get_conversion_preview_batch(amounts, currencies='brl'):
+    """Retorna preview da conversão de vários valores em uma chamada"""
+    try:
+        amounts = [float(amount) for amount in amounts]
+        groups = _group_by_currency(amounts, currencies)
+        prices = get_bitcoin_prices(list(groups))
+
+        previews = [None] * len(amounts)
+        totals = {}
+        for currency, indexes in groups.items():
+            price = prices[currency]
+            group_amounts = [amounts[i] for i in indexes]
+            fees, net, satoshis = _convert_group(group_amounts, price, currency)
+
+            for pos, i in enumerate(indexes):
+                previews[i] = {
+                    'original_amount': group_amounts[pos],
+                    'currency': currency.upper(),
+                    'btc_price': price,
+                    'fee_amount': from_minor(fees[pos], currency),
+                    'amount_after_fee': from_minor(net[pos], currency),
+                    'btc_amount': from_sats(satoshis[pos]),
+                    'btc_amount_satoshi': satoshis[pos]
+                }
+
+            # Totais somados em inteiros: exatos
+            total_fees = sum(fees)
+            total_sats = sum(satoshis)
+            totals[currency.upper()] = {
+                'count': len(indexes),
+                'original_amount': from_minor(total_fees + sum(net), currency),
+                'fee_amount': from_minor(total_fees, currency),
+                'btc_amount': from_sats(total_sats),
+                'btc_amount_satoshi': total_sats
+            }
+
+        return {
+            'success': True,
+            'count': len(previews),
+            'prices': {currency.upper(): price for currency, price in prices.items()},
+            'previews': previews,
+            'totals': totals
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+# Nome e taxa (%) de cada fonte de preço
+EXCHANGE_INFO = {
+    'coingecko': {'name': 'CoinGecko', 'fee': 0.0},
+    'binance': {'name': 'Binance', 'fee': 0.1},
+    'coinbase': {'name': 'Coinbase', 'fee': 0.5},
+    'bitpay': {'name': 'BitPay', 'fee': 1.0}
+}
+
+def compare_exchanges(currency='usd', quote=None):
     """Compara preços entre diferentes exchanges"""
     try:
-        # Preços de diferentes fontes
-        coingecko_price = get_bitcoin_price('usd')
+        from src.utils.price_aggregator import get_aggregated_price
         
-        # Simular preços de outras exchanges (em produção, usar APIs reais)
-        binance_price = coingecko_price * 0.999  # Binance geralmente tem preços ligeiramente menores
-        coinbase_price = coingecko_price * 1.001  # Coinbase geralmente tem preços ligeiramente maiores
+        # Preços reais de todas as fontes, consultadas em paralelo
+        quote = quote or get_aggregated_price(currency)
         
-        return {
-            'coingecko': {
-                'price': coingecko_price,
-                'name': 'CoinGecko',
-                'fee': 0.0
-            },
-            'binance': {
-                'price': binance_price,
-                'name': 'Binance',
-                'fee': 0.1
-            },
-            'coinbase': {
-                'price': coinbase_price,
-                'name': 'Coinbase',
-                'fee': 0.5
-            },
-            'best_price': {
-                'exchange': 'binance',
-                'price': binance_price,
-                'savings': coingecko_price - binance_price
+        comparison = {}
+        available = {}
+        for source, info in quote['sources'].items():
+            comparison[source] = {
+                'price': info.get('price'),
+                'name': EXCHANGE_INFO.get(source, {}).get('name', source),
+                'fee': EXCHANGE_INFO.get(source, {}).get('fee', 0.0),
+                'status': info['status'],
+                'age_seconds': info.get('age_seconds')
             }
-        }
+            if info['status'] == 'ok':
+                available[source] = info['price']
+        
+        if available:
+            best = min(available, key=available.get)
+            comparison['best_price'] = {
+                'exchange': best,
+                'price': available[best],
+                'savings': max(available.values()) - available[best]
+            }
+        
+        comparison['median_price'] = quote['price']
+        comparison['prices'] = get_bitcoin_prices()
+        return comparison
     except Exception as e:
         return {
             'error': str(e),
             'coingecko': {'price': 50000, 'name': 'CoinGecko', 'fee': 0.0}
-        }
\ No newline at end of file
+        }
@@ -3,7 +3,7 @@ Integração Dropshipping - Sistema Hacker
 Conecta com Shopify e converte vendas para Bitcoin automaticamente
 """
 
-import requests
+from src.utils.http_client import http_client
 import time
 import random
 from src.config.settings import DEBUG
@@ -82,10 +82,10 @@ class DropshipIntegration:
             
             if DEBUG:
                 print(f"🛍️ Buscando pedidos Shopify...")
-                # Simula resposta (em produção, use requests.get)
+                # Simula resposta (em produção, usa http_client.get)
                 return self._simulate_shopify_orders()
             
-            response = requests.get(url, headers=headers, params=params)
+            response = http_client.get(url, headers=headers, params=params)
             response.raise_for_status()
             return response.json()
             
@@ -0,0 +1,157 @@
+"""
+HTTP Client - Conexões Compartilhadas
+Um pool keep-alive por host para todas as chamadas externas (CoinGecko,
+BitPay, Binance, OneSignal...), com timeouts padrão, retry com backoff
+aleatório para métodos idempotentes e latência por host
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from src.config.settings import (
+    DEBUG, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES,
+    HTTP_BACKOFF, HTTP_POOL_SIZE
+)
+
+# Métodos que podem ser repetidos sem efeito colateral duplicado
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Status que valem nova tentativa
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class HttpClient:
+    """Cliente HTTP com sessão keep-alive por host"""
+
+    def __init__(self, timeout=(3.05, 10), max_retries=2, backoff=0.2, pool_size=10):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _session(self, host):
+        """Sessão do host (criada na primeira chamada)"""
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.sessions[host] = session
+            return session
+
+    def _host_stats(self, host):
+        """Contadores do host (chamar com lock)"""
+        stats = self.stats.get(host)
+        if stats is None:
+            stats = self.stats[host] = {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'total_seconds': 0.0,
+                'latencies': deque(maxlen=500)
+            }
+        return stats
+
+    def _record(self, host, elapsed, error=False, retry=False):
+        with self.lock:
+            stats = self._host_stats(host)
+            stats['requests'] += 1
+            stats['total_seconds'] += elapsed
+            stats['latencies'].append(elapsed)
+            if error:
+                stats['errors'] += 1
+            if retry:
+                stats['retries'] += 1
+
+    def _sleep_backoff(self, attempt):
+        """Backoff exponencial com jitter completo"""
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, url, retries=None, idempotent=None, **kwargs):
+        """Executa request; repete falhas de rede/5xx só se idempotente"""
+        method = method.upper()
+        host = urlsplit(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        if retries is None:
+            retries = self.max_retries
+        if not idempotent:
+            retries = 0
+
+        session = self._session(host)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                elapsed = time.perf_counter() - start
+                if attempt >= retries:
+                    self._record(host, elapsed, error=True)
+                    raise
+                self._record(host, elapsed, error=True, retry=True)
+            else:
+                elapsed = time.perf_counter() - start
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    self._record(host, elapsed, error=response.status_code >= 500)
+                    return response
+                self._record(host, elapsed, error=True, retry=True)
+                response.close()
+
+            if DEBUG:
+                print(f"🔁 Repetindo {method} {host} (tentativa {attempt + 2})")
+            self._sleep_backoff(attempt)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """Fecha todas as sessões"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+    def get_stats(self):
+        """Latência e erros por host"""
+        with self.lock:
+            hosts = {}
+            for host, stats in self.stats.items():
+                ordered = sorted(stats['latencies'])
+                pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000 if ordered else 0
+                hosts[host] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                    'avg_ms': round(stats['total_seconds'] / stats['requests'] * 1000, 2) if stats['requests'] else 0,
+                    'p50_ms': round(pick(0.50), 2),
+                    'p95_ms': round(pick(0.95), 2)
+                }
+            return {'pooled_hosts': len(self.sessions), 'hosts': hosts}
+
+# Instância global
+http_client = HttpClient(
+    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+    max_retries=HTTP_MAX_RETRIES,
+    backoff=HTTP_BACKOFF,
+    pool_size=HTTP_POOL_SIZE
+)
+
+# Funções de conveniência
+def get_http_stats():
+    """Retorna estatísticas por host"""
+    return http_client.get_stats()
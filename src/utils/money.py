@@ -0,0 +1,156 @@
+"""
+Money - Aritmética de Ponto Fixo
+Valores fiat em centavos e BTC em satoshis, sempre em int: somas e taxas
+exatas, sem o arredondamento acumulado de float
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+SATOSHIS_PER_BTC = 100_000_000
+BASIS_POINTS = 10_000
+
+# Casas decimais da menor unidade de cada moeda (padrão: 2 = centavos)
+# Moedas sem casas decimais seguem a lista zero-decimal da Stripe
+ZERO_DECIMAL_CURRENCIES = (
+    'BIF', 'CLP', 'DJF', 'GNF', 'JPY', 'KMF', 'KRW', 'MGA',
+    'PYG', 'RWF', 'UGX', 'VND', 'VUV', 'XAF', 'XOF', 'XPF'
+)
+
+MINOR_UNIT_DIGITS = {
+    'BTC': 8,
+    **{currency: 0 for currency in ZERO_DECIMAL_CURRENCIES}
+}
+
+def minor_digits(currency):
+    """Retorna casas decimais da menor unidade da moeda"""
+    return MINOR_UNIT_DIGITS.get(currency.upper(), 2)
+
+def to_minor(amount, currency='BRL', rounding=ROUND_HALF_UP):
+    """Converte valor decimal (float/str/Decimal) para int na menor unidade"""
+    if amount is None:
+        return None
+    digits = minor_digits(currency)
+    value = Decimal(str(amount)).scaleb(digits)
+    return int(value.quantize(Decimal(1), rounding=rounding))
+
+def from_minor(minor, currency='BRL'):
+    """Converte int na menor unidade para float (apenas para exibição/JSON)"""
+    if minor is None:
+        return None
+    return minor / 10 ** minor_digits(currency)
+
+def to_cents(amount):
+    """Valor fiat -> centavos"""
+    return to_minor(amount, 'BRL')
+
+def to_sats(btc_amount, rounding=ROUND_HALF_UP):
+    """Valor BTC -> satoshis"""
+    return to_minor(btc_amount, 'BTC', rounding)
+
+def from_sats(sats):
+    """Satoshis -> BTC (float)"""
+    return from_minor(sats, 'BTC')
+
+def fee_to_bps(fee_fraction):
+    """Taxa fracionária (0.01) -> basis points (100)"""
+    return int((Decimal(str(fee_fraction)) * BASIS_POINTS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def apply_fee(minor, fee_bps):
+    """Retorna (taxa, líquido) em menor unidade, taxa arredondada half-up"""
+    fee = (minor * fee_bps + BASIS_POINTS // 2) // BASIS_POINTS
+    return fee, minor - fee
+
+def fiat_to_sats(amount_minor, price_minor):
+    """Converte fiat (menor unidade) em satoshis pelo preço BTC (menor unidade)
+
+    Arredonda para baixo: nunca credita mais BTC do que o valor pago compra.
+    """
+    if price_minor <= 0:
+        raise ValueError("Preço BTC inválido")
+    return amount_minor * SATOSHIS_PER_BTC // price_minor
+
+class Money:
+    """Valor monetário em int na menor unidade da moeda"""
+
+    __slots__ = ('minor', 'currency')
+
+    def __init__(self, minor, currency='BRL'):
+        if not isinstance(minor, int):
+            raise TypeError("Money exige int na menor unidade - use Money.from_decimal")
+        self.minor = minor
+        self.currency = currency.upper()
+
+    @classmethod
+    def from_decimal(cls, amount, currency='BRL', rounding=ROUND_HALF_UP):
+        """Cria Money a partir de valor decimal (ex.: 19.99)"""
+        return cls(to_minor(amount, currency, rounding), currency)
+
+    @classmethod
+    def sats(cls, sats):
+        """Cria Money em BTC a partir de satoshis"""
+        return cls(sats, 'BTC')
+
+    def to_decimal(self):
+        """Valor exato como Decimal"""
+        return Decimal(self.minor).scaleb(-minor_digits(self.currency))
+
+    def to_float(self):
+        """Valor como float (exibição/JSON)"""
+        return from_minor(self.minor, self.currency)
+
+    def apply_fee(self, fee_bps):
+        """Retorna (taxa, líquido) como Money"""
+        fee, net = apply_fee(self.minor, fee_bps)
+        return Money(fee, self.currency), Money(net, self.currency)
+
+    def to_btc(self, price):
+        """Converte fiat em BTC pelo preço (Money ou decimal na mesma moeda)"""
+        if not isinstance(price, Money):
+            price = Money.from_decimal(price, self.currency)
+        self._check_currency(price)
+        return Money.sats(fiat_to_sats(self.minor, price.minor))
+
+    def _check_currency(self, other):
+        if self.currency != other.currency:
+            raise ValueError(f"Moedas diferentes: {self.currency} e {other.currency}")
+
+    def __add__(self, other):
+        # Permite sum() com início 0
+        if isinstance(other, int) and other == 0:
+            return self
+        self._check_currency(other)
+        return Money(self.minor + other.minor, self.currency)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        self._check_currency(other)
+        return Money(self.minor - other.minor, self.currency)
+
+    def __neg__(self):
+        return Money(-self.minor, self.currency)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.minor == other.minor and self.currency == other.currency
+        return NotImplemented
+
+    def __lt__(self, other):
+        self._check_currency(other)
+        return self.minor < other.minor
+
+    def __le__(self, other):
+        self._check_currency(other)
+        return self.minor <= other.minor
+
+    def __hash__(self):
+        return hash((self.minor, self.currency))
+
+    def __bool__(self):
+        return self.minor != 0
+
+    def __float__(self):
+        return self.to_float()
+
+    def __repr__(self):
+        return f"<Money {self.to_decimal()} {self.currency}>"
@@ -0,0 +1,211 @@
+"""
+Agregador de Preços - Múltiplas Fontes em Paralelo
+Consulta todas as fontes configuradas ao mesmo tempo, com deadline por
+fonte, e devolve a mediana (ou média ponderada) das que responderam
+"""
+
+import statistics
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.config.settings import (
+    DEBUG, BITPAY_API_URL, PRICE_SOURCES, PRICE_SOURCE_DEADLINE,
+    PRICE_SOURCE_DEADLINES, PRICE_SOURCE_WEIGHTS
+)
+from src.utils.http_client import http_client
+
+# Pares por moeda na Binance (USD é negociado contra USDT)
+BINANCE_SYMBOLS = {
+    'usd': 'BTCUSDT',
+    'brl': 'BTCBRL',
+    'eur': 'BTCEUR'
+}
+
+def _fetch_coingecko(currency, timeout):
+    """CoinGecko via cache por moeda (idade = idade da entrada no cache)"""
+    from src.utils.bitcoin_converter import _price_cache, _fetch_bitcoin_prices
+    entry = _price_cache.peek(currency)
+    if entry is not None:
+        return entry['price'], time.time() - entry['timestamp']
+
+    # Cache vazio: uma chamada dentro do deadline da fonte, sem esperar o refresh do cache
+    price = float(_fetch_bitcoin_prices([currency], timeout=timeout)[currency])
+    _price_cache.put(currency, price)
+    return price, 0
+
+def _fetch_binance(currency, timeout):
+    """Binance: livro do stream se fresco, senão ticker REST público"""
+    from src.utils.price_feed import price_book
+    from src.config.settings import PRICE_FEED_MAX_AGE
+
+    symbol = BINANCE_SYMBOLS.get(currency, f"BTC{currency.upper()}")
+    snapshot = price_book.snapshot().get(symbol)
+    if snapshot and snapshot['age_seconds'] <= PRICE_FEED_MAX_AGE:
+        return snapshot['price'], snapshot['age_seconds']
+
+    response = http_client.get(
+        'https://api.binance.com/api/v3/ticker/price',
+        params={'symbol': symbol},
+        timeout=timeout,
+        retries=0
+    )
+    response.raise_for_status()
+    return float(response.json()['price']), 0
+
+def _fetch_coinbase(currency, timeout):
+    """Coinbase: preço spot"""
+    response = http_client.get(
+        f"https://api.coinbase.com/v2/prices/BTC-{currency.upper()}/spot",
+        timeout=timeout,
+        retries=0
+    )
+    response.raise_for_status()
+    return float(response.json()['data']['amount']), 0
+
+def _fetch_bitpay(currency, timeout):
+    """BitPay: tabela de cotações"""
+    response = http_client.get(f"{BITPAY_API_URL}/rates/BTC/{currency.upper()}", timeout=timeout, retries=0)
+    response.raise_for_status()
+    return float(response.json()['data']['rate']), 0
+
+class PriceAggregator:
+    """Consulta fontes de preço em paralelo e combina os resultados"""
+
+    def __init__(self, sources=None, deadline=2.0, deadlines=None, weights=None):
+        self.fetchers = {
+            'coingecko': _fetch_coingecko,
+            'binance': _fetch_binance,
+            'coinbase': _fetch_coinbase,
+            'bitpay': _fetch_bitpay
+        }
+        if sources is None:
+            sources = list(self.fetchers)
+        self.sources = [s for s in sources if s in self.fetchers]
+        self.deadline = deadline
+        self.deadlines = dict(deadlines or {})
+        self.weights = dict(weights or {})
+        self.executor = ThreadPoolExecutor(max_workers=max(4, len(self.sources) * 2), thread_name_prefix='price-source')
+
+        self.stats = {
+            'quotes': 0,
+            'degraded_quotes': 0,
+            'source_errors': 0,
+            'source_timeouts': 0
+        }
+
+    def register_source(self, name, fetcher, weight=None, deadline=None):
+        """Registra nova fonte: fetcher(currency, timeout) -> (preço, idade_s)"""
+        self.fetchers[name] = fetcher
+        if name not in self.sources:
+            self.sources.append(name)
+        if weight is not None:
+            self.weights[name] = weight
+        if deadline is not None:
+            self.deadlines[name] = deadline
+
+    def _deadline_for(self, source):
+        return self.deadlines.get(source, self.deadline)
+
+    def _call(self, source, currency, expires_at):
+        """Executa uma fonte medindo a latência (timeout = o que resta do deadline)"""
+        start = time.time()
+        remaining = expires_at - start
+        if remaining <= 0:
+            # Ficou na fila do executor além do deadline: a cotação já foi respondida sem ela
+            raise TimeoutError(f"Deadline de {source} vencido antes de iniciar")
+        price, age = self.fetchers[source](currency, remaining)
+        return price, age, time.time() - start
+
+    def get_quote(self, currency='usd', method='median'):
+        """Retorna preço combinado e o detalhe de cada fonte"""
+        currency = currency.lower()
+        started = time.time()
+        futures = {
+            self.executor.submit(self._call, source, currency, started + self._deadline_for(source)): source
+            for source in self.sources
+        }
+
+        # Espera no máximo o maior deadline: a latência é a da fonte mais lenta que respondeu
+        max_deadline = max((self._deadline_for(s) for s in self.sources), default=self.deadline)
+        wait(futures, timeout=max_deadline)
+
+        sources = {}
+        answered = {}
+        for future, source in futures.items():
+            if not future.done():
+                future.cancel()
+                sources[source] = {'status': 'timeout'}
+                self.stats['source_timeouts'] += 1
+                continue
+
+            try:
+                price, age, latency = future.result()
+            except (TimeoutError, requests.Timeout):
+                sources[source] = {'status': 'timeout'}
+                self.stats['source_timeouts'] += 1
+                continue
+            except Exception as e:
+                sources[source] = {'status': 'error', 'error': str(e)}
+                self.stats['source_errors'] += 1
+                continue
+
+            if latency > self._deadline_for(source):
+                sources[source] = {'status': 'timeout', 'latency_ms': round(latency * 1000, 1)}
+                self.stats['source_timeouts'] += 1
+                continue
+
+            answered[source] = price
+            sources[source] = {
+                'status': 'ok',
+                'price': price,
+                'age_seconds': round(age, 3),
+                'latency_ms': round(latency * 1000, 1)
+            }
+
+        self.stats['quotes'] += 1
+        if len(answered) < len(self.sources):
+            self.stats['degraded_quotes'] += 1
+            if DEBUG:
+                missing = [s for s in self.sources if s not in answered]
+                print(f"⚠️ Cotação {currency.upper()} sem as fontes: {', '.join(missing)}")
+
+        return {
+            'success': bool(answered),
+            'currency': currency.upper(),
+            'price': self._combine(answered, method),
+            'method': method if method == 'weighted' else 'median',
+            'responded': len(answered),
+            'total_sources': len(self.sources),
+            'sources': sources,
+            'elapsed_ms': round((time.time() - started) * 1000, 1)
+        }
+
+    def _combine(self, prices, method):
+        """Mediana ou média ponderada dos preços recebidos"""
+        if not prices:
+            return None
+        if method == 'weighted':
+            total_weight = sum(self.weights.get(s, 1) for s in prices)
+            return sum(p * self.weights.get(s, 1) for s, p in prices.items()) / total_weight
+        return statistics.median(prices.values())
+
+    def get_stats(self):
+        """Retorna estatísticas do agregador"""
+        return {**self.stats, 'sources': list(self.sources)}
+
+# Instância global
+price_aggregator = PriceAggregator(
+    sources=PRICE_SOURCES,
+    deadline=PRICE_SOURCE_DEADLINE,
+    deadlines=PRICE_SOURCE_DEADLINES,
+    weights=PRICE_SOURCE_WEIGHTS
+)
+
+# Funções de conveniência
+def get_aggregated_price(currency='usd', method='median'):
+    """Retorna cotação combinada de todas as fontes"""
+    return price_aggregator.get_quote(currency, method)
+
+def get_aggregator_stats():
+    """Retorna estatísticas do agregador"""
+    return price_aggregator.get_stats()
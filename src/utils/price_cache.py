@@ -0,0 +1,291 @@
+"""
+Cache de Preços - Stale-While-Revalidate
+Cada moeda tem sua própria entrada e TTL; preços vencidos são servidos
+na hora enquanto uma única thread em background busca o valor novo.
+Com um store compartilhado (SQLite WAL) os workers dividem os preços e
+só um deles busca na API a cada vencimento
+"""
+
+import threading
+import time
+from src.config.settings import DEBUG, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from src.utils.single_flight import single_flight
+
+class PriceCache:
+    """Cache de preços por moeda com revalidação em background"""
+
+    def __init__(self, fetcher, ttl=300, ttls=None, name='coingecko', currencies=None, store=None, lease_seconds=15, history=None,
+                 wait_timeout=None):
+        # fetcher([moedas]) -> {moeda: float}, levanta exceção se a API falhar
+        self.fetcher = fetcher
+        self.name = name
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+
+        # Store compartilhado entre processos (opcional) e duração do lease de refresh
+        self.store = store
+        self.lease_seconds = lease_seconds
+
+        # Espera máxima pelo worker dono do lease: o tempo de uma busca na API
+        if wait_timeout is None:
+            wait_timeout = min(lease_seconds, HTTP_CONNECT_TIMEOUT + HTTP_READ_TIMEOUT)
+        self.wait_timeout = wait_timeout
+
+        # Histórico (opcional) recebe cada preço novo, local ou vindo de outro worker
+        self.history = history
+
+        # Moedas sempre buscadas juntas em cada refresh (uma chamada só)
+        self.currencies = [c.lower() for c in (currencies or [])]
+
+        # moeda -> {'price': float, 'timestamp': float}
+        self.entries = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale_hits': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'shared_hits': 0,
+            'peer_refreshes': 0
+        }
+
+    def get_ttl(self, currency):
+        """Retorna TTL configurado para a moeda"""
+        return self.ttls.get(currency.lower(), self.ttl)
+
+    def set_ttl(self, currency, ttl):
+        """Define TTL específico para uma moeda"""
+        self.ttls[currency.lower()] = ttl
+
+    def get(self, currency):
+        """Retorna preço da moeda, revalidando em background se vencido"""
+        currency = currency.lower()
+        return self.get_many([currency])[currency]
+
+    def get_many(self, currencies):
+        """Retorna {moeda: preço} com no máximo uma busca para todas as moedas"""
+        currencies = [c.lower() for c in currencies]
+        prices = {}
+        missing = []
+        stale = []
+
+        # Antes de ir à API, vê se outro worker já atualizou o store compartilhado
+        if self.store is not None:
+            with self.lock:
+                not_fresh = [c for c in currencies if not self._is_fresh(c)]
+            if not_fresh:
+                self._sync_from_store(not_fresh)
+
+        with self.lock:
+            now = time.time()
+            for currency in currencies:
+                entry = self.entries.get(currency)
+                if entry is None:
+                    self.stats['misses'] += 1
+                    missing.append(currency)
+                    continue
+
+                if now - entry['timestamp'] < self.get_ttl(currency):
+                    self.stats['hits'] += 1
+                else:
+                    # Vencido: entrega o último preço bom e atualiza por trás
+                    self.stats['stale_hits'] += 1
+                    stale.append(currency)
+                prices[currency] = entry['price']
+
+            if stale:
+                self._schedule_refresh(stale)
+
+        # Sem nenhum valor ainda: única situação em que o request espera a API
+        if missing:
+            fetched = self.refresh(missing)
+            for currency in missing:
+                prices[currency] = fetched[currency]
+
+        return prices
+
+    def peek(self, currency):
+        """Entrada em cache sem nunca esperar a API ({'price', 'timestamp'} ou None)
+
+        Entrada vencida é devolvida e revalidada em background, como no get.
+        """
+        currency = currency.lower()
+        with self.lock:
+            entry = self.entries.get(currency)
+            if entry is None:
+                return None
+            if not self._is_fresh(currency):
+                self.stats['stale_hits'] += 1
+                self._schedule_refresh([currency])
+            else:
+                self.stats['hits'] += 1
+            return dict(entry)
+
+    def _is_fresh(self, currency, now=None):
+        """True se a moeda tem entrada dentro do TTL (chamar com lock)"""
+        entry = self.entries.get(currency)
+        return entry is not None and (now or time.time()) - entry['timestamp'] < self.get_ttl(currency)
+
+    def _sync_from_store(self, currencies):
+        """Traz do store compartilhado preços mais novos que os locais"""
+        try:
+            shared = self.store.read(self.name, currencies)
+        except Exception as e:
+            if DEBUG:
+                print(f"⚠️ Erro ao ler cache compartilhado: {e}")
+            return {}
+
+        with self.lock:
+            for currency, (price, timestamp) in shared.items():
+                entry = self.entries.get(currency)
+                if entry is None or timestamp > entry['timestamp']:
+                    self.entries[currency] = {'price': price, 'timestamp': timestamp}
+                    if self.history is not None:
+                        self.history.record(currency, price, timestamp)
+                    if self._is_fresh(currency):
+                        self.stats['shared_hits'] += 1
+        return shared
+
+    def refresh(self, currencies, blocking=True):
+        """Busca as moedas pedidas (e as configuradas) em uma única chamada"""
+        # Misses e revalidações concorrentes do mesmo conjunto esperam uma única busca
+        wanted = sorted(set(self.currencies) | {c.lower() for c in currencies})
+        return single_flight.do(f"{self.name}:{','.join(wanted)}", self._load, wanted, blocking)
+
+    def _load(self, currencies, blocking=True):
+        """Executa o fetcher e grava o resultado (local e compartilhado)"""
+        lease = f"{self.name}:{','.join(currencies)}"
+        leased = False
+        if self.store is not None:
+            leased = self._acquire(lease)
+            if not leased:
+                # Outro worker já está buscando: aproveita o resultado dele
+                prices, leased = self._wait_for_peer(lease, currencies, blocking)
+                if prices is not None:
+                    return prices
+
+        try:
+            try:
+                prices = self.fetcher(currencies)
+            except Exception:
+                with self.lock:
+                    self.stats['refresh_errors'] += 1
+                raise
+
+            timestamp = time.time()
+            with self.lock:
+                for currency, price in prices.items():
+                    self.entries[currency.lower()] = {'price': price, 'timestamp': timestamp}
+                self.stats['refreshes'] += 1
+
+            if self.history is not None:
+                self.history.record_many(prices, timestamp)
+
+            if self.store is not None:
+                try:
+                    self.store.write(self.name, prices, timestamp)
+                except Exception as e:
+                    if DEBUG:
+                        print(f"⚠️ Erro ao gravar cache compartilhado: {e}")
+            return prices
+        finally:
+            # Libera o lease só depois de publicar no store
+            if leased:
+                self.store.release(lease)
+
+    def _acquire(self, lease):
+        """Tenta obter o lease de refresh no store compartilhado"""
+        try:
+            return self.store.acquire(lease, self.lease_seconds)
+        except Exception:
+            return False
+
+    def _wait_for_peer(self, lease, currencies, blocking):
+        """Espera o worker dono do lease publicar os preços
+
+        Retorna (preços, leased); preços None = buscar nesta thread, com o
+        lease se ele foi liberado durante a espera.
+        """
+        deadline = time.time() + self.wait_timeout
+        while True:
+            self._sync_from_store(currencies)
+            with self.lock:
+                if all(self._is_fresh(c) for c in currencies):
+                    self.stats['peer_refreshes'] += 1
+                    return {c: self.entries[c]['price'] for c in currencies}, False
+                if not blocking and all(c in self.entries for c in currencies):
+                    # Background: mantém o valor vencido, o outro worker atualiza
+                    return {c: self.entries[c]['price'] for c in currencies}, False
+            # Dono liberou (ou o lease venceu) sem publicar: esta thread assume a busca
+            if self._acquire(lease):
+                return None, True
+            if time.time() >= deadline:
+                return None, False
+            time.sleep(0.05)
+
+    def put(self, currency, price, timestamp=None):
+        """Grava preço no cache"""
+        with self.lock:
+            self.entries[currency.lower()] = {
+                'price': price,
+                'timestamp': timestamp or time.time()
+            }
+
+    def _schedule_refresh(self, currencies):
+        """Dispara no máximo uma revalidação por moeda (chamar com lock)"""
+        pending = [c for c in currencies if c not in self.refreshing]
+        if not pending:
+            return
+
+        self.refreshing.update(pending)
+        thread = threading.Thread(
+            target=self._background_refresh,
+            args=(pending,),
+            name=f"price-refresh-{','.join(pending)}",
+            daemon=True
+        )
+        thread.start()
+
+    def _background_refresh(self, currencies):
+        """Revalidação em background - mantém o valor antigo se falhar"""
+        try:
+            self.refresh(currencies, blocking=False)
+        except Exception as e:
+            if DEBUG:
+                print(f"⚠️ Erro ao revalidar preços {','.join(currencies).upper()}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.difference_update(currencies)
+
+    def clear(self):
+        """Limpa entradas e contadores"""
+        with self.lock:
+            self.entries.clear()
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def get_stats(self):
+        """Retorna contadores de hit/miss e idade de cada moeda"""
+        now = time.time()
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses'] + self.stats['stale_hits']
+            currencies = {}
+            for currency, entry in self.entries.items():
+                age = now - entry['timestamp']
+                currencies[currency] = {
+                    'price': entry['price'],
+                    'age_seconds': round(age, 3),
+                    'ttl': self.get_ttl(currency),
+                    'stale': age >= self.get_ttl(currency),
+                    'refreshing': currency in self.refreshing
+                }
+
+            return {
+                **self.stats,
+                'shared': self.store is not None,
+                'hit_rate': (self.stats['hits'] + self.stats['stale_hits']) / lookups * 100 if lookups > 0 else 0,
+                'currencies': currencies
+            }
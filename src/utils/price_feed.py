@@ -0,0 +1,200 @@
+"""
+Price Feed - Ticker em Streaming
+Mantém uma conexão aberta com o stream de ticker e alimenta um livro de
+preços em memória; os caminhos de conversão leem o livro sem I/O de rede
+"""
+
+import json
+import threading
+import time
+import requests
+from src.config.settings import DEBUG, PRICE_FEED_ENABLED, PRICE_FEED_URL, PRICE_FEED_MAX_AGE
+
+# websocket-client é opcional: sem ele o feed só aceita streams HTTP (NDJSON)
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+class PriceBook:
+    """Livro de preços em memória por símbolo (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prices = {}
+
+    def update(self, symbol, price, timestamp=None):
+        """Atualiza preço de um símbolo"""
+        symbol = symbol.upper()
+        with self.lock:
+            entry = self.prices.get(symbol)
+            self.prices[symbol] = {
+                'price': price,
+                'timestamp': timestamp or time.time(),
+                'updates': entry['updates'] + 1 if entry else 1
+            }
+
+    def get(self, symbol, max_age=None):
+        """Retorna preço do símbolo ou None se ausente/mais velho que max_age"""
+        with self.lock:
+            entry = self.prices.get(symbol.upper())
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry['timestamp'] > max_age:
+            return None
+        return entry['price']
+
+    def snapshot(self):
+        """Retorna cópia do livro com idade de cada símbolo"""
+        now = time.time()
+        with self.lock:
+            return {
+                symbol: {**entry, 'age_seconds': round(now - entry['timestamp'], 3)}
+                for symbol, entry in self.prices.items()
+            }
+
+    def clear(self):
+        """Limpa o livro"""
+        with self.lock:
+            self.prices.clear()
+
+class PriceFeed:
+    """Consumidor do stream de ticker em background com reconexão"""
+
+    def __init__(self, url, book, max_backoff=30):
+        self.url = url
+        self.book = book
+        self.max_backoff = max_backoff
+        self.running = False
+        self.thread = None
+        self.response = None
+        self.ws = None
+
+        self.stats = {
+            'connected': False,
+            'messages': 0,
+            'parse_errors': 0,
+            'reconnects': 0,
+            'last_message_at': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """Inicia o consumidor em uma thread daemon"""
+        if self.running:
+            return False
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='price-feed', daemon=True)
+        self.thread.start()
+
+        if DEBUG:
+            print(f"📡 Price feed iniciado: {self.url}")
+        return True
+
+    def stop(self, timeout=5):
+        """Para o consumidor e fecha a conexão"""
+        self.running = False
+        try:
+            if self.response is not None:
+                self.response.close()
+            if self.ws is not None:
+                self.ws.close()
+        except Exception:
+            pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        """Loop de conexão com backoff exponencial"""
+        backoff = 1
+        while self.running:
+            try:
+                if self.url.startswith(('ws://', 'wss://')):
+                    self._consume_websocket()
+                else:
+                    self._consume_http()
+                backoff = 1
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                if DEBUG and self.running:
+                    print(f"⚠️ Price feed desconectado: {e}")
+            finally:
+                self.stats['connected'] = False
+
+            if self.running:
+                self.stats['reconnects'] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _consume_http(self):
+        """Consome stream HTTP com uma mensagem JSON por linha"""
+        with requests.get(self.url, stream=True, timeout=(5, 30)) as response:
+            response.raise_for_status()
+            self.response = response
+            self.stats['connected'] = True
+            for line in response.iter_lines():
+                if not self.running:
+                    break
+                if line:
+                    self.handle_message(line)
+
+    def _consume_websocket(self):
+        """Consome stream WebSocket (ex.: Binance miniTicker)"""
+        if websocket is None:
+            raise RuntimeError("websocket-client não instalado - use um feed HTTP")
+
+        self.ws = websocket.create_connection(self.url, timeout=30)
+        self.stats['connected'] = True
+        try:
+            while self.running:
+                self.handle_message(self.ws.recv())
+        finally:
+            self.ws.close()
+
+    def handle_message(self, raw):
+        """Interpreta mensagem de ticker e atualiza o livro"""
+        try:
+            message = json.loads(raw)
+
+            # Streams combinados da Binance embrulham o evento em 'data'
+            if 'data' in message:
+                message = message['data']
+
+            symbol = message['s']
+            price = float(message['c'])
+            timestamp = message['E'] / 1000 if 'E' in message else None
+
+            self.book.update(symbol, price, timestamp)
+            self.stats['messages'] += 1
+            self.stats['last_message_at'] = time.time()
+        except (ValueError, KeyError, TypeError):
+            self.stats['parse_errors'] += 1
+
+    def get_stats(self):
+        """Retorna estatísticas do feed e o livro atual"""
+        return {
+            **self.stats,
+            'url': self.url,
+            'running': self.running,
+            'book': self.book.snapshot()
+        }
+
+# Instâncias globais
+price_book = PriceBook()
+price_feed = PriceFeed(PRICE_FEED_URL, price_book)
+
+# Funções de conveniência
+def init_price_feed():
+    """Inicia o feed de preços se habilitado no .env"""
+    if PRICE_FEED_ENABLED:
+        return price_feed.start()
+    return False
+
+def get_book_price(symbol, max_age=PRICE_FEED_MAX_AGE):
+    """Retorna preço do livro em memória (None se ausente ou velho)"""
+    return price_book.get(symbol, max_age)
+
+def get_price_feed_stats():
+    """Retorna estatísticas do feed de preços"""
+    return price_feed.get_stats()
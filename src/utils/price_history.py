@@ -0,0 +1,237 @@
+"""
+Histórico de Preços - Ring Buffer em Memória
+Cada moeda guarda as últimas N amostras (timestamp, preço, volume) em
+arrays de tamanho fixo; variação, mínimo/máximo e VWAP são calculados
+sem banco de dados nem rede
+"""
+
+import threading
+import time
+from array import array
+from src.config.settings import PRICE_HISTORY_SIZE
+
+class PriceRing:
+    """Ring buffer de tamanho fixo com amostras em ordem de tempo"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self.volumes = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def _index(self, i):
+        """Posição física da i-ésima amostra (0 = mais antiga)"""
+        return (self.start + i) % self.capacity
+
+    def append(self, timestamp, price, volume=0.0):
+        """Adiciona amostra; ignora amostras fora de ordem ou repetidas"""
+        if self.count and timestamp <= self.timestamps[self._index(self.count - 1)]:
+            return False
+
+        if self.count < self.capacity:
+            index = self._index(self.count)
+            self.count += 1
+        else:
+            # Cheio: sobrescreve a mais antiga
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.timestamps[index] = timestamp
+        self.prices[index] = price
+        self.volumes[index] = volume
+        return True
+
+    def first_since(self, since):
+        """Índice lógico da primeira amostra com timestamp >= since (busca binária)"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[self._index(middle)] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def sample(self, i):
+        """Retorna (timestamp, preço, volume) da i-ésima amostra"""
+        index = self._index(i)
+        return self.timestamps[index], self.prices[index], self.volumes[index]
+
+    def window(self, since=None):
+        """Itera amostras a partir de since (todas se None)"""
+        first = 0 if since is None else self.first_since(since)
+        for i in range(first, self.count):
+            yield self.sample(i)
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+class PriceHistory:
+    """Histórico de preços por moeda, alimentado pelo refresh do cache"""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def record(self, currency, price, timestamp=None, volume=0.0):
+        """Registra uma amostra de preço"""
+        currency = currency.lower()
+        with self.lock:
+            ring = self.rings.get(currency)
+            if ring is None:
+                ring = self.rings[currency] = PriceRing(self.capacity)
+            return ring.append(timestamp or time.time(), float(price), float(volume or 0))
+
+    def record_many(self, prices, timestamp=None):
+        """Registra {moeda: preço} com o mesmo timestamp"""
+        timestamp = timestamp or time.time()
+        for currency, price in prices.items():
+            self.record(currency, price, timestamp)
+
+    def latest(self, currency):
+        """Retorna (timestamp, preço) mais recente ou None"""
+        with self.lock:
+            ring = self.rings.get(currency.lower())
+            if not ring or not ring.count:
+                return None
+            timestamp, price, _ = ring.sample(ring.count - 1)
+            return timestamp, price
+
+    def change(self, currency, minutes):
+        """Variação do preço nos últimos N minutos (None sem amostras suficientes)"""
+        with self.lock:
+            ring = self.rings.get(currency.lower())
+            if not ring or ring.count < 2:
+                return None
+
+            cutoff = time.time() - minutes * 60
+            first = ring.first_since(cutoff)
+            # Base: última amostra antes da janela, ou a mais antiga dentro dela
+            base = ring.sample(max(first - 1, 0))
+            last = ring.sample(ring.count - 1)
+
+        if base[0] == last[0]:
+            return None
+
+        return {
+            'currency': currency.upper(),
+            'minutes': minutes,
+            'from_price': base[1],
+            'to_price': last[1],
+            'from_timestamp': base[0],
+            'to_timestamp': last[0],
+            'change': last[1] - base[1],
+            'percentage': (last[1] - base[1]) / base[1] * 100 if base[1] else 0
+        }
+
+    def summary(self, currency, minutes=None):
+        """Mínimo, máximo, abertura, último e VWAP da janela (O(janela))"""
+        since = time.time() - minutes * 60 if minutes else None
+        with self.lock:
+            ring = self.rings.get(currency.lower())
+            samples = list(ring.window(since)) if ring else []
+
+        if not samples:
+            return None
+
+        prices = [price for _, price, _ in samples]
+        volume = sum(v for _, _, v in samples)
+        if volume > 0:
+            vwap = sum(p * v for _, p, v in samples) / volume
+        else:
+            # Sem volume registrado: média ponderada pelo tempo de cada preço
+            vwap = self._time_weighted(samples)
+
+        return {
+            'currency': currency.upper(),
+            'samples': len(samples),
+            'open': prices[0],
+            'last': prices[-1],
+            'min': min(prices),
+            'max': max(prices),
+            'vwap': vwap,
+            'volume_weighted': volume > 0,
+            'from_timestamp': samples[0][0],
+            'to_timestamp': samples[-1][0]
+        }
+
+    def _time_weighted(self, samples):
+        if len(samples) == 1:
+            return samples[0][1]
+        total = samples[-1][0] - samples[0][0]
+        weighted = sum(
+            samples[i][1] * (samples[i + 1][0] - samples[i][0])
+            for i in range(len(samples) - 1)
+        )
+        return weighted / total
+
+    def series(self, currency, minutes=None, points=100):
+        """Série reduzida a no máximo `points` baldes de tempo iguais (média/mín/máx)"""
+        since = time.time() - minutes * 60 if minutes else None
+        with self.lock:
+            ring = self.rings.get(currency.lower())
+            samples = list(ring.window(since)) if ring else []
+
+        if len(samples) <= points:
+            return [
+                {'timestamp': ts, 'price': price, 'min': price, 'max': price, 'samples': 1}
+                for ts, price, _ in samples
+            ]
+
+        start = samples[0][0]
+        width = (samples[-1][0] - start) / points or 1
+        buckets = []
+        current = None
+        for ts, price, _ in samples:
+            bucket = min(int((ts - start) / width), points - 1)
+            if current is None or current['bucket'] != bucket:
+                current = {'bucket': bucket, 'timestamp': ts, 'sum': 0.0, 'min': price, 'max': price, 'samples': 0}
+                buckets.append(current)
+            current['timestamp'] = ts
+            current['sum'] += price
+            current['min'] = min(current['min'], price)
+            current['max'] = max(current['max'], price)
+            current['samples'] += 1
+
+        return [
+            {
+                'timestamp': b['timestamp'],
+                'price': b['sum'] / b['samples'],
+                'min': b['min'],
+                'max': b['max'],
+                'samples': b['samples']
+            }
+            for b in buckets
+        ]
+
+    def clear(self):
+        with self.lock:
+            self.rings.clear()
+
+    def get_stats(self):
+        """Amostras guardadas por moeda"""
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'currencies': {currency: ring.count for currency, ring in self.rings.items()}
+            }
+
+# Instância global
+price_history = PriceHistory(PRICE_HISTORY_SIZE)
+
+# Funções de conveniência
+def get_price_change(currency='brl', minutes=60):
+    """Variação do preço BTC nos últimos N minutos"""
+    return price_history.change(currency, minutes)
+
+def get_price_summary(currency='brl', minutes=None):
+    """Mínimo/máximo/VWAP do preço BTC na janela"""
+    return price_history.summary(currency, minutes)
+
+def get_price_series(currency='brl', minutes=None, points=100):
+    """Série histórica reduzida para gráficos"""
+    return price_history.series(currency, minutes, points)
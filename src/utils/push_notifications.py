@@ -3,7 +3,7 @@ Push Notifications - Engajamento Supremo
 Sistema de notificações push para manter clientes ativos
 """
 
-import requests
+from src.utils.http_client import http_client
 import json
 from src.config.settings import DEBUG
 
@@ -101,7 +101,7 @@ class PushNotificationService:
             }
             
             # Envia notificação
-            response = requests.post(
+            response = http_client.post(
                 f'{self.base_url}/notifications',
                 json=notification_data,
                 headers=headers,
@@ -157,11 +157,28 @@ class PushNotificationService:
         data = {'product_name': product_name}
         return self.send_notification([player_id], 'dropship_ready', data)
     
-    def send_price_alert(self, percentage_change):
-        """Envia alerta de preço"""
+    def send_price_alert(self, percentage_change=None, currency='brl', minutes=60):
+        """Envia alerta de preço (variação calculada pelo histórico se omitida)"""
+        if percentage_change is None:
+            from src.utils.price_history import get_price_change
+            change = get_price_change(currency, minutes)
+            if change is None:
+                return {'success': False, 'error': 'Histórico de preços insuficiente'}
+            percentage_change = change['percentage']
+        
         data = {'percentage': f"{percentage_change:.2f}"}
         return self.send_notification(None, 'price_alert', data, ['All'])
     
+    def check_price_alert(self, threshold=5.0, currency='brl', minutes=60):
+        """Envia alerta só se a alta nos últimos N minutos passar do limite (%)"""
+        from src.utils.price_history import get_price_change
+        change = get_price_change(currency, minutes)
+        if change is None or change['percentage'] < threshold:
+            return {'success': True, 'sent': False, 'change': change}
+        
+        result = self.send_price_alert(change['percentage'])
+        return {**result, 'sent': result.get('success', False), 'change': change}
+    
     def get_notification_stats(self):
         """Retorna estatísticas de notificações"""
         try:
@@ -169,7 +186,7 @@ class PushNotificationService:
                 return {'simulated': True}
             
             headers = {'Authorization': f'Basic {self.api_key}'}
-            response = requests.get(f'{self.base_url}/apps/{self.app_id}', headers=headers)
+            response = http_client.get(f'{self.base_url}/apps/{self.app_id}', headers=headers)
             response.raise_for_status()
             
             app_data = response.json()
@@ -202,9 +219,13 @@ def send_dropship_notification(player_id, product_name):
     """Envia notificação de dropship"""
     return push_service.send_dropship_ready(player_id, product_name)
 
-def send_price_alert_notification(percentage_change):
+def send_price_alert_notification(percentage_change=None, currency='brl', minutes=60):
     """Envia alerta de preço"""
-    return push_service.send_price_alert(percentage_change)
+    return push_service.send_price_alert(percentage_change, currency, minutes)
+
+def check_price_alert(threshold=5.0, currency='brl', minutes=60):
+    """Envia alerta de preço se a alta passar do limite"""
+    return push_service.check_price_alert(threshold, currency, minutes)
 
 def get_push_stats():
     """Retorna estatísticas de push"""
@@ -0,0 +1,115 @@
+"""
+Cache de Preços Compartilhado - SQLite em modo WAL
+Todos os workers/processos leem e gravam o mesmo arquivo: um worker
+atualiza o preço e os outros reaproveitam, sem N chamadas à API
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+class SharedPriceStore:
+    """Preços e leases de atualização compartilhados entre processos"""
+
+    def __init__(self, path, busy_timeout_ms=2000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._create_tables()
+
+    def _connection(self):
+        """Uma conexão por thread (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms}')
+            self.local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_prices (
+                namespace TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                price REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, currency)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_price_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def read(self, namespace, currencies):
+        """Retorna {moeda: (preço, timestamp)} das moedas presentes"""
+        placeholders = ','.join('?' * len(currencies))
+        rows = self._connection().execute(
+            f"SELECT currency, price, updated_at FROM shared_prices "
+            f"WHERE namespace = ? AND currency IN ({placeholders})",
+            [namespace, *currencies]
+        ).fetchall()
+        return {currency: (price, updated_at) for currency, price, updated_at in rows}
+
+    def write(self, namespace, prices, timestamp=None):
+        """Grava preços (só sobrescreve se mais novos)"""
+        timestamp = timestamp or time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                "INSERT INTO shared_prices (namespace, currency, price, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, currency) DO UPDATE SET price = excluded.price, updated_at = excluded.updated_at "
+                "WHERE excluded.updated_at > shared_prices.updated_at",
+                [(namespace, currency, price, timestamp) for currency, price in prices.items()]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire(self, name, seconds):
+        """Tenta obter o lease de atualização; True se este processo deve buscar"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO shared_price_leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE shared_price_leases.expires_at < ? OR shared_price_leases.owner = excluded.owner",
+            (name, self.owner, now + seconds, now)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, name):
+        """Libera o lease se for deste processo"""
+        self._connection().execute(
+            "DELETE FROM shared_price_leases WHERE name = ? AND owner = ?",
+            (name, self.owner)
+        )
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_shared_price_store():
+    """Retorna o store compartilhado se PRICE_CACHE_BACKEND=sqlite (senão None)"""
+    global _store
+    from src.config.settings import PRICE_CACHE_BACKEND, PRICE_CACHE_DB_PATH
+
+    if PRICE_CACHE_BACKEND != 'sqlite':
+        return None
+
+    with _store_lock:
+        if _store is None:
+            _store = SharedPriceStore(PRICE_CACHE_DB_PATH)
+        return _store
@@ -0,0 +1,85 @@
+"""
+Single-Flight - Coalescência de Requisições
+Chamadas concorrentes com a mesma chave esperam uma única execução
+em andamento e compartilham o resultado (ou a exceção)
+"""
+
+import threading
+
+class _Call:
+    """Execução em andamento para uma chave"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Agrupa chamadas concorrentes por chave evitando thundering herd"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {
+            'executions': 0,
+            'coalesced': 0
+        }
+
+    def do(self, key, fn, *args, **kwargs):
+        """Executa fn uma única vez por chave entre as threads concorrentes"""
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                self.stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def in_flight(self):
+        """Retorna chaves com execução em andamento"""
+        with self.lock:
+            return {key: call.waiters for key, call in self.calls.items()}
+
+    def get_stats(self):
+        """Retorna contadores de execuções e chamadas coalescidas"""
+        with self.lock:
+            total = self.stats['executions'] + self.stats['coalesced']
+            return {
+                **self.stats,
+                'in_flight': len(self.calls),
+                'coalesce_rate': self.stats['coalesced'] / total * 100 if total > 0 else 0
+            }
+
+# Instância global compartilhada pelos handlers de preço
+single_flight = SingleFlight()
+
+# Funções de conveniência
+def coalesce(key, fn, *args, **kwargs):
+    """Executa fn coalescendo chamadas concorrentes com a mesma chave"""
+    return single_flight.do(key, fn, *args, **kwargs)
+
+def get_single_flight_stats():
+    """Retorna estatísticas de coalescência"""
+    return single_flight.get_stats()
@@ -3,41 +3,69 @@
 Processa webhooks do BitPay para atualizar status de pagamentos
 """
 
+import hashlib
+import hmac
 import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from src.config.settings import BITPAY_WEBHOOK_SECRET, WEBHOOK_ASYNC
+from src.models.webhook_queue import enqueue_webhook, register_webhook_handler
+from src.models.idempotency import claim_event, release_event
+from src.models.write_behind import update_invoice_status
 
 logger = logging.getLogger(__name__)
 
-def handle_bitpay_webhook(payload: bytes) -> Dict[str, Any]:
+def sign_bitpay_payload(payload: bytes, secret: str) -> str:
+    """Assinatura HMAC-SHA256 (hex) do corpo do webhook"""
+    return hmac.new(secret.encode('utf-8'), payload, hashlib.sha256).hexdigest()
+
+def verify_bitpay_signature(payload: bytes, signature: Optional[str]) -> bool:
+    """Confere X-Signature quando BITPAY_WEBHOOK_SECRET está configurado"""
+    if not BITPAY_WEBHOOK_SECRET:
+        return True
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_bitpay_payload(payload, BITPAY_WEBHOOK_SECRET), signature)
+
+def handle_bitpay_webhook(payload: bytes, signature: Optional[str] = None) -> Dict[str, Any]:
     """
     Processa webhook do BitPay
     
     Args:
         payload: Dados do webhook em bytes
+        signature: Cabeçalho X-Signature (HMAC-SHA256 do corpo)
     
     Returns:
         Dict com resultado do processamento
     """
     try:
+        if not verify_bitpay_signature(payload, signature):
+            return {'success': False, 'error': 'Assinatura webhook inválida'}
+        
         # Decodificar payload
         data = json.loads(payload.decode('utf-8'))
-        
-        # Verificar tipo de evento
         event_type = data.get('type')
-        invoice_data = data.get('data', {})
         
         logger.info(f"BitPay webhook recebido: {event_type}")
         
-        if event_type == 'invoice_confirmed':
-            return _handle_invoice_confirmed(invoice_data)
-        elif event_type == 'invoice_paidInFull':
-            return _handle_invoice_paid(invoice_data)
-        elif event_type == 'invoice_failedToConfirm':
-            return _handle_invoice_failed(invoice_data)
-        else:
-            logger.warning(f"Tipo de evento não reconhecido: {event_type}")
-            return {'success': True, 'message': 'Evento ignorado'}
+        # BitPay não manda id de evento em todo IPN: invoice + tipo identifica o reenvio
+        invoice_id = data.get('data', {}).get('id')
+        event_id = data.get('id') or (f"{invoice_id}:{event_type}" if invoice_id else None)
+        
+        if WEBHOOK_ASYNC:
+            # Só grava e confirma: atualização de status roda nos workers
+            queued = enqueue_webhook('bitpay', payload, event_id, event_type)
+            if queued is None:
+                return {'success': True, 'message': 'Evento duplicado', 'duplicate': True}
+            return {'success': True, 'message': 'Evento enfileirado', 'queued': queued}
+        
+        if not claim_event('bitpay', event_id):
+            return {'success': True, 'message': 'Evento duplicado', 'duplicate': True}
+        
+        result = _dispatch_event(data)
+        if not result['success']:
+            release_event('bitpay', event_id)
+        return result
             
     except json.JSONDecodeError as e:
         logger.error(f"Erro ao decodificar JSON do webhook: {e}")
@@ -46,6 +74,45 @@ def handle_bitpay_webhook(payload: bytes) -> Dict[str, Any]:
         logger.error(f"Erro ao processar webhook BitPay: {e}")
         return {'success': False, 'error': str(e)}
 
+def _dispatch_event(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa o handler do tipo de evento"""
+    event_type = data.get('type')
+    invoice_data = data.get('data', {})
+    
+    if event_type == 'invoice_confirmed':
+        return _handle_invoice_confirmed(invoice_data)
+    elif event_type == 'invoice_paidInFull':
+        return _handle_invoice_paid(invoice_data)
+    elif event_type == 'invoice_failedToConfirm':
+        return _handle_invoice_failed(invoice_data)
+    else:
+        logger.warning(f"Tipo de evento não reconhecido: {event_type}")
+        return {'success': True, 'message': 'Evento ignorado'}
+
+def process_bitpay_event(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Processa evento vindo da fila (exceção = nova tentativa)"""
+    result = _dispatch_event(data)
+    if not result['success']:
+        raise RuntimeError(result.get('error', 'Erro ao processar evento'))
+    return result
+
+register_webhook_handler('bitpay', process_bitpay_event)
+
+def _update_payment_status(invoice_id: str, status: str) -> bool:
+    """Transição de status do pagamento da invoice (UPDATE em lote por invoice id)
+
+    False quando o pagamento já está em estado posterior (evento
+    repetido/fora de ordem), que não deve gerar nova tentativa. Invoice sem
+    pagamento levanta LookupError: com commit em grupo/write-behind o
+    webhook pode chegar antes da linha, e a fila tenta de novo com backoff.
+    """
+    updated = update_invoice_status(invoice_id, status)
+    if updated is None:
+        raise LookupError(f"Invoice {invoice_id}: pagamento ainda não encontrado")
+    if not updated:
+        logger.warning(f"Invoice {invoice_id}: nenhum pagamento em estado anterior a '{status}'")
+    return updated
+
 def _handle_invoice_confirmed(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
     """Processa invoice confirmada"""
     try:
@@ -56,7 +123,7 @@ def _handle_invoice_confirmed(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         logger.info(f"Invoice confirmada: {invoice_id} - {amount} {currency}")
         
         # Atualizar status no banco de dados
-        # TODO: Implementar atualização no banco
+        _update_payment_status(invoice_id, 'completed')
         
         # Enviar notificação
         # TODO: Implementar notificação
@@ -81,8 +148,8 @@ def _handle_invoice_paid(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         
         logger.info(f"Invoice paga: {invoice_id} - {amount} {currency} = {bitcoin_amount} BTC")
         
-        # Atualizar status no banco de dados
-        # TODO: Implementar atualização no banco
+        # Atualizar status no banco de dados (confirmação ainda pendente)
+        _update_payment_status(invoice_id, 'paid')
         
         # Processar conversão para Bitcoin
         # TODO: Implementar conversão
@@ -110,7 +177,7 @@ def _handle_invoice_failed(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         logger.warning(f"Invoice falhada: {invoice_id} - {reason}")
         
         # Atualizar status no banco de dados
-        # TODO: Implementar atualização no banco
+        _update_payment_status(invoice_id, 'failed')
         
         # Enviar notificação de falha
         # TODO: Implementar notificação
@@ -2,7 +2,10 @@ import json
 from flask import request
 from src.api.stripe_handler import verify_webhook
 from src.api.bitpay_handler import process_payment_conversion
-from src.config.settings import DEBUG
+from src.config.settings import DEBUG, WEBHOOK_ASYNC
+from src.models.webhook_queue import enqueue_webhook, register_webhook_handler
+from src.models.idempotency import claim_event, release_event
+from src.utils.money import from_minor
 from src.utils.marketing_bot import send_upsell_email, schedule_follow_ups
 from src.utils.dropship_integration import create_dropship_upsell
 
@@ -14,33 +17,59 @@ def handle_webhook():
     try:
         event = verify_webhook(payload, sig_header)
         
-        if event['type'] == 'payment_intent.succeeded':
-            return _handle_payment_success(event['data']['object'])
-        elif event['type'] == 'invoice.paid':
-            return _handle_subscription_payment(event['data']['object'])
-        elif event['type'] == 'invoice.payment_succeeded':
-            return _handle_subscription_created(event['data']['object'])
-        elif event['type'] == 'invoice.updated':
-            return _handle_subscription_updated(event['data']['object'])
-        elif event['type'] == 'customer.subscription.deleted':
-            return _handle_subscription_cancelled(event['data']['object'])
+        if WEBHOOK_ASYNC:
+            # Só grava e confirma: conversão e marketing rodam nos workers
+            queued = enqueue_webhook('stripe', payload, event['id'], event['type'])
+            return json.dumps({'success': True, 'queued': queued, 'duplicate': queued is None}), 200
         
-        return json.dumps({'success': True, 'message': 'Evento ignorado'}), 200
+        # Reenvio do Stripe: confirma sem converter/pagar de novo
+        if not claim_event('stripe', event['id']):
+            return json.dumps({'success': True, 'duplicate': True}), 200
+        
+        body, status = _dispatch_event(event)
+        if status >= 500:
+            # Falhou: libera o id para o reenvio do Stripe tentar de novo
+            release_event('stripe', event['id'])
+        return body, status
         
     except Exception as e:
         if DEBUG:
             print(f"Erro no webhook: {str(e)}")
         return json.dumps({'error': str(e)}), 400
 
+def _dispatch_event(event):
+    """Executa o handler do tipo de evento (retorna corpo JSON e status HTTP)"""
+    if event['type'] == 'payment_intent.succeeded':
+        return _handle_payment_success(event['data']['object'])
+    elif event['type'] == 'invoice.paid':
+        return _handle_subscription_payment(event['data']['object'])
+    elif event['type'] == 'invoice.payment_succeeded':
+        return _handle_subscription_created(event['data']['object'])
+    elif event['type'] == 'invoice.updated':
+        return _handle_subscription_updated(event['data']['object'])
+    elif event['type'] == 'customer.subscription.deleted':
+        return _handle_subscription_cancelled(event['data']['object'])
+    
+    return json.dumps({'success': True, 'message': 'Evento ignorado'}), 200
+
+def process_stripe_event(event):
+    """Processa evento vindo da fila (exceção = nova tentativa)"""
+    body, status = _dispatch_event(event)
+    if status >= 500:
+        raise RuntimeError(json.loads(body).get('error', 'Erro ao processar evento'))
+    return json.loads(body)
+
+register_webhook_handler('stripe', process_stripe_event)
+
 def _handle_payment_success(payment_intent):
     """Processa pagamento único bem-sucedido"""
     try:
-        amount = payment_intent['amount'] / 100
         currency = payment_intent['currency']
+        amount = from_minor(payment_intent['amount'], currency)
         customer_id = payment_intent.get('customer')
         
-        # Converte para Bitcoin
-        result = process_payment_conversion(amount, currency)
+        # Converte para Bitcoin (crédito no ledger de payouts uma vez por PaymentIntent)
+        result = process_payment_conversion(amount, currency, source_id=payment_intent.get('id'))
         
         if result['success']:
             if DEBUG:
@@ -82,11 +111,11 @@ def _handle_payment_success(payment_intent):
 def _handle_subscription_payment(invoice):
     """Processa pagamento de assinatura"""
     try:
-        amount = invoice['amount_paid'] / 100
         currency = invoice['currency']
+        amount = from_minor(invoice['amount_paid'], currency)
         
         # Converte para Bitcoin
-        result = process_payment_conversion(amount, currency)
+        result = process_payment_conversion(amount, currency, source_id=invoice.get('id'))
         
         if result['success']:
             if DEBUG:
@@ -141,23 +170,51 @@ def handle_stripe_webhook(payload: bytes, sig_header: str) -> dict:
         
         event_type = event['type']
         
-        if event_type == 'payment_intent.succeeded':
-            return _handle_payment_success_v2(event['data']['object'])
-        elif event_type == 'invoice.paid':
-            return _handle_subscription_payment_v2(event['data']['object'])
-        elif event_type == 'customer.subscription.created':
-            return _handle_subscription_created_v2(event['data']['object'])
-        else:
-            return {'success': True, 'message': 'Evento ignorado'}
+        if WEBHOOK_ASYNC:
+            # 'stripe_v2': o worker usa os mesmos handlers do processamento inline abaixo
+            queued = enqueue_webhook('stripe_v2', payload, event['id'], event_type)
+            if queued is None:
+                return {'success': True, 'message': 'Evento duplicado', 'duplicate': True}
+            return {'success': True, 'message': 'Evento enfileirado', 'queued': queued}
+        
+        if not claim_event('stripe_v2', event['id']):
+            return {'success': True, 'message': 'Evento duplicado', 'duplicate': True}
+        
+        result = _dispatch_event_v2(event)
+        if not result['success']:
+            release_event('stripe_v2', event['id'])
+        return result
             
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def _dispatch_event_v2(event: dict) -> dict:
+    """Executa o handler app_v2 do tipo de evento"""
+    event_type = event['type']
+    
+    if event_type == 'payment_intent.succeeded':
+        return _handle_payment_success_v2(event['data']['object'])
+    elif event_type == 'invoice.paid':
+        return _handle_subscription_payment_v2(event['data']['object'])
+    elif event_type == 'customer.subscription.created':
+        return _handle_subscription_created_v2(event['data']['object'])
+    
+    return {'success': True, 'message': 'Evento ignorado'}
+
+def process_stripe_event_v2(event: dict) -> dict:
+    """Processa evento app_v2 vindo da fila (exceção = nova tentativa)"""
+    result = _dispatch_event_v2(event)
+    if not result['success']:
+        raise RuntimeError(result.get('error', 'Erro ao processar evento'))
+    return result
+
+register_webhook_handler('stripe_v2', process_stripe_event_v2)
+
 def _handle_payment_success_v2(payment_intent: dict) -> dict:
     """Processa pagamento bem-sucedido para app_v2"""
     try:
-        amount = payment_intent['amount'] / 100
         currency = payment_intent['currency']
+        amount = from_minor(payment_intent['amount'], currency)
         customer_id = payment_intent.get('customer')
         
         # TODO: Implementar conversão para Bitcoin
@@ -178,8 +235,8 @@ def _handle_payment_success_v2(payment_intent: dict) -> dict:
 def _handle_subscription_payment_v2(invoice: dict) -> dict:
     """Processa pagamento de assinatura para app_v2"""
     try:
-        amount = invoice['amount_paid'] / 100
         currency = invoice['currency']
+        amount = from_minor(invoice['amount_paid'], currency)
         
         # TODO: Implementar processamento de assinatura
         
@@ -73,6 +73,49 @@ def test_conversion_preview():
         print(f"❌ Erro ao testar preview: {e}")
         return False
 
+def test_conversion_preview_batch():
+    """Testa preview de conversão em lote"""
+    print("\n💱 Testando preview de conversão em lote...")
+    try:
+        data = {
+            "amounts": [50.00, 100.00, 250.00],
+            "currencies": ["brl", "brl", "usd"]
+        }
+        response = requests.post(f"{BACKEND_URL}/api/convert/preview_batch", 
+                               json=data, timeout=10)
+        if response.status_code == 200:
+            result = response.json()
+            print(f"✅ Preview em lote:")
+            print(f"   Valores: {result['preview']['count']}")
+            for currency, totals in result['preview']['totals'].items():
+                print(f"   {currency}: {totals['btc_amount']:.8f} BTC")
+            return True
+        else:
+            print(f"❌ Erro no preview em lote: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Erro ao testar preview em lote: {e}")
+        return False
+
+def test_bitcoin_history():
+    """Testa histórico de preço Bitcoin"""
+    print("\n📈 Testando histórico de preço...")
+    try:
+        response = requests.get(f"{BACKEND_URL}/api/bitcoin/history",
+                                params={"currency": "brl", "minutes": 60, "points": 20}, timeout=10)
+        if response.status_code == 200:
+            result = response.json()
+            print(f"✅ Histórico: {len(result['series'])} pontos")
+            if result['change']:
+                print(f"   Variação 60min: {result['change']['percentage']:.2f}%")
+            return True
+        else:
+            print(f"❌ Erro no histórico: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Erro ao testar histórico: {e}")
+        return False
+
 def test_payment_creation():
     """Testa criação de pagamento"""
     print("\n💳 Testando criação de pagamento...")
@@ -262,6 +305,253 @@ def test_notifications():
         print(f"❌ Erro ao testar notificações: {e}")
         return False
 
+# Roda em outro processo: settings e bitpay_handler leem BITPAY_API_URL na importação
+PAYOUT_TIMEOUT_SCENARIO = """
+import json, sys, tempfile
+from sqlalchemy import create_engine, select
+from src.models import payouts
+from src.models.database import db, PayoutBatch, PayoutEntry
+
+with tempfile.TemporaryDirectory() as tmp:
+    engine = create_engine(f"sqlite:///{tmp}/payouts.db")
+    db.metadata.create_all(engine, tables=[PayoutBatch.__table__, PayoutEntry.__table__])
+    aggregator = payouts.PayoutAggregator(threshold_sats=1000, interval=3600, lease_seconds=0)
+    aggregator.engine = engine
+
+    aggregator.credit('stripe', 'pi_timeout_1', 600)
+    aggregator.credit('stripe', 'pi_timeout_2', 600)
+    states = [aggregator.run_once()]
+    with engine.connect() as connection:
+        states.append(connection.execute(select(PayoutBatch.__table__.c.status)).scalar())
+
+    # Reenvio do operador: a reference é encontrada e o POST não se repete
+    aggregator.requeue_failed(include_unknown=True)
+    aggregator.run_once()
+    aggregator.run_once()
+
+    with engine.connect() as connection:
+        batch = connection.execute(select(PayoutBatch.__table__)).one()
+        entries = connection.execute(select(PayoutEntry.__table__.c.status, PayoutEntry.__table__.c.batch_id)).all()
+    engine.dispose()
+
+json.dump({
+    'first_run': states, 'status': batch.status, 'payout_id': batch.payout_id, 'batch_id': batch.id,
+    'total_sats': batch.total_sats, 'entries': [list(entry) for entry in entries]
+}, sys.stdout)
+"""
+
+def test_payout_timeout_single_payout():
+    """Testa payout aceito pela BitPay sem resposta ao cliente (não pode pagar duas vezes)"""
+    print("\n💸 Testando payout com resposta perdida após o aceite...")
+    import os
+    import subprocess
+    import sys
+    from benchmarks.provider_standins import LocalProviderServer
+
+    # Stand-in grava o primeiro payout e fecha a conexão sem responder
+    server = LocalProviderServer(drop_payout_responses=1).start()
+    try:
+        env = {
+            **os.environ,
+            'BITPAY_API_URL': server.url,
+            'BITPAY_PRIVATE_KEY_HEX': '1' * 64,
+            'BITPAY_API_TOKEN': 'token_teste',
+            'BITCOIN_WALLET_ADDRESS': 'bc1qteste'
+        }
+        result = subprocess.run(
+            [sys.executable, '-c', PAYOUT_TIMEOUT_SCENARIO], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=60
+        )
+        assert result.returncode == 0, result.stderr
+        state = json.loads(result.stdout.strip().splitlines()[-1])
+        stats = server.get_stats()
+    finally:
+        server.stop()
+
+    assert state['first_run'] == [0, 'unknown']  # resposta perdida: resultado ambíguo
+    assert stats.get('POST /payouts') == 1 and stats.get('GET /payouts', 0) >= 1  # reenvio consultou a reference
+    assert len(server.payouts) == 1
+    assert server.payouts[0]['reference'] and server.payouts[0]['amount'] == 1200 / 100_000_000
+    assert state['status'] == 'sent' and state['payout_id'] == server.payouts[0]['id']
+    assert state['total_sats'] == 1200
+    assert state['entries'] == [['paid', state['batch_id']], ['paid', state['batch_id']]]
+    print(f"✅ Um único payout ({state['payout_id']}) após resposta perdida e reconciliação")
+    return True
+
+def test_group_commit_fallback_customer_fk():
+    """Testa lote do commit em grupo que falha: regravação linha a linha mantém a FK do cliente"""
+    print("\n👥 Testando FK de cliente após lote com falha...")
+    import tempfile
+    from concurrent.futures import Future
+    from sqlalchemy import create_engine, select
+    from src.models.database import db, Payment, Customer
+    from src.models.write_behind import GroupCommitter
+
+    def payment(payment_id, email):
+        return Payment(
+            stripe_payment_id=payment_id, customer_email=email, customer_name='Cliente Teste',
+            amount=10, currency='brl', status='completed', payment_type='unique'
+        ), Future()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/group_commit.db")
+        db.metadata.create_all(engine)
+        committer = GroupCommitter()
+        committer.engine = engine
+
+        committer._commit([payment('pi_fk_1', 'primeiro@exemplo.com')])
+        # Id Stripe repetido derruba o lote; o cliente novo do lote some no rollback
+        duplicate = payment('pi_fk_1', 'outro@exemplo.com')
+        committer._commit([payment('pi_fk_2', 'novo@exemplo.com'), duplicate])
+
+        customers, payments = Customer.__table__, Payment.__table__
+        with engine.connect() as connection:
+            rows = connection.execute(
+                select(payments.c.stripe_payment_id, customers.c.email)
+                .select_from(payments.outerjoin(customers, payments.c.customer_ref_id == customers.c.id))
+            ).all()
+        engine.dispose()
+
+    assert committer.stats['batch_fallbacks'] == 1
+    assert duplicate[1].exception() is not None
+    assert dict(rows) == {'pi_fk_1': 'primeiro@exemplo.com', 'pi_fk_2': 'novo@exemplo.com'}
+    print(f"✅ {len(rows)} pagamentos com cliente válido após o fallback")
+    return True
+
+def test_stats_rollups_match_tables():
+    """Testa rollups incrementais contra a agregação direta após insert, update e delete"""
+    print("\n📊 Testando rollups de estatísticas...")
+    import tempfile
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from src.models.database import db, Payment, Subscription, StatsRollup, compute_stats_rollups
+
+    def check(engine, step):
+        with engine.connect() as connection:
+            stored = dict(connection.execute(select(StatsRollup.name, StatsRollup.value)).all())
+            expected = compute_stats_rollups(connection)
+        nonzero = lambda totals: {name: value for name, value in totals.items() if value}
+        assert nonzero(stored) == nonzero(expected), f"{step}: {stored} != {expected}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/rollups.db")
+        db.metadata.create_all(engine)
+
+        with Session(engine) as session:
+            for index, (currency, amount, status) in enumerate([
+                ('brl', 100.5, 'completed'), ('jpy', 500, 'completed'), ('usd', 3.25, 'pending'), ('krw', 12000, 'completed')
+            ]):
+                session.add(Payment(
+                    stripe_payment_id=f"pi_rollup_{index}", customer_email='rollup@exemplo.com', customer_name='Rollup',
+                    amount=amount, currency=currency, status=status, payment_type='unique', btc_amount=0.001
+                ))
+            session.add(Subscription(
+                id='sub_rollup', customer_id='cus_rollup', customer_email='rollup@exemplo.com', customer_name='Rollup',
+                amount=29.9, currency='brl', status='active'
+            ))
+            session.commit()
+            check(engine, 'insert')
+
+            session.query(Payment).filter_by(stripe_payment_id='pi_rollup_2').one().status = 'completed'
+            session.query(Payment).filter_by(stripe_payment_id='pi_rollup_0').one().amount = 80
+            session.get(Subscription, 'sub_rollup').status = 'cancelled'
+            session.commit()
+            check(engine, 'update')
+
+            session.delete(session.query(Payment).filter_by(stripe_payment_id='pi_rollup_1').one())
+            session.commit()
+            check(engine, 'delete')
+        engine.dispose()
+
+    print("✅ Rollups iguais à agregação das tabelas após insert, update e delete")
+    return True
+
+def test_bitpay_unknown_invoice_retries():
+    """Testa webhook BitPay antes da linha do pagamento: nova tentativa, não ack de duplicado"""
+    print("\n🔁 Testando webhook BitPay para invoice ainda sem pagamento...")
+    import tempfile
+    from sqlalchemy import create_engine
+    from src.models.database import db, Payment
+    from src.models.write_behind import invoice_status
+    from src.webhooks.bitpay_webhook import process_bitpay_event
+
+    def event(invoice_id):
+        return {'type': 'invoice_confirmed', 'data': {'id': invoice_id, 'price': 10, 'currency': 'BRL'}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/invoice_status.db")
+        db.metadata.create_all(engine)
+        previous_engine, invoice_status.engine = invoice_status.engine, engine
+        try:
+            try:
+                process_bitpay_event(event('inv_ainda_nao_gravada'))
+                retried = False
+            except RuntimeError:
+                retried = True
+
+            with engine.begin() as connection:
+                connection.execute(Payment.__table__.insert().values(
+                    stripe_payment_id='bitpay_inv_1', bitpay_invoice_id='inv_1', customer_email='cliente@exemplo.com',
+                    customer_name='Cliente Teste', amount=10, currency='brl', status='pending', payment_type='bitpay'
+                ))
+            first = process_bitpay_event(event('inv_1'))
+            # Reenvio com o pagamento já concluído: confirma sem nova tentativa
+            repeated = process_bitpay_event(event('inv_1'))
+        finally:
+            invoice_status.engine = previous_engine
+            engine.dispose()
+
+    assert retried
+    assert first['success'] and repeated['success']
+    assert invoice_status.stats['unknown_invoices'] >= 1 and invoice_status.stats['unmatched'] >= 1
+    print("✅ Invoice desconhecida volta para a fila; reenvio de invoice concluída é confirmado")
+    return True
+
+def test_zero_decimal_currencies():
+    """Testa ida e volta de valores em moedas sem casas decimais (KRW)"""
+    print("\n💱 Testando moedas zero-decimal...")
+    from src.utils.money import Money, to_minor, from_minor, minor_digits, ZERO_DECIMAL_CURRENCIES
+
+    assert all(minor_digits(currency) == 0 for currency in ZERO_DECIMAL_CURRENCIES)
+    assert to_minor(12000, 'krw') == 12000
+    assert from_minor(to_minor(12000, 'KRW'), 'KRW') == 12000
+    assert to_minor(19.99, 'BRL') == 1999
+    fee, net = Money.from_decimal(12000, 'KRW').apply_fee(250)
+    assert (fee.minor, net.minor) == (300, 11700)
+    assert net.to_float() == 11700
+    print("✅ KRW 12000 -> 12000 (menor unidade) -> 12000")
+    return True
+
+def test_archiver_invalidates_stats_cache():
+    """Testa arquivamento (SQL direto, sem sessão do ORM) descartando o cache de estatísticas"""
+    print("\n🗄️ Testando invalidação do cache pelo arquivador...")
+    import tempfile
+    from datetime import timedelta
+    from sqlalchemy import create_engine
+    from src.models import database
+    from src.models.archiver import archive_settled_payments
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/archive.db")
+        database.db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(database.Payment.__table__.insert().values(
+                stripe_payment_id='pi_antigo', customer_email='cliente@exemplo.com', customer_name='Cliente Teste',
+                amount=10, currency='brl', status='completed', payment_type='unique',
+                created_at=datetime.utcnow() - timedelta(days=400)
+            ))
+
+        with database._stats_cache_lock:
+            database._stats_cache['data'] = {'payments': {}}
+            database._stats_cache['expires_at'] = time.time() + 60
+        moved = archive_settled_payments(engine, older_than_days=90)
+        engine.dispose()
+
+    assert moved == 1
+    assert database._stats_cache['data'] is None
+    print("✅ Cache de estatísticas descartado após arquivar")
+    return True
+
 def main():
     """Executa todos os testes"""
     print("🚀 INICIANDO TESTES DO SISTEMA BITCOIN PAYMENT v2.0")
@@ -271,13 +561,21 @@ def main():
         ("Health Check", test_backend_health),
         ("Preço Bitcoin", test_bitcoin_price),
         ("Preview Conversão", test_conversion_preview),
+        ("Preview em Lote", test_conversion_preview_batch),
+        ("Histórico de Preço", test_bitcoin_history),
         ("Pagamento Stripe", test_payment_creation),
         ("Pagamento Crypto", test_crypto_payment),
         ("Pagamento BitPay", test_bitpay_payment),
         ("Analytics", test_analytics),
         ("2FA", test_2fa),
         ("A/B Testing", test_ab_testing),
-        ("Notificações", test_notifications)
+        ("Notificações", test_notifications),
+        ("Payout com Timeout", test_payout_timeout_single_payout),
+        ("FK Cliente no Fallback", test_group_commit_fallback_customer_fk),
+        ("Rollups de Estatísticas", test_stats_rollups_match_tables),
+        ("Invoice BitPay sem Pagamento", test_bitpay_unknown_invoice_retries),
+        ("Moedas Zero-Decimal", test_zero_decimal_currencies),
+        ("Cache após Arquivamento", test_archiver_invalidates_stats_cache)
     ]
     
     results = []